@@ -4,23 +4,35 @@ Handles cryptocurrency payment processing for SRPK Pro licenses
 Supports BNB, USDT, and ETH on Binance Smart Chain
 """
 import os
-import json
+import orjson
 import logging
+import base64
 import hashlib
+import hmac
 import time
+import threading
+import queue
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
+from functools import lru_cache
 from decimal import Decimal
-from flask import Flask, request, jsonify
+from flask import Flask, request, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from hexbytes import HexBytes
 from eth_account import Account
-import jwt
 from dotenv import load_dotenv
 import redis
+from cachetools import TTLCache
+import msgspec
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
@@ -38,24 +50,184 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app, origins=os.getenv('ALLOWED_ORIGINS', '*').split(','))
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and jsonify"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=str), mimetype=self.mimetype)
+
+app.json = ORJSONProvider(app)
+
+def ojsonify(obj, status=200):
+    """Serialize a JSON response with orjson instead of stdlib json"""
+    return Response(orjson.dumps(obj, default=str), status=status, mimetype='application/json')
+
+# Shared keep-alive HTTP session for RPC and price feed calls, so TLS
+# handshakes are paid once per pooled connection instead of per request
+http_session = requests.Session()
+http_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=128,
+    max_retries=Retry(total=3, backoff_factor=0.1)
+)
+http_session.mount('https://', http_adapter)
+http_session.mount('http://', http_adapter)
+
 # Web3 Configuration
 BSC_RPC_URL = os.getenv('BSC_RPC_URL', 'https://bsc-dataseed.binance.org/')
-w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL))
+w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL, session=http_session))
+
+# Additional RPC endpoints (comma separated) used to route receipt lookups
+BSC_RPC_URLS = [
+    url.strip() for url in os.getenv('BSC_RPC_URLS', BSC_RPC_URL).split(',') if url.strip()
+] or [BSC_RPC_URL]
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '2'))
+
+# Hedge receipt lookups by querying the two fastest endpoints at once
+HEDGED_RPC = os.getenv('HEDGED_RPC', 'false').lower() in ('1', 'true', 'yes')
+HEDGED_RPC_TIMEOUT = float(os.getenv('HEDGED_RPC_TIMEOUT', '5'))
+
+class RPCPool:
+    """Pool of RPC endpoints routed by EWMA latency with automatic failover"""
+
+    def __init__(self, urls, session, timeout=2.0, alpha=0.3, max_errors=3, cooldown=30):
+        self.urls = list(urls)
+        self.clients = [
+            Web3(Web3.HTTPProvider(url, session=session, request_kwargs={'timeout': timeout}))
+            for url in self.urls
+        ]
+        self.alpha = alpha
+        self.max_errors = max_errors
+        self.cooldown = cooldown
+        self.latency = [0.0] * len(self.clients)
+        self.errors = [0] * len(self.clients)
+        self.failed_at = [0.0] * len(self.clients)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='rpc-hedge')
+
+    def ranked(self):
+        """Return endpoint indexes, healthy ones first, ordered by EWMA latency"""
+        now = time.monotonic()
+        with self.lock:
+            healthy = [
+                i for i in range(len(self.clients))
+                if self.errors[i] < self.max_errors or now - self.failed_at[i] > self.cooldown
+            ]
+            unhealthy = [i for i in range(len(self.clients)) if i not in healthy]
+            healthy.sort(key=lambda i: self.latency[i])
+        return healthy + unhealthy
+
+    def _record_success(self, idx, elapsed):
+        with self.lock:
+            if self.latency[idx]:
+                self.latency[idx] = self.alpha * elapsed + (1 - self.alpha) * self.latency[idx]
+            else:
+                self.latency[idx] = elapsed
+            self.errors[idx] = 0
+
+    def _record_error(self, idx):
+        with self.lock:
+            self.errors[idx] += 1
+            self.failed_at[idx] = time.monotonic()
+
+    def call(self, fn):
+        """Run fn(client) on the fastest healthy endpoint, failing over on errors"""
+        last_error = None
+        for idx in self.ranked():
+            start = time.monotonic()
+            try:
+                result = fn(self.clients[idx])
+            except TransactionNotFound as e:
+                # The node answered; it may just be lagging behind the others
+                self._record_success(idx, time.monotonic() - start)
+                last_error = e
+                continue
+            except Exception as e:
+                logger.warning(f"RPC endpoint {self.urls[idx]} failed: {str(e)}")
+                self._record_error(idx)
+                last_error = e
+                continue
+            self._record_success(idx, time.monotonic() - start)
+            return result
+        raise last_error
+
+    def _timed_call(self, idx, fn):
+        start = time.monotonic()
+        try:
+            result = fn(self.clients[idx])
+        except TransactionNotFound:
+            self._record_success(idx, time.monotonic() - start)
+            raise
+        except Exception:
+            self._record_error(idx)
+            raise
+        self._record_success(idx, time.monotonic() - start)
+        return result
+
+    def hedged_call(self, fn, n=2, timeout=5.0):
+        """Run fn(client) on the n fastest endpoints in parallel, keep the first answer"""
+        pending = {self.executor.submit(self._timed_call, idx, fn) for idx in self.ranked()[:n]}
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+        for loser in pending:
+            loser.cancel()
+        # Every hedged endpoint failed or timed out: fall back to sequential failover
+        return self.call(fn)
+
+    def get_receipt(self, tx_hash):
+        """Fetch a transaction receipt from the fastest healthy endpoint"""
+        fetch = lambda client: client.eth.get_transaction_receipt(tx_hash)
+        if HEDGED_RPC and len(self.clients) > 1:
+            return self.hedged_call(fetch, n=2, timeout=HEDGED_RPC_TIMEOUT)
+        return self.call(fetch)
+
+    def get_transaction(self, tx_hash):
+        """Fetch a transaction from the fastest healthy endpoint"""
+        return self.call(lambda client: client.eth.get_transaction(tx_hash))
+
+rpc_pool = RPCPool(BSC_RPC_URLS, http_session, timeout=RPC_TIMEOUT)
 
 # Contract Configuration
 CONTRACT_ADDRESS = os.getenv('CONTRACT_ADDRESS', '')
-CONTRACT_ABI = json.loads(os.getenv('CONTRACT_ABI', '[]'))
+CONTRACT_ABI = orjson.loads(os.getenv('CONTRACT_ABI', '[]'))
 
 # Token addresses on BSC
 USDT_ADDRESS = '0x55d398326f99059fF775485246999027B3197955'
 ETH_ADDRESS = '0x2170Ed0880ac9A755fd29B2688956BD959F933F8'
 
+# topic0 of Transfer(address,address,uint256), hashed once at import
+TRANSFER_TOPIC0 = Web3.keccak(text="Transfer(address,address,uint256)")
+
+# Raw 20-byte addresses, compared directly instead of lowercasing hex strings
+TOKEN_ADDRESS_BYTES = {
+    USDT_ADDRESS: HexBytes(USDT_ADDRESS),
+    ETH_ADDRESS: HexBytes(ETH_ADDRESS)
+}
+
 # ERC20 ABI for token interactions
-ERC20_ABI = json.loads('[{"constant":true,"inputs":[],"name":"decimals","outputs":[{"name":"","type":"uint8"}],"type":"function"},{"constant":false,"inputs":[{"name":"_to","type":"address"},{"name":"_value","type":"uint256"}],"name":"transfer","outputs":[{"name":"","type":"bool"}],"type":"function"},{"constant":true,"inputs":[{"name":"_owner","type":"address"}],"name":"balanceOf","outputs":[{"name":"","type":"uint256"}],"type":"function"}]')
+ERC20_ABI = orjson.loads('[{"constant":true,"inputs":[],"name":"decimals","outputs":[{"name":"","type":"uint8"}],"type":"function"},{"constant":false,"inputs":[{"name":"_to","type":"address"},{"name":"_value","type":"uint256"}],"name":"transfer","outputs":[{"name":"","type":"bool"}],"type":"function"},{"constant":true,"inputs":[{"name":"_owner","type":"address"}],"name":"balanceOf","outputs":[{"name":"","type":"uint256"}],"type":"function"}]')
 
 # JWT Secret for license tokens
 JWT_SECRET = os.getenv('JWT_SECRET', 'change-me-in-production')
 
+# HS256 signing state built once: fixed header segment and keyed HMAC to copy per token
+JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=')
+jwt_hmac = hmac.new(JWT_SECRET.encode(), digestmod=hashlib.sha256)
+
 # Email Configuration
 SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
 SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
@@ -89,6 +261,7 @@ PRICES = {
 
 # Payment wallet
 PAYMENT_WALLET = '0x680c48F49187a2121a25e3F834585a8b82DfdC16'
+PAYMENT_WALLET_BYTES = HexBytes(PAYMENT_WALLET)
 
 # Price feed APIs
 PRICE_APIS = {
@@ -125,7 +298,7 @@ def get_token_price(token_symbol):
         }
         
         if token_symbol in token_ids:
-            response = requests.get(
+            response = http_session.get(
                 PRICE_APIS['coingecko'],
                 params={
                     'ids': token_ids[token_symbol],
@@ -153,7 +326,7 @@ def get_token_price(token_symbol):
             if token_symbol == 'USDT':
                 price = 1.0
             elif token_symbol in symbol_map:
-                response = requests.get(
+                response = http_session.get(
                     f"{PRICE_APIS['binance']}",
                     params={'symbol': symbol_map[token_symbol]},
                     timeout=5
@@ -180,109 +353,133 @@ def get_token_price(token_symbol):
     
     return default_prices.get(token_symbol, 0)
 
+def build_license_email(email, name, license_key, product_name, tx_hash):
+    """Build the license email message"""
+    # Create message
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f'Tu Licencia {product_name} - SRPK Pro'
+    msg['From'] = EMAIL_FROM
+    msg['To'] = email
+    
+    # Create the HTML body
+    html = f"""
+    <html>
+      <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+          <div style="background: linear-gradient(135deg, #4e72ff 0%, #667eea 100%); color: white; padding: 30px; border-radius: 10px 10px 0 0;">
+            <h1 style="margin: 0; font-size: 28px;">¡Bienvenido a SRPK Pro!</h1>
+          </div>
+          
+          <div style="background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px;">
+            <p style="font-size: 16px;">Hola <strong>{name}</strong>,</p>
+            
+            <p>Gracias por tu compra de <strong>{product_name}</strong>. Tu pago ha sido verificado exitosamente en la blockchain.</p>
+            
+            <div style="background: white; border: 2px solid #4e72ff; border-radius: 8px; padding: 20px; margin: 20px 0;">
+              <h3 style="color: #4e72ff; margin-top: 0;">Tu Licencia:</h3>
+              <p style="font-family: monospace; font-size: 18px; color: #333; word-break: break-all; background: #f0f0f0; padding: 10px; border-radius: 4px;">
+                {license_key}
+              </p>
+            </div>
+            
+            <div style="background: #e8f4f8; border-left: 4px solid #4e72ff; padding: 15px; margin: 20px 0;">
+              <h4 style="margin-top: 0; color: #4e72ff;">Detalles de la Transacción:</h4>
+              <p style="margin: 5px 0;"><strong>Hash:</strong> <a href="https://bscscan.com/tx/{tx_hash}" style="color: #4e72ff; text-decoration: none;">{tx_hash[:16]}...</a></p>
+              <p style="margin: 5px 0;"><strong>Producto:</strong> {product_name}</p>
+              <p style="margin: 5px 0;"><strong>Duración:</strong> 30 días</p>
+              <p style="margin: 5px 0;"><strong>Válido hasta:</strong> {(datetime.utcnow() + timedelta(days=30)).strftime('%d/%m/%Y')}</p>
+            </div>
+            
+            <h3 style="color: #333; margin-top: 30px;">Próximos Pasos:</h3>
+            <ol style="color: #666;">
+              <li>Descarga SRPK Pro desde <a href="https://github.com/srpkio/srpk-pro" style="color: #4e72ff;">nuestro repositorio</a></li>
+              <li>Instala las dependencias con <code style="background: #f0f0f0; padding: 2px 6px; border-radius: 3px;">pip install -r requirements.txt</code></li>
+              <li>Activa tu licencia con el comando: <code style="background: #f0f0f0; padding: 2px 6px; border-radius: 3px;">srpk activate {license_key}</code></li>
+            </ol>
+            
+            <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; text-align: center; color: #666;">
+              <p>¿Necesitas ayuda? Contáctanos en <a href="mailto:support@srpk.io" style="color: #4e72ff;">support@srpk.io</a></p>
+              <p style="font-size: 12px; margin-top: 10px;">
+                Este email fue enviado porque realizaste una compra en SRPK Pro.<br>
+                Transacción verificada en Binance Smart Chain.
+              </p>
+            </div>
+          </div>
+        </div>
+      </body>
+    </html>
+    """
+    
+    # Attach HTML
+    part = MIMEText(html, 'html')
+    msg.attach(part)
+    return msg
+
 def send_license_email_real(email, name, license_key, product_name, tx_hash):
-    """Send license key via email using SMTP"""
+    """Queue the license email for the background SMTP sender"""
+    if not (SMTP_USER and SMTP_PASS):
+        logger.warning("SMTP credentials not configured, email not sent")
+        return False
+    
     try:
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f'Tu Licencia {product_name} - SRPK Pro'
-        msg['From'] = EMAIL_FROM
-        msg['To'] = email
-        
-        # Create the HTML body
-        html = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <div style="background: linear-gradient(135deg, #4e72ff 0%, #667eea 100%); color: white; padding: 30px; border-radius: 10px 10px 0 0;">
-                <h1 style="margin: 0; font-size: 28px;">¡Bienvenido a SRPK Pro!</h1>
-              </div>
-              
-              <div style="background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px;">
-                <p style="font-size: 16px;">Hola <strong>{name}</strong>,</p>
-                
-                <p>Gracias por tu compra de <strong>{product_name}</strong>. Tu pago ha sido verificado exitosamente en la blockchain.</p>
-                
-                <div style="background: white; border: 2px solid #4e72ff; border-radius: 8px; padding: 20px; margin: 20px 0;">
-                  <h3 style="color: #4e72ff; margin-top: 0;">Tu Licencia:</h3>
-                  <p style="font-family: monospace; font-size: 18px; color: #333; word-break: break-all; background: #f0f0f0; padding: 10px; border-radius: 4px;">
-                    {license_key}
-                  </p>
-                </div>
-                
-                <div style="background: #e8f4f8; border-left: 4px solid #4e72ff; padding: 15px; margin: 20px 0;">
-                  <h4 style="margin-top: 0; color: #4e72ff;">Detalles de la Transacción:</h4>
-                  <p style="margin: 5px 0;"><strong>Hash:</strong> <a href="https://bscscan.com/tx/{tx_hash}" style="color: #4e72ff; text-decoration: none;">{tx_hash[:16]}...</a></p>
-                  <p style="margin: 5px 0;"><strong>Producto:</strong> {product_name}</p>
-                  <p style="margin: 5px 0;"><strong>Duración:</strong> 30 días</p>
-                  <p style="margin: 5px 0;"><strong>Válido hasta:</strong> {(datetime.utcnow() + timedelta(days=30)).strftime('%d/%m/%Y')}</p>
-                </div>
-                
-                <h3 style="color: #333; margin-top: 30px;">Próximos Pasos:</h3>
-                <ol style="color: #666;">
-                  <li>Descarga SRPK Pro desde <a href="https://github.com/srpkio/srpk-pro" style="color: #4e72ff;">nuestro repositorio</a></li>
-                  <li>Instala las dependencias con <code style="background: #f0f0f0; padding: 2px 6px; border-radius: 3px;">pip install -r requirements.txt</code></li>
-                  <li>Activa tu licencia con el comando: <code style="background: #f0f0f0; padding: 2px 6px; border-radius: 3px;">srpk activate {license_key}</code></li>
-                </ol>
-                
-                <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; text-align: center; color: #666;">
-                  <p>¿Necesitas ayuda? Contáctanos en <a href="mailto:support@srpk.io" style="color: #4e72ff;">support@srpk.io</a></p>
-                  <p style="font-size: 12px; margin-top: 10px;">
-                    Este email fue enviado porque realizaste una compra en SRPK Pro.<br>
-                    Transacción verificada en Binance Smart Chain.
-                  </p>
-                </div>
-              </div>
-            </div>
-          </body>
-        </html>
-        """
-        
-        # Attach HTML
-        part = MIMEText(html, 'html')
-        msg.attach(part)
+        email_queue.put(build_license_email(email, name, license_key, product_name, tx_hash))
+        return True
+    except Exception as e:
+        logger.error(f"Error building email: {str(e)}")
+        return False
+
+def email_sender_loop():
+    """Drain queued license emails, sending each burst over one SMTP session"""
+    while True:
+        batch = [email_queue.get()]
+        while True:
+            try:
+                batch.append(email_queue.get_nowait())
+            except queue.Empty:
+                break
         
-        # Send email
-        if SMTP_USER and SMTP_PASS:
+        try:
             with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
                 server.starttls()
                 server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-            
-            logger.info(f"License email sent to {email}")
-            return True
-        else:
-            logger.warning("SMTP credentials not configured, email not sent")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Error sending email: {str(e)}")
-        return False
+                for msg in batch:
+                    try:
+                        server.send_message(msg)
+                        logger.info(f"License email sent to {msg['To']}")
+                    except smtplib.SMTPException as e:
+                        logger.error(f"Error sending email to {msg['To']}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error sending {len(batch)} license emails: {str(e)}")
+
+# License emails leave the verify request path; one background sender reuses
+# a single SMTP login for every message that queued up meanwhile
+email_queue = queue.Queue()
+threading.Thread(target=email_sender_loop, name='license-email', daemon=True).start()
 
 def verify_token_transfer(tx_hash, token_address, expected_amount):
     """Verify ERC20 token transfer in transaction"""
     try:
         # Get transaction receipt
-        receipt = w3.eth.get_transaction_receipt(tx_hash)
+        receipt = rpc_pool.get_receipt(tx_hash)
         
         if not receipt or receipt['status'] != 1:
             return False
         
-        # Check logs for Transfer event
-        # Transfer event signature: Transfer(address,address,uint256)
-        transfer_event_signature = w3.keccak(text="Transfer(address,address,uint256)").hex()
+        # Check logs for Transfer event, matching raw topic0 and emitter bytes
+        token_address_bytes = TOKEN_ADDRESS_BYTES.get(token_address) or HexBytes(token_address)
         
         for log in receipt['logs']:
-            if (log['address'].lower() == token_address.lower() and 
-                len(log['topics']) > 0 and 
-                log['topics'][0].hex() == transfer_event_signature):
+            topics = log['topics']
+            if (len(topics) > 2 and 
+                topics[0] == TRANSFER_TOPIC0 and 
+                HexBytes(log['address']) == token_address_bytes):
                 
                 # Decode transfer data
                 # topics[1] = from address (padded)
                 # topics[2] = to address (padded)
                 # data = amount
                 
-                to_address = '0x' + log['topics'][2].hex()[-40:]
+                to_address = HexBytes(log['topics'][2])[-20:]
                 amount = int(log['data'], 16)
                 
                 # Get token decimals
@@ -293,7 +490,7 @@ def verify_token_transfer(tx_hash, token_address, expected_amount):
                 decimals = token_contract.functions.decimals().call()
                 
                 # Check if transfer is to our payment wallet
-                if (to_address.lower() == PAYMENT_WALLET.lower() and 
+                if (to_address == PAYMENT_WALLET_BYTES and 
                     amount >= expected_amount * (10 ** decimals)):
                     return True
         
@@ -303,12 +500,17 @@ def verify_token_transfer(tx_hash, token_address, expected_amount):
         logger.error(f"Error verifying token transfer: {str(e)}")
         return False
 
+@lru_cache(maxsize=1)
+def _iso_timestamp(second: int) -> str:
+    """ISO timestamp for a whole second, reused across health checks"""
+    return datetime.utcfromtimestamp(second).isoformat()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     health_status = {
         'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat(),
+        'timestamp': _iso_timestamp(int(time.time())),
         'web3_connected': w3.is_connected(),
         'chain_id': w3.eth.chain_id if w3.is_connected() else None,
         'redis_connected': redis_client.ping(),
@@ -321,7 +523,7 @@ def health_check():
         health_status['database_connected'] = True
         conn.close()
     
-    return jsonify(health_status)
+    return ojsonify(health_status)
 
 @app.route('/api/crypto/payment-info', methods=['GET'])
 def get_payment_info():
@@ -332,7 +534,7 @@ def get_payment_info():
         'ETH': get_token_price('ETH')
     }
     
-    return jsonify({
+    return ojsonify({
         'success': True,
         'payment_wallet': PAYMENT_WALLET,
         'supported_tokens': {
@@ -377,7 +579,7 @@ def calculate_crypto_amount():
         token = data.get('token')
         
         if product_type not in PRICES:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Invalid product type'
             }), 400
@@ -386,7 +588,7 @@ def calculate_crypto_amount():
         token_price = get_token_price(token)
         
         if not token_price:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Unable to fetch token price'
             }), 500
@@ -399,7 +601,7 @@ def calculate_crypto_amount():
             # Calculate based on current price
             crypto_amount = usd_price / token_price
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'amount': f"{crypto_amount:.6f}",
             'amount_wei': str(int(crypto_amount * 10**18)),  # For smart contract
@@ -412,144 +614,244 @@ def calculate_crypto_amount():
             
     except Exception as e:
         logger.error(f"Error calculating amount: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'Error calculating amount'
         }), 500
 
+# Successful verify responses, kept locally and in Redis so replicas share them
+VERIFY_CACHE_TTL = 86400
+_verify_cache = TTLCache(maxsize=100000, ttl=VERIFY_CACHE_TTL)
+_verify_cache_lock = threading.Lock()
+
+def get_cached_verification(tx_hash, email):
+    """Return the stored verify response for this transaction and buyer, if any"""
+    key = tx_hash.lower()
+    with _verify_cache_lock:
+        entry = _verify_cache.get(key)
+    
+    if entry is None:
+        try:
+            raw = redis_client.get(f"verify:{key}")
+        except Exception as e:
+            logger.warning(f"Could not read verify cache: {str(e)}")
+            raw = None
+        if not raw:
+            return None
+        entry = orjson.loads(raw)
+        with _verify_cache_lock:
+            _verify_cache[key] = entry
+    
+    # Only replay the license to the buyer it was issued to
+    if entry['email'] != email:
+        return None
+    return entry['response']
+
+def cache_verification(tx_hash, email, response):
+    """Store a successful verify response so duplicates skip RPC and license issuance"""
+    key = tx_hash.lower()
+    entry = {'email': email, 'response': response}
+    with _verify_cache_lock:
+        _verify_cache[key] = entry
+    try:
+        redis_client.setex(f"verify:{key}", VERIFY_CACHE_TTL, orjson.dumps(entry))
+    except Exception as e:
+        logger.warning(f"Could not write verify cache: {str(e)}")
+
+# In-flight verifies keyed by request; duplicates wait on the first one's Future
+_inflight_verifies = {}
+_inflight_lock = threading.Lock()
+
+def inflight_verify_key(tx_hash, email, product_type, token):
+    """Coalescing key for a verify request; only identical requests may share a response"""
+    return (tx_hash.lower(), email, product_type, token)
+
+def _verify_transaction(tx_hash, product_type, email, name, token, cache_key):
+    """Verify a payment transaction on-chain and issue its license, returning (body, status)"""
+    try:
+        # Probe the transaction first; pending ones have no block yet, so
+        # skip the costlier receipt lookup until the tx is mined
+        try:
+            tx = rpc_pool.get_transaction(tx_hash)
+        except TransactionNotFound:
+            tx = None
+        
+        if not tx or tx.get('blockHash') is None:
+            return {
+                'success': False,
+                'error': 'Transaction not found or pending confirmation',
+                'pending': tx is not None
+            }, 404
+        
+        # Get transaction receipt
+        try:
+            tx_receipt = rpc_pool.get_receipt(tx_hash)
+        except TransactionNotFound:
+            tx_receipt = None
+        
+        if not tx_receipt:
+            return {
+                'success': False,
+                'error': 'Transaction not found or not confirmed'
+            }, 404
+        
+        # Check if transaction was successful
+        if tx_receipt['status'] != 1:
+            return {
+                'success': False,
+                'error': 'Transaction failed'
+            }, 400
+        
+        # Calculate expected amount
+        usd_price = PRICES[product_type]['amount']
+        token_price = get_token_price(token)
+        expected_amount = usd_price / token_price if token != 'USDT' else usd_price
+        
+        # Verify payment based on token type
+        payment_valid = False
+        
+        if token == 'BNB':
+            # For BNB, check direct transfer
+            if (tx['to'] and HexBytes(tx['to']) == PAYMENT_WALLET_BYTES and 
+                Web3.from_wei(tx['value'], 'ether') >= Decimal(str(expected_amount)) * Decimal('0.95')):  # 5% price tolerance
+                payment_valid = True
+        else:
+            # For tokens, check Transfer event
+            token_address = USDT_ADDRESS if token == 'USDT' else ETH_ADDRESS
+            payment_valid = verify_token_transfer(tx_hash, token_address, expected_amount * 0.95)  # 5% price tolerance
+        
+        if not payment_valid:
+            return {
+                'success': False,
+                'error': 'Invalid payment amount or recipient'
+            }, 400
+        
+        # Generate license
+        license_key = generate_license_key(email, tx_hash)
+        license_token = generate_license_token(
+            email=email,
+            license_key=license_key,
+            product_name=PRICES[product_type]['name'],
+            duration=PRICES[product_type]['duration']
+        )
+        
+        # Save to database
+        save_payment_to_db(
+            tx_hash=tx_hash,
+            email=email,
+            name=name,
+            product_type=product_type,
+            token=token,
+            amount=str(expected_amount),
+            license_key=license_key
+        )
+        
+        # Mark transaction as processed
+        redis_client.setex(cache_key, 86400, "processed")  # 24 hour TTL
+        
+        # Send license email
+        send_license_email_real(email, name, license_key, PRICES[product_type]['name'], tx_hash)
+        
+        # Log successful payment
+        logger.info(f"Payment verified - TxHash: {tx_hash}, Email: {email}, Product: {product_type}, Token: {token}")
+        
+        return {
+            'success': True,
+            'license_key': license_key,
+            'license_token': license_token,
+            'message': 'Payment verified successfully. Check your email for license details.',
+            'transaction': {
+                'hash': tx_hash,
+                'block': tx_receipt['blockNumber'],
+                'from': tx['from'],
+                'token': token,
+                'amount': str(expected_amount)
+            }
+        }, 200
+        
+    except Exception as e:
+        logger.error(f"Error verifying transaction: {str(e)}")
+        return {
+            'success': False,
+            'error': 'Error verifying transaction'
+        }, 500
+
+class VerifyPaymentRequest(msgspec.Struct):
+    """Body of /api/crypto/verify-payment"""
+    txHash: str
+    productType: str
+    email: str
+    name: str
+    token: str
+
 @app.route('/api/crypto/verify-payment', methods=['POST'])
 def verify_payment():
     """Verify crypto payment transaction"""
     try:
-        data = request.json
+        # Decode and validate required fields in one pass
+        try:
+            data = msgspec.json.decode(request.get_data(), type=VerifyPaymentRequest)
+        except msgspec.DecodeError as e:
+            return ojsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        # Validate required fields
-        required_fields = ['txHash', 'productType', 'email', 'name', 'token']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'Missing required field: {field}'
-                }), 400
-        
-        tx_hash = data['txHash']
-        product_type = data['productType']
-        email = data['email']
-        name = data['name']
-        token = data['token']
+        tx_hash = data.txHash
+        product_type = data.productType
+        email = data.email
+        name = data.name
+        token = data.token
         
         # Validate product type
         if product_type not in PRICES:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Invalid product type'
             }), 400
         
+        # Replay the original response for a re-submitted, already verified payment
+        cached_response = get_cached_verification(tx_hash, email)
+        if cached_response is not None:
+            return ojsonify(cached_response)
+        
         # Check if transaction already processed
         cache_key = f"tx:{tx_hash}"
         if redis_client.exists(cache_key):
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Transaction already processed'
             }), 400
         
-        # Get transaction receipt
-        try:
-            tx_receipt = w3.eth.get_transaction_receipt(tx_hash)
-            
-            if not tx_receipt:
-                return jsonify({
-                    'success': False,
-                    'error': 'Transaction not found or not confirmed'
-                }), 404
-            
-            # Check if transaction was successful
-            if tx_receipt['status'] != 1:
-                return jsonify({
-                    'success': False,
-                    'error': 'Transaction failed'
-                }), 400
-            
-            # Get transaction details
-            tx = w3.eth.get_transaction(tx_hash)
-            
-            # Calculate expected amount
-            usd_price = PRICES[product_type]['amount']
-            token_price = get_token_price(token)
-            expected_amount = usd_price / token_price if token != 'USDT' else usd_price
-            
-            # Verify payment based on token type
-            payment_valid = False
-            
-            if token == 'BNB':
-                # For BNB, check direct transfer
-                if (tx['to'].lower() == PAYMENT_WALLET.lower() and 
-                    Web3.from_wei(tx['value'], 'ether') >= Decimal(str(expected_amount)) * Decimal('0.95')):  # 5% price tolerance
-                    payment_valid = True
-            else:
-                # For tokens, check Transfer event
-                token_address = USDT_ADDRESS if token == 'USDT' else ETH_ADDRESS
-                payment_valid = verify_token_transfer(tx_hash, token_address, expected_amount * 0.95)  # 5% price tolerance
-            
-            if not payment_valid:
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid payment amount or recipient'
-                }), 400
-            
-            # Generate license
-            license_key = generate_license_key(email, tx_hash)
-            license_token = generate_license_token(
-                email=email,
-                license_key=license_key,
-                product_name=PRICES[product_type]['name'],
-                duration=PRICES[product_type]['duration']
-            )
-            
-            # Save to database
-            save_payment_to_db(
-                tx_hash=tx_hash,
-                email=email,
-                name=name,
-                product_type=product_type,
-                token=token,
-                amount=str(expected_amount),
-                license_key=license_key
-            )
-            
-            # Mark transaction as processed
-            redis_client.setex(cache_key, 86400, "processed")  # 24 hour TTL
-            
-            # Send license email
-            send_license_email_real(email, name, license_key, PRICES[product_type]['name'], tx_hash)
-            
-            # Log successful payment
-            logger.info(f"Payment verified - TxHash: {tx_hash}, Email: {email}, Product: {product_type}, Token: {token}")
-            
-            return jsonify({
-                'success': True,
-                'license_key': license_key,
-                'license_token': license_token,
-                'message': 'Payment verified successfully. Check your email for license details.',
-                'transaction': {
-                    'hash': tx_hash,
-                    'block': tx_receipt['blockNumber'],
-                    'from': tx['from'],
-                    'token': token,
-                    'amount': str(expected_amount)
-                }
-            })
-            
-        except Exception as e:
-            logger.error(f"Error verifying transaction: {str(e)}")
-            return jsonify({
-                'success': False,
-                'error': 'Error verifying transaction'
-            }), 500
+        # Coalesce identical in-flight verifies so frontend retries share one RPC round;
+        # a different buyer, product or token never receives another caller's license
+        inflight_key = inflight_verify_key(tx_hash, email, product_type, token)
+        with _inflight_lock:
+            future = _inflight_verifies.get(inflight_key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                _inflight_verifies[inflight_key] = future
+        
+        if is_owner:
+            try:
+                future.set_result(
+                    _verify_transaction(tx_hash, product_type, email, name, token, cache_key)
+                )
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with _inflight_lock:
+                    _inflight_verifies.pop(inflight_key, None)
+        
+        body, status = future.result()
+        if is_owner and status == 200:
+            cache_verification(tx_hash, email, body)
+        return ojsonify(body), status
             
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'An unexpected error occurred'
         }), 500
@@ -559,10 +861,10 @@ def verify_license():
     """Verify license token validity"""
     token = request.args.get('token') or _extract_bearer_token(request.headers.get('Authorization', ''))
     if not token:
-        return jsonify({'valid': False, 'error': 'Missing token'}), 400
+        return ojsonify({'valid': False, 'error': 'Missing token'}), 400
     
     try:
-        claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        claims = verify_license_token(token)
         
         # Check if license exists in database
         conn = get_db_connection()
@@ -577,22 +879,22 @@ def verify_license():
             conn.close()
             
             if license_data:
-                return jsonify({
+                return ojsonify({
                     'valid': True,
                     'claims': claims,
                     'license': dict(license_data)
                 })
         
-        return jsonify({
+        return ojsonify({
             'valid': True,
             'claims': claims,
             'warning': 'License not found in database'
         })
         
-    except jwt.ExpiredSignatureError:
-        return jsonify({'valid': False, 'error': 'Token expired'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'valid': False, 'error': 'Invalid token'}), 401
+    except ExpiredTokenError:
+        return ojsonify({'valid': False, 'error': 'Token expired'}), 401
+    except InvalidTokenError:
+        return ojsonify({'valid': False, 'error': 'Invalid token'}), 401
 
 def _extract_bearer_token(auth_header: str) -> str:
     """Extract bearer token from authorization header"""
@@ -605,37 +907,70 @@ def _extract_bearer_token(auth_header: str) -> str:
 
 def generate_license_key(email, tx_hash):
     """Generate a unique license key based on email and transaction hash"""
-    unique_string = f"{email}-{tx_hash}-{time.time()}"
-    hash_object = hashlib.sha256(unique_string.encode())
-    hex_dig = hash_object.hexdigest()
+    unique_string = f"{email}-{tx_hash}-{time.time_ns()}"
+    d = hashlib.blake2b(unique_string.encode(), digest_size=8).digest()
     
     # Format as license key (e.g., XXXX-XXXX-XXXX-XXXX)
-    license_key = '-'.join([hex_dig[i:i+4].upper() for i in range(0, 16, 4)])
-    return license_key
+    return f"{d[0]:02X}{d[1]:02X}-{d[2]:02X}{d[3]:02X}-{d[4]:02X}{d[5]:02X}-{d[6]:02X}{d[7]:02X}"
 
 def generate_license_token(email: str, license_key: str, product_name: str, duration: int) -> str:
     """Generate a signed JWT token representing the license"""
-    now = datetime.utcnow()
-    expiry = now + timedelta(days=duration)
+    now = int(time.time())
     
     payload = {
         'sub': email,
         'lk': license_key,
         'product': product_name,
-        'iat': now.timestamp(),
-        'nbf': now.timestamp(),
-        'exp': int(expiry.timestamp())
+        'iat': now,
+        'nbf': now,
+        'exp': now + duration * 86400
     }
     
-    token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
-    if isinstance(token, bytes):
-        token = token.decode('utf-8')
-    return token
+    signing_input = JWT_HEADER_B64 + b'.' + base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b'=')
+    mac = jwt_hmac.copy()
+    mac.update(signing_input)
+    signature = base64.urlsafe_b64encode(mac.digest()).rstrip(b'=')
+    return (signing_input + b'.' + signature).decode('ascii')
+
+class InvalidTokenError(Exception):
+    """License token is malformed or its signature does not match"""
+
+class ExpiredTokenError(InvalidTokenError):
+    """License token is past its exp claim"""
+
+def _b64url_decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+def verify_license_token(token: str) -> dict:
+    """Verify an HS256 license token against JWT_SECRET and return its claims"""
+    try:
+        signing_input, signature = token.encode('ascii').rsplit(b'.', 1)
+        header_b64, payload_b64 = signing_input.split(b'.')
+        # Tokens minted here share one header; anything else must still be HS256
+        if header_b64 != JWT_HEADER_B64 and orjson.loads(_b64url_decode(header_b64)).get('alg') != 'HS256':
+            raise InvalidTokenError('Unsupported algorithm')
+        mac = jwt_hmac.copy()
+        mac.update(signing_input)
+        if not hmac.compare_digest(base64.urlsafe_b64encode(mac.digest()).rstrip(b'='), signature):
+            raise InvalidTokenError('Signature verification failed')
+        claims = orjson.loads(_b64url_decode(payload_b64))
+    except (ValueError, AttributeError, UnicodeError) as e:
+        raise InvalidTokenError(str(e)) from e
+    if not isinstance(claims, dict):
+        raise InvalidTokenError('Invalid payload')
+    
+    now = time.time()
+    if 'exp' in claims and claims['exp'] <= now:
+        raise ExpiredTokenError('Token expired')
+    if 'nbf' in claims and claims['nbf'] > now:
+        raise InvalidTokenError('Token not yet valid')
+    return claims
 
 def save_payment_to_db(tx_hash, email, name, product_type, token, amount, license_key):
     """Save payment and license information to database"""
     try:
         conn = get_db_connection()
+        now = datetime.utcnow()
         if not conn:
             logger.error("Could not connect to database")
             return False
@@ -655,7 +990,7 @@ def save_payment_to_db(tx_hash, email, name, product_type, token, amount, licens
             token,
             amount,
             license_key,
-            datetime.utcnow()
+            now
         ))
         
         # Insert license record
@@ -667,8 +1002,8 @@ def save_payment_to_db(tx_hash, email, name, product_type, token, amount, licens
             license_key,
             email,
             PRICES[product_type]['name'],
-            datetime.utcnow(),
-            datetime.utcnow() + timedelta(days=PRICES[product_type]['duration']),
+            now,
+            now + timedelta(days=PRICES[product_type]['duration']),
             tx_hash,
             True
         ))
@@ -695,7 +1030,7 @@ def register_webhook():
         events = data.get('events', ['payment.confirmed'])
         
         if not webhook_url:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': 'Missing webhook URL'
             }), 400
@@ -710,7 +1045,7 @@ def register_webhook():
         
         redis_client.hset(f"webhook:{webhook_id}", mapping=webhook_data)
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'webhook_id': webhook_id,
             'message': 'Webhook registered successfully'
@@ -718,7 +1053,7 @@ def register_webhook():
         
     except Exception as e:
         logger.error(f"Error registering webhook: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'Error registering webhook'
         }), 500
@@ -744,7 +1079,7 @@ def get_price_history():
                 'price': round(price, 2)
             })
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'token': token,
             'history': list(reversed(history))
@@ -752,7 +1087,7 @@ def get_price_history():
         
     except Exception as e:
         logger.error(f"Error getting price history: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'Error fetching price history'
         }), 500
@@ -4,11 +4,13 @@ Handles secure file downloads with license validation
 """
 
 import os
+import orjson
 import hashlib
 import time
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask import Flask, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import boto3
 from botocore.exceptions import ClientError
@@ -29,6 +31,21 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app, origins=os.getenv('ALLOWED_ORIGINS', '*').split(','))
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and jsonify"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=str), mimetype=self.mimetype)
+
+app.json = ORJSONProvider(app)
+
 # Configure AWS S3
 s3_client = boto3.client(
     's3',
@@ -108,11 +125,12 @@ def generate_download_token():
             }), 429
         
         # Generate JWT token
+        now = int(time.time())
         token_payload = {
             'license_key': license_key,
             'download_id': download_id,
-            'exp': datetime.utcnow() + timedelta(hours=DOWNLOAD_TOKEN_EXPIRY),
-            'iat': datetime.utcnow(),
+            'exp': now + DOWNLOAD_TOKEN_EXPIRY * 3600,
+            'iat': now,
             'download_info': DOWNLOADS[download_id]
         }
         
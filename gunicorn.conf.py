@@ -0,0 +1,22 @@
+"""
+Gunicorn settings for the SRPK payment API
+Start with: gunicorn payment_api:app -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Handlers spend their time waiting on Stripe/PayPal/Redis, so each gevent
+# worker multiplexes many requests instead of serving one at a time
+worker_class = 'gevent'
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = 120
+
+# The app starts its log listener thread at import, which would not survive a
+# fork from a preloaded master, so each worker imports the app itself
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
@@ -126,13 +126,11 @@ class LicenseManager:
         # Generate 16 random bytes
         random_bytes = secrets.token_bytes(16)
         
-        # Create hash
-        hash_obj = hashlib.sha256(random_bytes)
-        hex_dig = hash_obj.hexdigest()
+        # Create hash; only the first 8 bytes feed the key's 16 hex chars
+        d = hashlib.sha256(random_bytes).digest()
         
         # Format as XXXX-XXXX-XXXX-XXXX
-        parts = [hex_dig[i:i+4].upper() for i in range(0, 16, 4)]
-        return '-'.join(parts)
+        return f"{d[0]:02X}{d[1]:02X}-{d[2]:02X}{d[3]:02X}-{d[4]:02X}{d[5]:02X}-{d[6]:02X}{d[7]:02X}"
     
     def create_license(
         self,
@@ -3,43 +3,138 @@ SRPK Pro Payment API
 Handles Stripe payment processing for SRPK Pro licenses
 """
 import os
-import json
+import orjson
 import logging
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import base64
+import hashlib
+import hmac
+import secrets
+import threading
+import time
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Annotated
+from flask import Flask, request, Response, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import stripe
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import paypalrestsdk
+import msgspec
+from celery import Celery
+import redis
+import psycopg2
+from cachetools import TTLCache
 from dotenv import load_dotenv
-import paypalrestsdk
-import jwt
+
+# gevent is only present when served by gunicorn's gevent worker, which
+# monkey-patches before importing the app; Celery workers run without it
+try:
+    import gevent
+    from gevent import monkey as gevent_monkey
+    GEVENT_AVAILABLE = True
+except ImportError:
+    GEVENT_AVAILABLE = False
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
+# Configure logging; handlers run on a background listener so stream
+# writes happen off the request path
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    handlers=[QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
-CORS(app, origins=os.getenv('ALLOWED_ORIGINS', '*').split(','))
+# Allowed CORS origins, normalized once; literal strings let flask-cors skip regex matching
+ALLOWED_ORIGINS = frozenset(o.strip() for o in os.getenv('ALLOWED_ORIGINS', '*').split(',') if o.strip())
+CORS(app, origins=sorted(ALLOWED_ORIGINS))
 
-# Configure Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and jsonify"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=str), mimetype=self.mimetype)
 
-# Configure PayPal
-paypalrestsdk.configure({
- cursor/finalizar-despliegue-y-configurar-pagos-y-workflow-0b32
-    "mode": os.getenv('PAYPAL_MODE', 'sandbox'),
-    "client_id": os.getenv('PAYPAL_CLIENT_ID'),
-    "client_secret": os.getenv('PAYPAL_CLIENT_SECRET')
-})
+app.json = ORJSONProvider(app)
+
+def ojsonify(obj, status=200):
+    """Serialize a JSON response with orjson instead of stdlib json"""
+    return Response(orjson.dumps(obj, default=str), status=status, mimetype='application/json')
+
+# Shared keep-alive HTTP session so Stripe calls reuse pooled TLS connections
+http_session = requests.Session()
+http_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=128,
+    max_retries=Retry(total=3, backoff_factor=0.1)
+)
+http_session.mount('https://', http_adapter)
+
+# Stripe is imported on first use so workers that never touch it
+# (health checks, PayPal-only traffic) skip its import cost
+@lru_cache(maxsize=1)
+def get_stripe():
+    """Import and configure the Stripe SDK"""
+    import stripe
+    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+    stripe.default_http_client = stripe.http_client.RequestsClient(session=http_session)
+    return stripe
+
+# Celery runs webhook and post-payment work outside the request cycle
+celery = Celery('payment_api', broker=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
+celery.conf.task_default_queue = 'payment_tasks'
+STRIPE_EVENTS_QUEUE = 'stripe_events'
+STRIPE_CRITICAL_QUEUE = 'stripe_critical'
+CRITICAL_STRIPE_EVENTS = {'invoice.payment_failed'}
+
+# Postgres holds the durable email -> Stripe customer index (customers table)
+DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://localhost/srpk_db')
+
+# Redis keeps email -> Stripe customer ID so returning buyers skip Customer.list
+redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True)
 
+class PooledPayPalApi(paypalrestsdk.Api):
+    """PayPal API client that sends requests over the shared keep-alive session"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_lock = threading.Lock()
+    
+    def get_access_token(self, authorization_code=None, refresh_token=None, headers=None):
+        """Share one cached OAuth token; concurrent callers wait for a single refresh"""
+        if authorization_code or refresh_token:
+            return super().get_access_token(authorization_code, refresh_token, headers)
+        with self.token_lock:
+            return super().get_access_token(headers=headers)
+    
+    def http_call(self, url, method, **kwargs):
+        response = http_session.request(method, url, proxies=self.proxies, **kwargs)
+        return self.handle_response(response, response.content.decode('utf-8'))
 
+# Configure PayPal
+paypal_api = PooledPayPalApi({
     "mode": os.getenv('PAYPAL_MODE', 'sandbox'),  # sandbox or live
     "client_id": os.getenv('PAYPAL_CLIENT_ID', ''),
     "client_secret": os.getenv('PAYPAL_CLIENT_SECRET', '')
@@ -48,7 +143,20 @@ paypalrestsdk.configure({
 # JWT Secret for license tokens
 JWT_SECRET = os.getenv('JWT_SECRET', 'change-me-in-production')
 
- main
+# HS256 signing state built once: fixed header segment and keyed HMAC to copy per token
+JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=')
+jwt_hmac = hmac.new(JWT_SECRET.encode(), digestmod=hashlib.sha256)
+
+# Settings used on the request path, read from the environment once at startup
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+APP_URL = os.getenv('APP_URL')
+PAYPAL_RETURN_URL = f"{APP_URL}/payment/success"
+PAYPAL_CANCEL_URL = f"{APP_URL}/payment/cancel"
+DOWNLOADS_DIR = os.getenv('DOWNLOADS_DIR', os.path.join(os.getcwd(), 'downloads'))
+# Internal nginx location serving DOWNLOADS_DIR; when set, nginx streams the file
+DOWNLOADS_ACCEL_PREFIX = os.getenv('DOWNLOADS_ACCEL_PREFIX', '')
+PORT = int(os.getenv('PORT', 5000))
+
 # Price IDs mapping
 PRICE_IDS = {
     'price_starter': {
@@ -65,256 +173,641 @@ PRICE_IDS = {
     }
 }
 
+# Derive the PayPal-formatted fields once at import and freeze the price table
+PRICE_IDS = MappingProxyType({
+    price_id: MappingProxyType({
+        **info,
+        'amount_str': f"{info['amount'] / 100:.2f}",
+        'currency_upper': info['currency'].upper(),
+        'description': f"{info['product_name']} License",
+        'subscription_description': f"Subscription to {info['product_name']}"
+    })
+    for price_id, info in PRICE_IDS.items()
+})
+
+# Constant response bodies, serialized once
+WEBHOOK_RECEIVED_BODY = orjson.dumps({'received': True})
+WEBHOOK_DUPLICATE_BODY = orjson.dumps({'received': True, 'duplicate': True})
+WEBHOOK_QUEUE_ERROR_BODY = orjson.dumps({'error': 'Could not queue event'})
+INVALID_PRICE_BODY = orjson.dumps({'success': False, 'error': 'Invalid price ID'})
+CUSTOMER_ERROR_BODY = orjson.dumps({'success': False, 'error': 'Error creating customer account'})
+CARD_DECLINED_BODY = orjson.dumps({'success': False, 'error': 'Your card was declined. Please check your card details and try again.'})
+SUBSCRIPTION_ERROR_BODY = orjson.dumps({'success': False, 'error': 'Error processing subscription. Please try again.'})
+UNEXPECTED_ERROR_BODY = orjson.dumps({'success': False, 'error': 'An unexpected error occurred. Please try again later.'})
+INVALID_PAYLOAD_BODY = orjson.dumps({'error': 'Invalid payload'})
+INVALID_SIGNATURE_BODY = orjson.dumps({'error': 'Invalid signature'})
+PAYMENT_ALREADY_PROCESSED_BODY = orjson.dumps({'success': False, 'error': 'Payment already processed'})
+LICENSE_ERROR_BODY = orjson.dumps({'success': False, 'error': 'Error creating license. Please contact support.'})
+PAYPAL_EXECUTION_FAILED_BODY = orjson.dumps({'success': False, 'error': 'Payment execution failed. Please try again.'})
+PAYPAL_CREATE_FAILED_BODY = orjson.dumps({'success': False, 'error': 'Failed to create payment. Please try again.'})
+PAYPAL_CREATE_ERROR_BODY = orjson.dumps({'success': False, 'error': 'Error creating PayPal payment'})
+PAYPAL_UNEXPECTED_ERROR_BODY = orjson.dumps({'success': False, 'error': 'Unexpected error'})
+PAYPAL_EXECUTE_ERROR_BODY = orjson.dumps({'success': False, 'error': 'Error executing PayPal payment'})
+LICENSE_MISSING_TOKEN_BODY = orjson.dumps({'valid': False, 'error': 'Missing token'})
+LICENSE_EXPIRED_BODY = orjson.dumps({'valid': False, 'error': 'Token expired'})
+LICENSE_INVALID_BODY = orjson.dumps({'valid': False, 'error': 'Invalid token'})
+DOWNLOAD_MISSING_PARAMS_BODY = orjson.dumps({'success': False, 'error': 'Missing token or file parameter'})
+DOWNLOAD_NOT_ALLOWED_BODY = orjson.dumps({'success': False, 'error': 'File not allowed for this license'})
+DOWNLOAD_TOKEN_EXPIRED_BODY = orjson.dumps({'success': False, 'error': 'Token expired'})
+DOWNLOAD_INVALID_TOKEN_BODY = orjson.dumps({'success': False, 'error': 'Invalid token'})
+
+def json_body_response(body, status=200):
+    """Wrap pre-serialized JSON bytes in a fresh response"""
+    return Response(body, status=status, mimetype='application/json')
+
+@lru_cache(maxsize=1)
+def _health_body(second: int) -> bytes:
+    """Serialized health payload for a whole second, reused across health checks"""
+    return orjson.dumps({
+        'status': 'healthy',
+        'timestamp': datetime.utcfromtimestamp(second).isoformat()
+    })
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat()
-    })
+    return json_body_response(_health_body(int(time.time())))
 
-@app.route('/api/process-payment', methods=['POST'])
-def process_payment():
-    """Process Stripe payment for SRPK Pro license"""
+def claim_once(key, ttl=86400):
+    """Atomically mark key as seen; False if it was already claimed"""
     try:
-        data = request.json
-        
-        # Validate required fields
-        required_fields = ['token', 'priceId', 'email', 'name']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'Missing required field: {field}'
-                }), 400
-        
-        # Validate price ID
-        price_id = data['priceId']
-        if price_id not in PRICE_IDS:
-            return jsonify({
+        return bool(redis_client.set(key, "1", nx=True, ex=ttl))
+    except redis.RedisError as e:
+        # Fail open: a duplicate is cheaper than dropping a real event
+        logger.warning("Could not claim %s: %s", key, e)
+        return True
+
+def release_claim(key):
+    """Drop a claim so the operation can be retried"""
+    try:
+        redis_client.delete(key)
+    except redis.RedisError as e:
+        logger.warning("Could not release %s: %s", key, e)
+
+# Process-local front for the Redis customer map; short TTL bounds staleness
+# after a customer is deleted through another process
+customer_id_cache = TTLCache(maxsize=5000, ttl=60)
+customer_id_cache_lock = threading.Lock()
+
+def get_cached_customer_id(email):
+    """Look up a Stripe customer ID stored for this email"""
+    email = email.lower()
+    with customer_id_cache_lock:
+        customer_id = customer_id_cache.get(email)
+    if customer_id:
+        return customer_id
+    
+    try:
+        customer_id = redis_client.get(f"stripe_customer:{email}")
+    except redis.RedisError as e:
+        logger.warning("Could not read customer cache: %s", e)
+        return None
+    if customer_id:
+        with customer_id_cache_lock:
+            customer_id_cache[email] = customer_id
+    return customer_id
+
+def cache_customer_id(email, customer_id):
+    """Remember the Stripe customer ID for this email"""
+    email = email.lower()
+    with customer_id_cache_lock:
+        customer_id_cache[email] = customer_id
+    try:
+        redis_client.set(f"stripe_customer:{email}", customer_id)
+    except redis.RedisError as e:
+        logger.warning("Could not write customer cache: %s", e)
+
+def forget_customer_id(email):
+    """Drop the stored Stripe customer ID for this email"""
+    email = email.lower()
+    with customer_id_cache_lock:
+        customer_id_cache.pop(email, None)
+    try:
+        redis_client.delete(f"stripe_customer:{email}")
+    except redis.RedisError as e:
+        logger.warning("Could not clear customer cache: %s", e)
+
+def serving_on_gevent():
+    """True when running under a monkey-patched gevent worker"""
+    return GEVENT_AVAILABLE and gevent_monkey.is_module_patched('socket')
+
+def run_blocking(func, *args):
+    """Call a non-cooperative function (psycopg2) without stalling the gevent hub"""
+    if serving_on_gevent():
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+def spawn_blocking(func, *args):
+    """Start a non-cooperative call in the background under gevent; run it inline otherwise"""
+    if serving_on_gevent():
+        gevent.get_hub().threadpool.spawn(func, *args)
+    else:
+        func(*args)
+
+def get_db_connection():
+    """Get PostgreSQL database connection"""
+    try:
+        return psycopg2.connect(DATABASE_URL)
+    except Exception as e:
+        logger.error("Database connection error: %s", e)
+        return None
+
+def lookup_indexed_customer(email):
+    """Find the Stripe customer ID for this email in the local customers table"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT stripe_customer_id FROM customers WHERE email = %s",
+                (email.lower(),)
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+    except psycopg2.Error as e:
+        logger.warning("Could not read customer index: %s", e)
+        return None
+    finally:
+        conn.close()
+
+def index_customer(stripe_customer_id, email, name, company=None):
+    """Upsert a Stripe customer into the local customers table"""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO customers (stripe_customer_id, email, name, company)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (stripe_customer_id) DO UPDATE SET
+                    email = EXCLUDED.email,
+                    name = EXCLUDED.name,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                (stripe_customer_id, email.lower(), name or '', company or None)
+            )
+    except psycopg2.Error as e:
+        logger.warning("Could not index customer %s: %s", stripe_customer_id, e)
+    finally:
+        conn.close()
+
+def unindex_customer(stripe_customer_id):
+    """Remove a deleted Stripe customer from the local customers table"""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM customers WHERE stripe_customer_id = %s",
+                (stripe_customer_id,)
+            )
+    except psycopg2.Error as e:
+        logger.warning("Could not unindex customer %s: %s", stripe_customer_id, e)
+    finally:
+        conn.close()
+
+def resolve_stripe_customer(stripe, data, price_info):
+    """Return the Stripe customer ID for a checkout, creating the customer if needed"""
+    # Returning customers are resolved locally, without a Stripe round-trip
+    customer_id = get_cached_customer_id(data.email)
+    if not customer_id:
+        customer_id = run_blocking(lookup_indexed_customer, data.email)
+        if customer_id:
+            cache_customer_id(data.email, customer_id)
+    
+    if customer_id:
+        logger.info("Retrieved existing customer: %s", customer_id)
+        return customer_id
+    
+    # Create new customer; the idempotency key makes a re-submitted
+    # checkout return the customer created by the first attempt
+    customer = stripe.Customer.create(
+        email=data.email,
+        name=data.name,
+        source=data.token,
+        metadata={
+            'company': data.company,
+            'product': price_info['product_name']
+        },
+        idempotency_key=hashlib.sha256(f"{data.email.lower()}:{data.token}".encode()).hexdigest()
+    )
+    cache_customer_id(data.email, customer.id)
+    # The local index write overlaps the caller's Subscription.create round-trip
+    spawn_blocking(index_customer, customer.id, data.email, data.name, data.company)
+    logger.info("Created new customer: %s", customer.id)
+    return customer.id
+
+class ProcessPaymentRequest(msgspec.Struct):
+    """Body of /api/process-payment"""
+    token: str
+    priceId: str
+    email: str
+    name: str
+    company: str = ''
+
+def run_checkout(request_type, complete):
+    """Shared body of the Stripe checkout endpoints
+    
+    Decodes the request, resolves the customer and creates the subscription
+    (one item, with a quantity when the request carries seats); complete(data,
+    price_info, customer_id, subscription) issues the licenses and builds the
+    success response.
+    """
+    stripe = get_stripe()
+    try:
+        # Decode and validate required fields in one pass
+        try:
+            data = msgspec.json.decode(request.get_data(), type=request_type)
+        except msgspec.DecodeError as e:
+            return ojsonify({
                 'success': False,
-                'error': 'Invalid price ID'
+                'error': str(e)
             }), 400
         
-        price_info = PRICE_IDS[price_id]
+        # Validate price ID
+        price_id = data.priceId
+        price_info = PRICE_IDS.get(price_id)
+        if price_info is None:
+            return json_body_response(INVALID_PRICE_BODY, 400)
         
         # Create or retrieve customer
         try:
-            # Check if customer exists
-            customers = stripe.Customer.list(email=data['email'], limit=1)
-            
-            if customers.data:
-                customer = customers.data[0]
-                logger.info(f"Retrieved existing customer: {customer.id}")
-            else:
-                # Create new customer
-                customer = stripe.Customer.create(
-                    email=data['email'],
-                    name=data['name'],
-                    source=data['token'],
-                    metadata={
-                        'company': data.get('company', ''),
-                        'product': price_info['product_name']
-                    }
-                )
-                logger.info(f"Created new customer: {customer.id}")
-        
+            customer_id = resolve_stripe_customer(stripe, data, price_info)
         except stripe.error.StripeError as e:
-            logger.error(f"Stripe customer error: {str(e)}")
-            return jsonify({
-                'success': False,
-                'error': 'Error creating customer account'
-            }), 400
+            logger.error("Stripe customer error: %s", e)
+            return json_body_response(CUSTOMER_ERROR_BODY, 400)
+        
+        # Create subscription; a multi-seat purchase is one item with a quantity
+        item = {'price': price_id}
+        metadata = {
+            'product': price_info['product_name'],
+            'customer_name': data.name,
+            'company': data.company
+        }
+        seats = getattr(data, 'seats', None)
+        if seats is not None:
+            item['quantity'] = seats
+            metadata['seats'] = seats
         
-        # Create subscription
         try:
             subscription = stripe.Subscription.create(
-                customer=customer.id,
-                items=[{
-                    'price': price_id,
-                }],
-                metadata={
-                    'product': price_info['product_name'],
-                    'customer_name': data['name'],
-                    'company': data.get('company', '')
-                }
+                customer=customer_id,
+                items=[item],
+                # Stripe metadata values must be strings
+                metadata={key: str(value) for key, value in metadata.items()}
             )
-            
-            logger.info(f"Created subscription: {subscription.id}")
-            
-            # Send license key email (implement this based on your email service)
-            license_key = generate_license_key(customer.id, subscription.id)
-            send_license_email(data['email'], data['name'], license_key, price_info['product_name'])
-            license_token = generate_license_token(email=data['email'], license_key=license_key, product_name=price_info['product_name'])
-            
-            return jsonify({
-                'success': True,
-                'subscription_id': subscription.id,
-                'customer_id': customer.id,
-                'license_key': license_key,
-                'license_token': license_token,
-                'message': 'Payment processed successfully. Check your email for license details.'
-            })
+            return complete(data, price_info, customer_id, subscription)
         
         except stripe.error.CardError as e:
-            logger.error(f"Card error: {str(e)}")
-            return jsonify({
-                'success': False,
-                'error': 'Your card was declined. Please check your card details and try again.'
-            }), 400
+            logger.error("Card error: %s", e)
+            return json_body_response(CARD_DECLINED_BODY, 400)
         
         except stripe.error.StripeError as e:
-            logger.error(f"Stripe subscription error: {str(e)}")
-            return jsonify({
-                'success': False,
-                'error': 'Error processing subscription. Please try again.'
-            }), 400
+            logger.error("Stripe subscription error: %s", e)
+            return json_body_response(SUBSCRIPTION_ERROR_BODY, 400)
     
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': 'An unexpected error occurred. Please try again later.'
-        }), 500
+        logger.error("Unexpected error: %s", e)
+        return json_body_response(UNEXPECTED_ERROR_BODY, 500)
+
+def queue_license_email(task, reference, *args):
+    """Queue a license email after a charge; a broker failure is logged, the buyer still gets the license"""
+    try:
+        task.delay(*args)
+    except Exception as e:
+        logger.error("Could not queue license email for %s: %s", reference, e)
+
+@app.route('/api/process-payment', methods=['POST'])
+def process_payment():
+    """Process Stripe payment for SRPK Pro license"""
+    return run_checkout(ProcessPaymentRequest, complete_single_checkout)
+
+def complete_single_checkout(data, price_info, customer_id, subscription):
+    """Issue the license for a single-seat subscription"""
+    logger.info("Created subscription: %s", subscription.id)
+    
+    # Send license key email (implement this based on your email service)
+    license_key = generate_license_key(customer_id, subscription.id)
+    license_token = generate_license_token(email=data.email, license_key=license_key, product_name=price_info['product_name'])
+    queue_license_email(send_license_email, subscription.id, data.email, data.name, license_key, price_info['product_name'])
+    
+    return ojsonify({
+        'success': True,
+        'subscription_id': subscription.id,
+        'customer_id': customer_id,
+        'license_key': license_key,
+        'license_token': license_token,
+        'message': 'Payment processed successfully. Check your email for license details.'
+    })
+
+# Upper bound on seats bought in one checkout
+MAX_SEATS = 1000
+
+class ProcessPaymentBatchRequest(msgspec.Struct):
+    """Body of /api/process-payment-batch"""
+    token: str
+    priceId: str
+    email: str
+    name: str
+    seats: Annotated[int, msgspec.Meta(ge=1, le=MAX_SEATS)]
+    company: str = ''
+
+@app.route('/api/process-payment-batch', methods=['POST'])
+def process_payment_batch():
+    """Process a multi-seat Stripe purchase as one subscription with a quantity"""
+    return run_checkout(ProcessPaymentBatchRequest, complete_batch_checkout)
+
+def complete_batch_checkout(data, price_info, customer_id, subscription):
+    """Issue one license per seat of a multi-seat subscription"""
+    logger.info("Created subscription: %s (%s seats)", subscription.id, data.seats)
+    
+    # One license per seat; seat_index ties each key to the parent subscription
+    seats = []
+    for seat_index in range(data.seats):
+        license_key = generate_license_key(customer_id, subscription.id)
+        seats.append({
+            'seat_index': seat_index,
+            'license_key': license_key,
+            'license_token': generate_license_token(email=data.email, license_key=license_key, product_name=price_info['product_name'])
+        })
+    
+    queue_license_email(send_license_batch_email, subscription.id, data.email, data.name,
+                        [seat['license_key'] for seat in seats], price_info['product_name'])
+    
+    return ojsonify({
+        'success': True,
+        'subscription_id': subscription.id,
+        'customer_id': customer_id,
+        'seats': seats,
+        'message': 'Payment processed successfully. Check your email for license details.'
+    })
+
+def handle_subscription_created(subscription):
+    logger.info("Subscription created: %s", subscription['id'])
+
+def handle_subscription_updated(subscription):
+    logger.info("Subscription updated: %s", subscription['id'])
+
+def handle_subscription_deleted(subscription):
+    logger.info("Subscription cancelled: %s", subscription['id'])
+    # Handle license deactivation
+
+def handle_customer_created(customer):
+    logger.info("Customer created: %s", customer['id'])
+    if customer.get('email'):
+        cache_customer_id(customer['email'], customer['id'])
+        index_customer(customer['id'], customer['email'], customer.get('name'))
+
+def handle_customer_updated(customer):
+    logger.info("Customer updated: %s", customer['id'])
+    if customer.get('email'):
+        cache_customer_id(customer['email'], customer['id'])
+        index_customer(customer['id'], customer['email'], customer.get('name'))
+
+def handle_customer_deleted(customer):
+    logger.info("Customer deleted: %s", customer['id'])
+    unindex_customer(customer['id'])
+    if customer.get('email'):
+        forget_customer_id(customer['email'])
+
+def handle_invoice_payment_succeeded(invoice):
+    logger.info("Payment succeeded for invoice: %s", invoice['id'])
+
+def handle_invoice_payment_failed(invoice):
+    logger.info("Payment failed for invoice: %s", invoice['id'])
+    # Send payment failure notification
+
+# Stripe event types we act on; anything else is acknowledged and dropped
+STRIPE_EVENT_HANDLERS = MappingProxyType({
+    'subscription.created': handle_subscription_created,
+    'subscription.updated': handle_subscription_updated,
+    'subscription.deleted': handle_subscription_deleted,
+    'customer.created': handle_customer_created,
+    'customer.updated': handle_customer_updated,
+    'customer.deleted': handle_customer_deleted,
+    'invoice.payment_succeeded': handle_invoice_payment_succeeded,
+    'invoice.payment_failed': handle_invoice_payment_failed
+})
+
+# Keyed HMAC prepared once; each verification works on a copy
+STRIPE_SIGNATURE_TOLERANCE = 300
+stripe_webhook_hmac = hmac.new((STRIPE_WEBHOOK_SECRET or '').encode(), digestmod=hashlib.sha256)
+
+def verify_stripe_signature(payload, sig_header):
+    """Check the Stripe-Signature header against the raw payload bytes"""
+    if not sig_header or not STRIPE_WEBHOOK_SECRET:
+        return False
+    
+    timestamp = None
+    signatures = []
+    for item in sig_header.split(','):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    
+    if timestamp is None or not signatures:
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > STRIPE_SIGNATURE_TOLERANCE:
+            return False
+    except ValueError:
+        return False
+    
+    mac = stripe_webhook_hmac.copy()
+    mac.update(timestamp.encode() + b'.' + payload)
+    expected = mac.hexdigest()
+    return any(hmac.compare_digest(expected, signature) for signature in signatures)
+
+# Stripe event IDs already handled by this worker, in front of the Redis claim
+seen_stripe_events = TTLCache(maxsize=20000, ttl=86400)
+seen_stripe_events_lock = threading.Lock()
 
 @app.route('/api/webhook', methods=['POST'])
 def stripe_webhook():
     """Handle Stripe webhook events"""
-    payload = request.get_data(as_text=True)
+    payload = request.get_data()
     sig_header = request.headers.get('Stripe-Signature')
-    webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
     
+    if verify_stripe_signature(payload, sig_header):
+        try:
+            event = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            logger.error("Invalid payload")
+            return json_body_response(INVALID_PAYLOAD_BODY, 400)
+    else:
+        # Let the SDK decide anything the fast path rejects, so errors match Stripe's
+        stripe = get_stripe()
+        try:
+            event = stripe.Webhook.construct_event(
+                payload, sig_header, STRIPE_WEBHOOK_SECRET
+            )
+        except ValueError:
+            logger.error("Invalid payload")
+            return json_body_response(INVALID_PAYLOAD_BODY, 400)
+        except stripe.error.SignatureVerificationError:
+            logger.error("Invalid signature")
+            return json_body_response(INVALID_SIGNATURE_BODY, 400)
+    
+    # Acknowledge event types we don't act on without queueing them
+    if event['type'] not in STRIPE_EVENT_HANDLERS:
+        return json_body_response(WEBHOOK_RECEIVED_BODY)
+    
+    # Stripe retries aggressively; only the first delivery of an event is queued.
+    # Events this worker already saw are answered without a Redis round trip
+    event_id = event['id']
+    claim_key = f"stripe:evt:{event_id}"
+    with seen_stripe_events_lock:
+        if event_id in seen_stripe_events:
+            return json_body_response(WEBHOOK_DUPLICATE_BODY)
+        seen_stripe_events[event_id] = True
+    if not claim_once(claim_key):
+        return json_body_response(WEBHOOK_DUPLICATE_BODY)
+    
+    # Hand the event to a worker and acknowledge right away so Stripe doesn't retry
+    task_queue = STRIPE_CRITICAL_QUEUE if event['type'] in CRITICAL_STRIPE_EVENTS else STRIPE_EVENTS_QUEUE
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, webhook_secret
-        )
-    except ValueError:
-        logger.error("Invalid payload")
-        return jsonify({'error': 'Invalid payload'}), 400
-    except stripe.error.SignatureVerificationError:
-        logger.error("Invalid signature")
-        return jsonify({'error': 'Invalid signature'}), 400
+        process_stripe_event.apply_async(args=[event_id], queue=task_queue)
+    except Exception as e:
+        # Not queued: drop both claims so Stripe's retry is processed, not treated as a duplicate
+        logger.error("Could not queue Stripe event %s: %s", event_id, e)
+        release_claim(claim_key)
+        with seen_stripe_events_lock:
+            seen_stripe_events.pop(event_id, None)
+        return json_body_response(WEBHOOK_QUEUE_ERROR_BODY, 500)
     
-    # Handle the event
-    if event['type'] == 'subscription.created':
-        subscription = event['data']['object']
-        logger.info(f"Subscription created: {subscription['id']}")
-        
-    elif event['type'] == 'subscription.updated':
-        subscription = event['data']['object']
-        logger.info(f"Subscription updated: {subscription['id']}")
-        
-    elif event['type'] == 'subscription.deleted':
-        subscription = event['data']['object']
-        logger.info(f"Subscription cancelled: {subscription['id']}")
-        # Handle license deactivation
-        
-    elif event['type'] == 'invoice.payment_succeeded':
-        invoice = event['data']['object']
-        logger.info(f"Payment succeeded for invoice: {invoice['id']}")
-        
-    elif event['type'] == 'invoice.payment_failed':
-        invoice = event['data']['object']
-        logger.info(f"Payment failed for invoice: {invoice['id']}")
-        # Send payment failure notification
+    return json_body_response(WEBHOOK_RECEIVED_BODY)
+
+@celery.task(bind=True, max_retries=5)
+def process_stripe_event(self, event_id):
+    """Handle a Stripe webhook event outside the request cycle"""
+    stripe = get_stripe()
+    try:
+        # Re-fetch so retries never act on a stale payload
+        event = stripe.Event.retrieve(event_id)
+    except stripe.error.StripeError as e:
+        logger.error("Could not retrieve Stripe event %s: %s", event_id, e)
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
     
-    return jsonify({'received': True})
- cursor/finalizar-despliegue-y-configurar-pagos-y-workflow-0b32
+    # Handle the event
+    handler = STRIPE_EVENT_HANDLERS.get(event['type'])
+    if handler:
+        handler(event['data']['object'])
+
+class ProcessPayPalPaymentRequest(msgspec.Struct):
+    """Body of /api/process-paypal-payment"""
+    paymentId: str
+    payerId: str
+    priceId: str
+    email: str
+    name: str
+
 @app.route('/api/process-paypal-payment', methods=['POST'])
 def process_paypal_payment():
     """Process PayPal payment for SRPK Pro license"""
+    claim_key = None
     try:
-        data = request.json
-        
-        # Validate required fields
-        required_fields = ['paymentId', 'payerId', 'priceId', 'email', 'name']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'Missing required field: {field}'
-                }), 400
-        
-        # Validate price ID
-        price_id = data['priceId']
-        if price_id not in PRICE_IDS:
-            return jsonify({
+        # Decode and validate required fields in one pass
+        try:
+            data = msgspec.json.decode(request.get_data(), type=ProcessPayPalPaymentRequest)
+        except msgspec.DecodeError as e:
+            return ojsonify({
                 'success': False,
-                'error': 'Invalid price ID'
+                'error': str(e)
             }), 400
         
-        price_info = PRICE_IDS[price_id]
+        # Validate price ID
+        price_id = data.priceId
+        price_info = PRICE_IDS.get(price_id)
+        if price_info is None:
+            return json_body_response(INVALID_PRICE_BODY, 400)
+        
+        # Claim the payment so a repeated submit doesn't execute it twice
+        claim_key = f"paypal:payment:{data.paymentId}"
+        if not claim_once(claim_key):
+            return json_body_response(PAYMENT_ALREADY_PROCESSED_BODY, 409)
         
         # Execute PayPal payment
-        payment = paypalrestsdk.Payment.find(data['paymentId'])
+        payment = paypalrestsdk.Payment.find(data.paymentId, api=paypal_api)
         
-        if payment.execute({"payer_id": data['payerId']}):
-            logger.info(f"PayPal payment executed successfully: {payment.id}")
+        if payment.execute({"payer_id": data.payerId}):
+            logger.info("PayPal payment executed successfully: %s", payment.id)
             
             # Create customer record
             try:
                 # Generate license key
-                license_key = generate_license_key(data['email'], payment.id)
-                
-                # Send license email
-                send_license_email(
-                    data['email'], 
-                    data['name'], 
-                    license_key, 
-                    price_info['product_name']
-                )
+                license_key = generate_license_key(data.email, payment.id)
                 
-                # Store payment record (implement database storage)
-                store_paypal_payment({
+                # Send the license email and store the payment in the background
+                finalize_paypal_payment.delay({
                     'payment_id': payment.id,
-                    'email': data['email'],
-                    'name': data['name'],
+                    'email': data.email,
+                    'name': data.name,
                     'product': price_info['product_name'],
                     'amount': price_info['amount'],
                     'license_key': license_key
                 })
                 
-                return jsonify({
+                return ojsonify({
                     'success': True,
                     'payment_id': payment.id,
                     'message': 'Payment processed successfully. Check your email for license details.'
                 })
             
             except Exception as e:
-                logger.error(f"Error processing PayPal payment: {str(e)}")
-                return jsonify({
-                    'success': False,
-                    'error': 'Error creating license. Please contact support.'
-                }), 500
+                logger.error("Error processing PayPal payment: %s", e)
+                return json_body_response(LICENSE_ERROR_BODY, 500)
         else:
-            logger.error(f"PayPal payment execution failed: {payment.error}")
-            return jsonify({
-                'success': False,
-                'error': 'Payment execution failed. Please try again.'
-            }), 400
+            logger.error("PayPal payment execution failed: %s", payment.error)
+            release_claim(claim_key)
+            return json_body_response(PAYPAL_EXECUTION_FAILED_BODY, 400)
     
     except Exception as e:
-        logger.error(f"Unexpected PayPal error: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': 'An unexpected error occurred. Please try again later.'
-        }), 500
+        logger.error("Unexpected PayPal error: %s", e)
+        if claim_key:
+            release_claim(claim_key)
+        return json_body_response(UNEXPECTED_ERROR_BODY, 500)
+
+@celery.task
+def finalize_paypal_payment(payment_data):
+    """Send the license email and store an executed PayPal payment"""
+    send_license_email(
+        payment_data['email'],
+        payment_data['name'],
+        payment_data['license_key'],
+        payment_data['product']
+    )
+    
+    # Store payment record (implement database storage)
+    store_paypal_payment(payment_data)
+
+class CreatePayPalPaymentRequest(msgspec.Struct):
+    """Body of /api/create-paypal-payment"""
+    priceId: str
 
 @app.route('/api/create-paypal-payment', methods=['POST'])
 def create_paypal_payment():
     """Create PayPal payment for approval"""
     try:
-        data = request.json
-        
-        # Validate price ID
-        price_id = data.get('priceId')
-        if price_id not in PRICE_IDS:
-            return jsonify({
+        try:
+            data = msgspec.json.decode(request.get_data(), type=CreatePayPalPaymentRequest)
+        except msgspec.DecodeError as e:
+            return ojsonify({
                 'success': False,
-                'error': 'Invalid price ID'
+                'error': str(e)
             }), 400
         
-        price_info = PRICE_IDS[price_id]
+        # Validate price ID
+        price_id = data.priceId
+        price_info = PRICE_IDS.get(price_id)
+        if price_info is None:
+            return json_body_response(INVALID_PRICE_BODY, 400)
         
         # Create PayPal payment
         payment = paypalrestsdk.Payment({
@@ -323,139 +816,151 @@ def create_paypal_payment():
                 "payment_method": "paypal"
             },
             "redirect_urls": {
-                "return_url": f"{os.getenv('APP_URL')}/payment/success",
-                "cancel_url": f"{os.getenv('APP_URL')}/payment/cancel"
-=======
-@app.route('/api/paypal/create-payment', methods=['POST'])
-def paypal_create_payment():
-    """Create PayPal payment and return approval URL"""
-    try:
-        data = request.json or {}
-        required_fields = ['priceId', 'email', 'name', 'returnUrl', 'cancelUrl']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
-
-        price_id = data['priceId']
-        if price_id not in PRICE_IDS:
-            return jsonify({'success': False, 'error': 'Invalid price ID'}), 400
-
-        price_info = PRICE_IDS[price_id]
-
-        payment = paypalrestsdk.Payment({
-            "intent": "sale",
-            "payer": {"payment_method": "paypal"},
-            "redirect_urls": {
-                "return_url": data['returnUrl'],
-                "cancel_url": data['cancelUrl']
- main
+                "return_url": PAYPAL_RETURN_URL,
+                "cancel_url": PAYPAL_CANCEL_URL
             },
             "transactions": [{
                 "item_list": {
                     "items": [{
                         "name": price_info['product_name'],
                         "sku": price_id,
- cursor/finalizar-despliegue-y-configurar-pagos-y-workflow-0b32
-                        "price": str(price_info['amount'] / 100),
-
- main
-                        "currency": price_info['currency'].upper(),
+                        "price": price_info['amount_str'],
+                        "currency": price_info['currency_upper'],
                         "quantity": 1
                     }]
                 },
                 "amount": {
- cursor/finalizar-despliegue-y-configurar-pagos-y-workflow-0b32
-                    "total": str(price_info['amount'] / 100),
-                    "currency": price_info['currency'].upper()
+                    "total": price_info['amount_str'],
+                    "currency": price_info['currency_upper']
                 },
-                "description": f"{price_info['product_name']} License"
+                "description": price_info['description']
             }]
-        })
+        }, api=paypal_api)
         
         if payment.create():
-            logger.info(f"PayPal payment created: {payment.id}")
+            logger.info("PayPal payment created: %s", payment.id)
             
             # Find approval URL
-            approval_url = None
-            for link in payment.links:
-                if link.rel == "approval_url":
-                    approval_url = link.href
-                    break
+            approval_url = next((link.href for link in payment.links if link.rel == "approval_url"), None)
             
-            return jsonify({
+            return ojsonify({
                 'success': True,
                 'paymentId': payment.id,
                 'approvalUrl': approval_url
             })
         else:
-            logger.error(f"PayPal payment creation failed: {payment.error}")
-            return jsonify({
-                'success': False,
-                'error': 'Failed to create payment. Please try again.'
-            }), 400
+            logger.error("PayPal payment creation failed: %s", payment.error)
+            return json_body_response(PAYPAL_CREATE_FAILED_BODY, 400)
     
     except Exception as e:
-        logger.error(f"Unexpected error creating PayPal payment: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': 'An unexpected error occurred. Please try again later.'
-        }), 500
+        logger.error("Unexpected error creating PayPal payment: %s", e)
+        return json_body_response(UNEXPECTED_ERROR_BODY, 500)
 
 def store_paypal_payment(payment_data):
     """Store PayPal payment record in database"""
     # This is a placeholder - implement based on your database schema
-    logger.info(f"Would store PayPal payment: {payment_data}")
+    logger.info("Would store PayPal payment: %s", payment_data)
     # Example implementation:
     # db.session.add(PayPalPayment(**payment_data))
     # db.session.commit()
 
-                    "total": f"{price_info['amount'] / 100:.2f}",
-                    "currency": price_info['currency'].upper()
+
+class PayPalCreatePaymentRequest(msgspec.Struct):
+    """Body of /api/paypal/create-payment"""
+    priceId: str
+    email: str
+    name: str
+    returnUrl: str
+    cancelUrl: str
+
+class PayPalExecutePaymentRequest(msgspec.Struct):
+    """Body of /api/paypal/execute-payment"""
+    paymentId: str
+    PayerID: str
+    priceId: str
+    email: str
+    name: str
+
+@app.route('/api/paypal/create-payment', methods=['POST'])
+def paypal_create_payment():
+    """Create PayPal payment and return approval URL"""
+    try:
+        # Decode and validate required fields in one pass
+        try:
+            data = msgspec.json.decode(request.get_data(), type=PayPalCreatePaymentRequest)
+        except msgspec.DecodeError as e:
+            return ojsonify({'success': False, 'error': str(e)}), 400
+
+        price_id = data.priceId
+        price_info = PRICE_IDS.get(price_id)
+        if price_info is None:
+            return json_body_response(INVALID_PRICE_BODY, 400)
+
+        payment = paypalrestsdk.Payment({
+            "intent": "sale",
+            "payer": {"payment_method": "paypal"},
+            "redirect_urls": {
+                "return_url": data.returnUrl,
+                "cancel_url": data.cancelUrl
+            },
+            "transactions": [{
+                "item_list": {
+                    "items": [{
+                        "name": price_info['product_name'],
+                        "sku": price_id,
+                        "price": price_info['amount_str'],
+                        "currency": price_info['currency_upper'],
+                        "quantity": 1
+                    }]
+                },
+                "amount": {
+                    "total": price_info['amount_str'],
+                    "currency": price_info['currency_upper']
                 },
-                "description": f"Subscription to {price_info['product_name']}"
+                "description": price_info['subscription_description']
             }]
-        })
+        }, api=paypal_api)
 
         if payment.create():
             approval_url = next((link.href for link in payment.links if link.rel == "approval_url"), None)
-            return jsonify({
+            return ojsonify({
                 'success': True,
                 'payment_id': payment.id,
                 'approval_url': approval_url
             })
         else:
-            logger.error(f"PayPal create payment error: {payment.error}")
-            return jsonify({'success': False, 'error': 'Error creating PayPal payment'}), 400
+            logger.error("PayPal create payment error: %s", payment.error)
+            return json_body_response(PAYPAL_CREATE_ERROR_BODY, 400)
 
     except Exception as e:
-        logger.error(f"Unexpected error (PayPal create): {str(e)}")
-        return jsonify({'success': False, 'error': 'Unexpected error'}), 500
+        logger.error("Unexpected error (PayPal create): %s", e)
+        return json_body_response(PAYPAL_UNEXPECTED_ERROR_BODY, 500)
 
 
 @app.route('/api/paypal/execute-payment', methods=['POST'])
 def paypal_execute_payment():
     """Execute PayPal payment after approval and issue license"""
     try:
-        data = request.json or {}
-        required_fields = ['paymentId', 'PayerID', 'priceId', 'email', 'name']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
-
-        payment = paypalrestsdk.Payment.find(data['paymentId'])
-        if payment.execute({"payer_id": data['PayerID']}):
-            price_info = PRICE_IDS.get(data['priceId'])
+        # Decode and validate required fields in one pass
+        try:
+            data = msgspec.json.decode(request.get_data(), type=PayPalExecutePaymentRequest)
+        except msgspec.DecodeError as e:
+            return ojsonify({'success': False, 'error': str(e)}), 400
+
+        payment = paypalrestsdk.Payment.find(data.paymentId, api=paypal_api)
+        if payment.execute({"payer_id": data.PayerID}):
+            price_info = PRICE_IDS.get(data.priceId)
             if not price_info:
-                return jsonify({'success': False, 'error': 'Invalid price ID'}), 400
+                return json_body_response(INVALID_PRICE_BODY, 400)
 
             # Generate license and token
-            customer_id = payment.payer.payer_info.payer_id if hasattr(payment, 'payer') else data['email']
+            customer_id = payment.payer.payer_info.payer_id if hasattr(payment, 'payer') else data.email
             subscription_id = payment.id
             license_key = generate_license_key(customer_id, subscription_id)
-            send_license_email(data['email'], data['name'], license_key, price_info['product_name'])
-            license_token = generate_license_token(email=data['email'], license_key=license_key, product_name=price_info['product_name'])
+            license_token = generate_license_token(email=data.email, license_key=license_key, product_name=price_info['product_name'])
+            queue_license_email(send_license_email, payment.id, data.email, data.name, license_key, price_info['product_name'])
 
-            return jsonify({
+            return ojsonify({
                 'success': True,
                 'payment_id': payment.id,
                 'license_key': license_key,
@@ -463,43 +968,100 @@ def paypal_execute_payment():
                 'message': 'Payment processed successfully. Check your email for license details.'
             })
         else:
-            logger.error(f"PayPal execute error: {payment.error}")
-            return jsonify({'success': False, 'error': 'Error executing PayPal payment'}), 400
+            logger.error("PayPal execute error: %s", payment.error)
+            return json_body_response(PAYPAL_EXECUTE_ERROR_BODY, 400)
 
     except Exception as e:
-        logger.error(f"Unexpected error (PayPal execute): {str(e)}")
-        return jsonify({'success': False, 'error': 'Unexpected error'}), 500
+        logger.error("Unexpected error (PayPal execute): %s", e)
+        return json_body_response(PAYPAL_UNEXPECTED_ERROR_BODY, 500)
 
 
 def generate_license_token(email: str, license_key: str, product_name: str) -> str:
     """Generate a signed JWT token representing the license"""
+    now = int(time.time())
     payload = {
         'sub': email,
         'lk': license_key,
         'product': product_name,
-        'iat': datetime.utcnow().timestamp(),
-        'nbf': datetime.utcnow().timestamp(),
-        'exp': int(datetime.utcnow().timestamp()) + 60 * 60 * 24 * 30  # 30 days
+        'iat': now,
+        'nbf': now,
+        'exp': now + 60 * 60 * 24 * 30  # 30 days
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
-    if isinstance(token, bytes):
-        token = token.decode('utf-8')
-    return token
+    signing_input = JWT_HEADER_B64 + b'.' + base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b'=')
+    mac = jwt_hmac.copy()
+    mac.update(signing_input)
+    signature = base64.urlsafe_b64encode(mac.digest()).rstrip(b'=')
+    return (signing_input + b'.' + signature).decode('ascii')
 
+class InvalidTokenError(Exception):
+    """License token is malformed or its signature does not match"""
+
+class ExpiredTokenError(InvalidTokenError):
+    """License token is past its exp claim"""
+
+def _b64url_decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+def verify_license_token(token: str) -> dict:
+    """Verify an HS256 license token against JWT_SECRET and return its claims"""
+    try:
+        signing_input, signature = token.encode('ascii').rsplit(b'.', 1)
+        header_b64, payload_b64 = signing_input.split(b'.')
+        # Tokens minted here share one header; anything else must still be HS256
+        if header_b64 != JWT_HEADER_B64 and orjson.loads(_b64url_decode(header_b64)).get('alg') != 'HS256':
+            raise InvalidTokenError('Unsupported algorithm')
+        mac = jwt_hmac.copy()
+        mac.update(signing_input)
+        if not hmac.compare_digest(base64.urlsafe_b64encode(mac.digest()).rstrip(b'='), signature):
+            raise InvalidTokenError('Signature verification failed')
+        claims = orjson.loads(_b64url_decode(payload_b64))
+    except (ValueError, AttributeError, UnicodeError) as e:
+        raise InvalidTokenError(str(e)) from e
+    if not isinstance(claims, dict):
+        raise InvalidTokenError('Invalid payload')
+    
+    now = time.time()
+    if 'exp' in claims and claims['exp'] <= now:
+        raise ExpiredTokenError('Token expired')
+    if 'nbf' in claims and claims['nbf'] > now:
+        raise InvalidTokenError('Token not yet valid')
+    return claims
+
+
+# Decoded license claims keyed by token digest, so repeat checks skip HMAC + JSON parsing
+jwt_cache = TTLCache(maxsize=10000, ttl=30)
+jwt_cache_lock = threading.Lock()
+
+def verify_jwt_cached(token):
+    """Decode a license token, reusing recently verified claims until they expire"""
+    key = hashlib.sha256(token.encode()).digest()[:16]
+    with jwt_cache_lock:
+        claims = jwt_cache.get(key)
+    if claims is not None:
+        if claims.get('exp', 0) > time.time():
+            return claims
+        with jwt_cache_lock:
+            jwt_cache.pop(key, None)
+    
+    # Raises ExpiredTokenError / InvalidTokenError for the caller to map
+    claims = verify_license_token(token)
+    with jwt_cache_lock:
+        jwt_cache[key] = claims
+    return claims
 
 @app.route('/api/licenses/verify', methods=['GET'])
 def verify_license():
     """Verify license token validity"""
     token = request.args.get('token') or _extract_bearer_token(request.headers.get('Authorization', ''))
     if not token:
-        return jsonify({'valid': False, 'error': 'Missing token'}), 400
+        return json_body_response(LICENSE_MISSING_TOKEN_BODY, 400)
     try:
-        claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return jsonify({'valid': True, 'claims': claims})
-    except jwt.ExpiredSignatureError:
-        return jsonify({'valid': False, 'error': 'Token expired'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'valid': False, 'error': 'Invalid token'}), 401
+        claims = verify_jwt_cached(token)
+        return ojsonify({'valid': True, 'claims': claims})
+    except ExpiredTokenError:
+        return json_body_response(LICENSE_EXPIRED_BODY, 401)
+    except InvalidTokenError:
+        return json_body_response(LICENSE_INVALID_BODY, 401)
 
 
 def _extract_bearer_token(auth_header: str) -> str:
@@ -511,10 +1073,10 @@ def _extract_bearer_token(auth_header: str) -> str:
     return ''
 
 
-ALLOWED_DOWNLOADS = {
-    'SRPK Pro Starter': ['srpk-starter.zip'],
-    'SRPK Pro Professional': ['srpk-professional.zip']
-}
+ALLOWED_DOWNLOADS = MappingProxyType({
+    'SRPK Pro Starter': frozenset({'srpk-starter.zip'}),
+    'SRPK Pro Professional': frozenset({'srpk-professional.zip'})
+})
 
 
 @app.route('/api/downloads', methods=['GET'])
@@ -523,45 +1085,40 @@ def secure_download():
     token = request.args.get('token') or _extract_bearer_token(request.headers.get('Authorization', ''))
     filename = request.args.get('file')
     if not token or not filename:
-        return jsonify({'success': False, 'error': 'Missing token or file parameter'}), 400
+        return json_body_response(DOWNLOAD_MISSING_PARAMS_BODY, 400)
     try:
-        claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        claims = verify_jwt_cached(token)
         product = claims.get('product')
-        allowed = ALLOWED_DOWNLOADS.get(product, [])
+        allowed = ALLOWED_DOWNLOADS.get(product, frozenset())
         if filename not in allowed:
-            return jsonify({'success': False, 'error': 'File not allowed for this license'}), 403
-        downloads_dir = os.getenv('DOWNLOADS_DIR', os.path.join(os.getcwd(), 'downloads'))
-        return send_from_directory(directory=downloads_dir, path=filename, as_attachment=True)
-    except jwt.ExpiredSignatureError:
-        return jsonify({'success': False, 'error': 'Token expired'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'success': False, 'error': 'Invalid token'}), 401
- main
+            return json_body_response(DOWNLOAD_NOT_ALLOWED_BODY, 403)
+        if DOWNLOADS_ACCEL_PREFIX:
+            resp = Response(status=200)
+            resp.headers['X-Accel-Redirect'] = f"{DOWNLOADS_ACCEL_PREFIX.rstrip('/')}/{filename}"
+            resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return resp
+        return send_from_directory(directory=DOWNLOADS_DIR, path=filename, as_attachment=True)
+    except ExpiredTokenError:
+        return json_body_response(DOWNLOAD_TOKEN_EXPIRED_BODY, 401)
+    except InvalidTokenError:
+        return json_body_response(DOWNLOAD_INVALID_TOKEN_BODY, 401)
 
 def generate_license_key(customer_id, subscription_id):
     """Generate a unique license key"""
-    import hashlib
-    import time
-    
-    # Create a unique string based on customer and subscription
-    unique_string = f"{customer_id}-{subscription_id}-{time.time()}"
-    
-    # Generate hash
-    hash_object = hashlib.sha256(unique_string.encode())
-    hex_dig = hash_object.hexdigest()
+    # 64 bits straight from the CSPRNG; the IDs are kept in the signature for callers
+    hex_dig = secrets.token_hex(8).upper()
     
     # Format as license key (e.g., XXXX-XXXX-XXXX-XXXX)
-    license_key = '-'.join([hex_dig[i:i+4].upper() for i in range(0, 16, 4)])
-    
-    return license_key
+    return f"{hex_dig[0:4]}-{hex_dig[4:8]}-{hex_dig[8:12]}-{hex_dig[12:16]}"
 
+@celery.task(queue='emails')
 def send_license_email(email, name, license_key, product_name):
-    """Send license key via email"""
+    """Send license key via email from a background worker"""
     # This is a placeholder - implement based on your email service
     # Options: SendGrid, AWS SES, Mailgun, etc.
-    logger.info(f"Would send license email to {email}")
-    logger.info(f"License Key: {license_key}")
-    logger.info(f"Product: {product_name}")
+    logger.info("Would send license email to %s", email)
+    logger.info("License Key: %s", license_key)
+    logger.info("Product: %s", product_name)
     
     # Example implementation with SendGrid:
     # import sendgrid
@@ -580,6 +1137,12 @@ def send_license_email(email, name, license_key, product_name):
     # )
     # sg.send(message)
 
+@celery.task(queue='emails')
+def send_license_batch_email(email, name, license_keys, product_name):
+    """Send every seat license of a multi-seat purchase in one email"""
+    # This is a placeholder - implement based on your email service
+    logger.info("Would send %s license keys to %s", len(license_keys), email)
+    logger.info("Product: %s", product_name)
+
 if __name__ == '__main__':
-    port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_ENV') == 'development')
\ No newline at end of file
+    app.run(host='0.0.0.0', port=PORT, debug=os.getenv('FLASK_ENV') == 'development')
\ No newline at end of file
@@ -15,9 +15,11 @@ Versión 3.1 - Cambios:
 
 import ast
 import re
+import fnmatch
 import logging
 import hashlib
 import json
+import math
 import os
 import sys
 import time
@@ -25,27 +27,34 @@ import torch
 import torch.nn as nn
 from torch.nn import functional as F
 import numpy as np
-from collections import defaultdict, OrderedDict, Counter
+from collections import defaultdict, OrderedDict, Counter, deque
 import subprocess
 import tempfile
 import importlib.util
 from typing import Dict, List, Tuple, Optional, Any, Set, Union
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, fields, asdict
 from enum import Enum
 import warnings
 import traceback
 import psutil
 import gc
+import copy
 from pathlib import Path
 import pickle
+import mmap
 import gzip
 import shutil
 from datetime import datetime, timedelta
 import html
 import base64
 import threading
-import queue
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import atexit
+import bisect
+import struct
+from itertools import accumulate
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, as_completed,
+                                TimeoutError as FutureTimeoutError)
+from functools import lru_cache
 
 # Intentar importar librerías opcionales
 try:
@@ -73,6 +82,48 @@ try:
 except ImportError:
     PYTEST_AVAILABLE = False
 
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
+
+try:
+    import zstandard as zstd
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from isal import igzip
+    ISAL_AVAILABLE = True
+except ImportError:
+    ISAL_AVAILABLE = False
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 try:
     import plotly.graph_objects as go
     import plotly.offline as pyo
@@ -99,6 +150,7 @@ DEFAULT_CONFIG = {
         "max_workers": 4
     },
     "metrics": {
+        "cache_entries": 2048,
         "complexity": {
             "cyclomatic_threshold": 10,
             "cognitive_threshold": 15,
@@ -149,6 +201,9 @@ DEFAULT_CONFIG = {
         "model_type": "semantic",  # semantic, syntactic, or hybrid
         "vector_size": 768,
         "use_cache": True,
+        "cache_entries": 1024,
+        "precision": "auto",  # auto, float32, bfloat16 o float16
+        "storage_dtype": "float16",  # float16 o float32
         "batch_size": 32,
         "max_sequence_length": 512,
         "similarity_threshold": 0.85
@@ -159,7 +214,8 @@ DEFAULT_CONFIG = {
         "max_age_days": 30,
         "max_size_mb": 500,
         "compression": True,
-        "compression_level": 6
+        "compression_level": 6,
+        "secure_keys": False
     },
     "reporting": {
         "formats": ["json", "html", "markdown"],
@@ -178,10 +234,22 @@ DEFAULT_CONFIG = {
     }
 }
 
+# Configuración por defecto serializada una vez; json.loads produce copias profundas en C
+_DEFAULT_CONFIG_JSON = json.dumps(DEFAULT_CONFIG)
+
 # =====================================================================
 # SISTEMA DE CONFIGURACIÓN MEJORADO
 # =====================================================================
 
+# Caché negativa de proceso: directorios (cwd) sin archivo de configuración y cuándo se comprobó
+_MISSING_CONFIG_DIRS: Dict[str, float] = {}
+_MISSING_CONFIG_TTL = 5.0
+
+@lru_cache(maxsize=256)
+def _split_key_path(key_path: str) -> Tuple[str, ...]:
+    """Divide una ruta con puntos en claves, una sola vez por ruta."""
+    return tuple(key_path.split('.'))
+
 class ConfigurationManager:
     """Gestor de configuración con soporte para múltiples formatos y validación."""
     
@@ -196,8 +264,11 @@ class ConfigurationManager:
     ]
     
     def __init__(self, config_path: Optional[str] = None):
-        self.config = self._deep_copy(DEFAULT_CONFIG)
+        self.config = json.loads(_DEFAULT_CONFIG_JSON)
         self.config_file_path = None
+        # Valores ya resueltos por get(); válidos mientras self.config no cambie
+        self._lookup_cache = {}
+        self._lookup_config = self.config
         self.validators = self._setup_validators()
         
         if config_path:
@@ -205,14 +276,6 @@ class ConfigurationManager:
         else:
             self._auto_discover_config()
     
-    def _deep_copy(self, obj):
-        """Copia profunda de diccionarios anidados."""
-        if isinstance(obj, dict):
-            return {k: self._deep_copy(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._deep_copy(i) for i in obj]
-        return obj
-    
     def _setup_validators(self) -> Dict[str, callable]:
         """Configura validadores para opciones de configuración."""
         return {
@@ -223,13 +286,33 @@ class ConfigurationManager:
             'cache.max_size_mb': lambda v: v > 0 and v <= 10000,
             'cache.compression_level': lambda v: v >= 1 and v <= 9,
             'embedding.vector_size': lambda v: v in [128, 256, 384, 512, 768, 1024],
-            'embedding.batch_size': lambda v: v > 0 and v <= 128
+            'embedding.batch_size': lambda v: v > 0 and v <= 128,
+            'embedding.storage_dtype': lambda v: v in ['float16', 'float32']
         }
     
     def _auto_discover_config(self):
         """Busca automáticamente archivos de configuración."""
+        # Si otra instancia acaba de comprobar este directorio sin éxito, no volver a listarlo
+        cwd = os.getcwd()
+        now = time.monotonic()
+        checked_at = _MISSING_CONFIG_DIRS.get(cwd)
+        if checked_at is not None and now - checked_at < _MISSING_CONFIG_TTL:
+            return
+        
+        # Un solo listado del directorio en lugar de un stat por candidato
+        try:
+            with os.scandir('.') as entries:
+                names = {e.name for e in entries if e.is_file()}
+        except OSError:
+            names = set()
+        
+        if names.isdisjoint(self.CONFIG_FILENAMES):
+            _MISSING_CONFIG_DIRS[cwd] = now
+            return
+        _MISSING_CONFIG_DIRS.pop(cwd, None)
+        
         for filename in self.CONFIG_FILENAMES:
-            if os.path.exists(filename):
+            if filename in names:
                 try:
                     self.load_config(filename)
                     logging.info(f"Configuration loaded from {filename}")
@@ -257,22 +340,25 @@ class ConfigurationManager:
             
             # Merge con configuración default
             self._merge_config(self.config, user_config)
+            self._lookup_cache.clear()
             
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in configuration file {path}: {e}")
         except Exception as e:
             raise ValueError(f"Error loading configuration from {path}: {e}")
     
-    def _validate_config(self, config: dict, path: str = ""):
+    def _validate_config(self, config: dict):
         """Valida la configuración contra los validadores definidos."""
-        for key, value in config.items():
-            current_path = f"{path}.{key}" if path else key
-            
-            if isinstance(value, dict):
-                self._validate_config(value, current_path)
-            elif current_path in self.validators:
-                if not self.validators[current_path](value):
-                    raise ValueError(f"Invalid value for {current_path}: {value}")
+        # Se recorren solo las rutas con validador en lugar de todo el árbol del usuario
+        for key_path, validator in self.validators.items():
+            value = config
+            for key in _split_key_path(key_path):
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                if not isinstance(value, dict) and not validator(value):
+                    raise ValueError(f"Invalid value for {key_path}: {value}")
     
     def _merge_config(self, base: dict, override: dict):
         """Fusiona configuración usuario con la base de forma segura."""
@@ -296,15 +382,24 @@ class ConfigurationManager:
     
     def get(self, key_path: str, default=None):
         """Obtiene un valor de configuración usando notación de puntos."""
-        keys = key_path.split('.')
-        value = self.config
+        # self.config puede reemplazarse entero (p. ej. al cargar estado)
+        if self._lookup_config is not self.config:
+            self._lookup_cache.clear()
+            self._lookup_config = self.config
+        
+        try:
+            return self._lookup_cache[key_path]
+        except KeyError:
+            pass
         
-        for key in keys:
+        value = self.config
+        for key in _split_key_path(key_path):
             if isinstance(value, dict) and key in value:
                 value = value[key]
             else:
                 return default
         
+        self._lookup_cache[key_path] = value
         return value
     
     def set(self, key_path: str, value):
@@ -323,15 +418,45 @@ class ConfigurationManager:
             target = target[key]
         
         target[keys[-1]] = value
+        self._lookup_cache.clear()
 
 # =====================================================================
 # SISTEMA DE CACHÉ MEJORADO
 # =====================================================================
 
+# Errores de lectura que indican un archivo de caché dañado
+CORRUPT_CACHE_ERRORS = (pickle.PickleError, EOFError, gzip.BadGzipFile)
+if ZSTD_AVAILABLE:
+    CORRUPT_CACHE_ERRORS += (zstd.ZstdError,)
+
+if MSGSPEC_AVAILABLE:
+    CORRUPT_CACHE_ERRORS += (msgspec.DecodeError,)
+    
+    class CacheEnvelope(msgspec.Struct, array_like=True):
+        """Entrada de caché serializada con msgpack."""
+        value: Any
+        timestamp: float
+        file_hash: Optional[str]
+        version: str
+    
+    def _encode_numpy(obj):
+        """Convierte tipos de NumPy a tipos nativos para msgpack."""
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise NotImplementedError(f"Cannot cache objects of type {type(obj)}")
+    
+    _cache_encoder = msgspec.msgpack.Encoder(enc_hook=_encode_numpy)
+
 class CacheManager:
     """Sistema de caché inteligente con límites de tamaño y limpieza automática."""
     
-    def __init__(self, config: ConfigurationManager):
+    TOUCH_FLUSH_SECONDS = 30.0
+    
+    def __init__(self, config: ConfigurationManager, scan: bool = True):
+        """scan=False omite el recorrido inicial del directorio; las entradas se
+        incorporan al índice según se leen."""
         self.config = config
         self.cache_dir = Path(config.get('cache.directory', '.srpk_cache'))
         self.enabled = config.get('cache.enabled', True)
@@ -339,59 +464,162 @@ class CacheManager:
         self.compression_level = config.get('cache.compression_level', 6)
         self.max_age_days = config.get('cache.max_age_days', 30)
         self.max_size_mb = config.get('cache.max_size_mb', 500)
+        self.secure_keys = config.get('cache.secure_keys', False)
+        
+        # Índice LRU en memoria (ruta -> tamaño), del más antiguo al más reciente;
+        # evita recorrer el directorio en cada escritura
+        self._index: "OrderedDict[Path, int]" = OrderedDict()
+        self._total_size = 0
+        self._index_lock = threading.Lock()
+        
+        # Accesos pendientes de reflejar en el mtime; se vuelcan en bloque cada
+        # TOUCH_FLUSH_SECONDS y al salir en lugar de un utime por lectura
+        self._pending_touches: Dict[Path, float] = {}
+        self._last_touch_flush = time.monotonic()
         
         if self.enabled:
+            atexit.register(self.flush_touches)
             self.cache_dir.mkdir(exist_ok=True)
-            self._cleanup_old_cache()
-            self._enforce_size_limit()
+            if scan:
+                self._cleanup_old_cache()
+                self._enforce_size_limit()
     
     def _get_cache_path(self, key: str) -> Path:
         """Genera la ruta de caché para una clave."""
-        hash_key = hashlib.sha256(key.encode()).hexdigest()
-        extension = '.pkl.gz' if self.compression else '.pkl'
-        return self.cache_dir / f"{hash_key[:8]}_{hash_key[-8:]}{extension}"
+        # La clave solo nombra un archivo; SHA-256 queda para cache.secure_keys
+        if self.secure_keys:
+            hash_key = hashlib.sha256(key.encode()).hexdigest()
+        elif XXHASH_AVAILABLE:
+            hash_key = xxhash.xxh3_128_hexdigest(key.encode())
+        else:
+            hash_key = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        extension = '.mpk' if MSGSPEC_AVAILABLE else '.pkl'
+        if self.compression:
+            extension += '.zst' if ZSTD_AVAILABLE else '.gz'
+        # 256 subdirectorios por prefijo, como el almacén de objetos de git
+        return self.cache_dir / hash_key[:2] / f"{hash_key[:8]}_{hash_key[-8:]}{extension}"
+    
+    def _open_cache_file(self, path: Path, mode: str):
+        """Abre un archivo de caché con el compresor que indica su extensión."""
+        if path.suffix == '.zst':
+            if 'w' in mode:
+                return zstd.open(path, mode, cctx=zstd.ZstdCompressor(level=self.compression_level))
+            return zstd.open(path, mode)
+        if path.suffix == '.gz':
+            if 'w' in mode:
+                return gzip.open(path, mode, compresslevel=self.compression_level)
+            return gzip.open(path, mode)
+        return open(path, mode)
+    
+    def _iter_cache_files(self):
+        """Recorre los archivos de caché de todos los subdirectorios como (Path, DirEntry)."""
+        # Un scandir por directorio: el tipo de cada entrada viene del propio
+        # listado, sin stat; también alcanza archivos planos de versiones anteriores
+        with os.scandir(self.cache_dir) as top:
+            for entry in top:
+                if entry.is_dir(follow_symlinks=False):
+                    shard = self.cache_dir / entry.name
+                    with os.scandir(entry.path) as files:
+                        for cache_entry in files:
+                            if cache_entry.is_file(follow_symlinks=False):
+                                yield shard / cache_entry.name, cache_entry
+                elif entry.is_file(follow_symlinks=False) and '.' in entry.name:
+                    yield self.cache_dir / entry.name, entry
+    
+    def _read_entry(self, path: Path) -> Tuple[Optional[str], Any]:
+        """Lee una entrada de caché y devuelve (file_hash, value)."""
+        with self._open_cache_file(path, 'rb') as f:
+            if '.mpk' in path.suffixes:
+                envelope = msgspec.msgpack.decode(f.read(), type=CacheEnvelope)
+                return envelope.file_hash, envelope.value
+            data = pickle.load(f)
+        return data.get('file_hash'), data.get('value')
+    
+    def _write_entry(self, path: Path, value: Any, file_hash: Optional[str]):
+        """Escribe una entrada de caché en el formato que indica su extensión."""
+        with self._open_cache_file(path, 'wb') as f:
+            if '.mpk' in path.suffixes:
+                f.write(_cache_encoder.encode(CacheEnvelope(value, time.time(), file_hash, '3.1')))
+                return
+            pickle.dump({
+                'value': value,
+                'timestamp': time.time(),
+                'file_hash': file_hash,
+                'version': '3.1'
+            }, f)
     
     def _cleanup_old_cache(self):
-        """Limpia archivos de caché antiguos."""
+        """Limpia archivos de caché antiguos y construye el índice LRU."""
         if not self.enabled or not self.cache_dir.exists():
             return
         
         current_time = time.time()
         max_age_seconds = self.max_age_days * 86400
+        entries = []
         
-        for cache_file in self.cache_dir.glob('*.pkl*'):
+        # Un único stat por archivo al arrancar; después el índice es la referencia
+        for cache_file, entry in self._iter_cache_files():
             try:
-                if current_time - cache_file.stat().st_mtime > max_age_seconds:
+                stat = entry.stat(follow_symlinks=False)
+                if current_time - stat.st_mtime > max_age_seconds:
                     cache_file.unlink()
                     logging.debug(f"Removed old cache file: {cache_file}")
+                else:
+                    entries.append((stat.st_mtime, cache_file, stat.st_size))
             except Exception as e:
                 logging.warning(f"Failed to remove cache file {cache_file}: {e}")
+        
+        entries.sort(key=lambda entry: entry[0])
+        with self._index_lock:
+            self._index = OrderedDict((path, size) for _, path, size in entries)
+            self._total_size = sum(self._index.values())
+    
+    def _track(self, path: Path, size: int):
+        """Registra (o refresca) una entrada como la más reciente del índice."""
+        with self._index_lock:
+            self._total_size += size - self._index.pop(path, 0)
+            self._index[path] = size
+    
+    def _forget(self, path: Path):
+        """Quita una entrada del índice."""
+        with self._index_lock:
+            self._total_size -= self._index.pop(path, 0)
+            self._pending_touches.pop(path, None)
+    
+    def flush_touches(self):
+        """Vuelca a disco los tiempos de acceso pendientes (usados al reconstruir el índice)."""
+        with self._index_lock:
+            pending, self._pending_touches = self._pending_touches, {}
+            self._last_touch_flush = time.monotonic()
+        
+        for path, accessed_at in pending.items():
+            try:
+                os.utime(path, (accessed_at, accessed_at))
+            except OSError:
+                pass
     
     def _enforce_size_limit(self):
         """Aplica límite de tamaño al caché."""
-        if not self.enabled or not self.cache_dir.exists():
+        if not self.enabled:
             return
         
-        total_size = sum(f.stat().st_size for f in self.cache_dir.glob('*.pkl*'))
         max_size_bytes = self.max_size_mb * 1024 * 1024
         
-        if total_size > max_size_bytes:
-            # Eliminar archivos más antiguos hasta estar bajo el límite
-            files = sorted(
-                self.cache_dir.glob('*.pkl*'),
-                key=lambda f: f.stat().st_mtime
-            )
-            
-            for file in files:
-                if total_size <= max_size_bytes:
-                    break
-                try:
-                    file_size = file.stat().st_size
-                    file.unlink()
-                    total_size -= file_size
-                    logging.debug(f"Removed cache file to enforce size limit: {file}")
-                except Exception as e:
-                    logging.warning(f"Failed to remove cache file {file}: {e}")
+        # Eliminar las entradas menos usadas hasta estar bajo el límite
+        while True:
+            with self._index_lock:
+                if self._total_size <= max_size_bytes or not self._index:
+                    return
+                file, file_size = self._index.popitem(last=False)
+                self._total_size -= file_size
+                self._pending_touches.pop(file, None)
+            try:
+                file.unlink()
+                logging.debug(f"Removed cache file to enforce size limit: {file}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"Failed to remove cache file {file}: {e}")
     
     def get(self, key: str, file_hash: Optional[str] = None) -> Optional[Any]:
         """Obtiene un valor del caché con validación."""
@@ -400,35 +628,49 @@ class CacheManager:
         
         cache_path = self._get_cache_path(key)
         
-        if not cache_path.exists():
-            return None
+        if cache_path not in self._index:
+            # Entradas escritas por otros procesos (workers, otras instancias) no están en
+            # el índice de este: se comprueba en disco y se incorporan
+            try:
+                size = cache_path.stat().st_size
+            except OSError:
+                return None
+            self._track(cache_path, size)
+            self._enforce_size_limit()
         
         try:
-            if self.compression:
-                with gzip.open(cache_path, 'rb') as f:
-                    data = pickle.load(f)
-            else:
-                with open(cache_path, 'rb') as f:
-                    data = pickle.load(f)
+            stored_hash, value = self._read_entry(cache_path)
             
             # Verificar hash si se proporciona
-            if file_hash and data.get('file_hash') != file_hash:
+            if file_hash and stored_hash != file_hash:
                 logging.debug(f"Cache miss due to hash mismatch for {key}")
                 cache_path.unlink()  # Eliminar entrada inválida
+                self._forget(cache_path)
                 return None
             
-            # Actualizar tiempo de acceso
-            cache_path.touch()
+            # Actualizar tiempo de acceso: el orden LRU vive en memoria y el mtime se difiere
+            with self._index_lock:
+                if cache_path in self._index:
+                    self._index.move_to_end(cache_path)
+                    self._pending_touches[cache_path] = time.time()
+                flush_due = time.monotonic() - self._last_touch_flush >= self.TOUCH_FLUSH_SECONDS
+            if flush_due:
+                self.flush_touches()
             
             logging.debug(f"Cache hit for {key}")
-            return data.get('value')
+            return value
         
-        except (pickle.PickleError, EOFError, gzip.BadGzipFile) as e:
+        except CORRUPT_CACHE_ERRORS as e:
             logging.warning(f"Corrupted cache file for {key}: {e}")
             try:
                 cache_path.unlink()
             except:
                 pass
+            self._forget(cache_path)
+            return None
+        except FileNotFoundError:
+            # Borrado fuera de este proceso
+            self._forget(cache_path)
             return None
         except Exception as e:
             logging.warning(f"Failed to load cache for {key}: {e}")
@@ -441,24 +683,14 @@ class CacheManager:
         
         cache_path = self._get_cache_path(key)
         
-        data = {
-            'value': value,
-            'timestamp': time.time(),
-            'file_hash': file_hash,
-            'version': '3.1'
-        }
-        
         try:
-            if self.compression:
-                with gzip.open(cache_path, 'wb', compresslevel=self.compression_level) as f:
-                    pickle.dump(data, f)
-            else:
-                with open(cache_path, 'wb') as f:
-                    pickle.dump(data, f)
+            cache_path.parent.mkdir(exist_ok=True)
+            self._write_entry(cache_path, value, file_hash)
             
             logging.debug(f"Cached data for {key}")
             
             # Verificar límite de tamaño después de agregar
+            self._track(cache_path, cache_path.stat().st_size)
             self._enforce_size_limit()
         
         except Exception as e:
@@ -468,8 +700,21 @@ class CacheManager:
         """Limpia todo el caché de forma segura."""
         if self.cache_dir.exists():
             try:
-                shutil.rmtree(self.cache_dir)
-                self.cache_dir.mkdir(exist_ok=True)
+                # Renombrar es atómico: los lectores ven un caché vacío al instante y
+                # el borrado del árbol antiguo se hace en segundo plano
+                old_dir = self.cache_dir.with_name(
+                    f"{self.cache_dir.name}.old.{os.getpid()}.{time.time_ns()}"
+                )
+                with self._index_lock:
+                    os.rename(self.cache_dir, old_dir)
+                    self.cache_dir.mkdir(exist_ok=True)
+                    self._index.clear()
+                    self._pending_touches.clear()
+                    self._total_size = 0
+                threading.Thread(
+                    target=shutil.rmtree, args=(old_dir,), kwargs={'ignore_errors': True},
+                    name='srpk-cache-clear', daemon=True
+                ).start()
                 logging.info("Cache cleared successfully")
             except Exception as e:
                 logging.error(f"Failed to clear cache: {e}")
@@ -479,13 +724,14 @@ class CacheManager:
         if not self.cache_dir.exists():
             return {'enabled': False, 'files': 0, 'size_mb': 0}
         
-        files = list(self.cache_dir.glob('*.pkl*'))
-        total_size = sum(f.stat().st_size for f in files)
+        with self._index_lock:
+            file_count = len(self._index)
+            total_size = self._total_size
         
         return {
             'enabled': self.enabled,
             'directory': str(self.cache_dir),
-            'files': len(files),
+            'files': file_count,
             'size_mb': total_size / (1024 * 1024),
             'max_size_mb': self.max_size_mb,
             'compression': self.compression
@@ -527,9 +773,24 @@ class ErrorReport:
     def to_dict(self):
         return asdict(self)
 
+# Hilo compartido para parsear archivos grandes con timeout, sin crear uno por archivo
+_PARSE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='srpk-parse')
+
 class RobustAnalyzer:
     """Analizador robusto con manejo de errores avanzado y recuperación."""
     
+    # Por debajo de este tamaño el parseo es directo, sin hilo ni timeout
+    DIRECT_PARSE_MAX_CHARS = 256 * 1024
+    
+    # Muestreo de memoria: como mucho cada MEMORY_CHECK_INTERVAL segundos o cada
+    # MEMORY_CHECK_EVERY archivos, en lugar de leer /proc en cada archivo
+    MEMORY_CHECK_INTERVAL = 0.1
+    MEMORY_CHECK_EVERY = 32
+    
+    # Máximo de líneas que se comentan al recuperar un archivo con errores de sintaxis
+    MAX_SYNTAX_RECOVERY_ATTEMPTS = 100
+    SKIPPED_LINE_MARK = " skipped due to syntax error\n"
+    
     def __init__(self, config: ConfigurationManager):
         self.config = config
         self.errors: List[ErrorReport] = []
@@ -541,10 +802,21 @@ class RobustAnalyzer:
             'UnicodeDecodeError': self._recover_from_encoding_error,
             'MemoryError': self._recover_from_memory_error
         }
+        self._process = psutil.Process()
+        self._last_memory_check = 0.0
+        self._skipped_memory_checks = 0
     
     def check_memory_usage(self):
         """Verifica el uso de memoria con threshold dinámico."""
-        process = psutil.Process()
+        now = time.monotonic()
+        if (now - self._last_memory_check < self.MEMORY_CHECK_INTERVAL
+                and self._skipped_memory_checks < self.MEMORY_CHECK_EVERY):
+            self._skipped_memory_checks += 1
+            return
+        self._last_memory_check = now
+        self._skipped_memory_checks = 0
+        
+        process = self._process
         memory_gb = process.memory_info().rss / (1024 ** 3)
         
         # Threshold dinámico basado en memoria disponible
@@ -563,42 +835,50 @@ class RobustAnalyzer:
     def analyze_file_safe(self, file_path: str) -> Optional[Tuple[ast.AST, str]]:
         """Analiza un archivo con manejo robusto de errores y recuperación."""
         try:
-            # Verificar tamaño del archivo
-            file_size_mb = os.path.getsize(file_path) / (1024 ** 2)
-            if file_size_mb > self.max_file_size_mb:
-                self.errors.append(ErrorReport(
-                    file_path=file_path,
-                    error_type="FileSizeError",
-                    error_message=f"File too large ({file_size_mb:.2f}MB > {self.max_file_size_mb}MB)",
-                    severity="warning"
-                ))
-                return None
-            
-            # Verificar memoria antes de procesar
-            self.check_memory_usage()
+            # Leer una sola vez y probar los encodings sobre los bytes en memoria;
+            # el tamaño sale del descriptor ya abierto, sin un stat aparte
+            with open(file_path, 'rb') as f:
+                # Verificar tamaño del archivo
+                file_size_mb = os.fstat(f.fileno()).st_size / (1024 ** 2)
+                if file_size_mb > self.max_file_size_mb:
+                    self.errors.append(ErrorReport(
+                        file_path=file_path,
+                        error_type="FileSizeError",
+                        error_message=f"File too large ({file_size_mb:.2f}MB > {self.max_file_size_mb}MB)",
+                        severity="warning"
+                    ))
+                    return None
+                
+                # Verificar memoria antes de procesar
+                self.check_memory_usage()
+                
+                raw = f.read()
             
-            # Intentar múltiples encodings
-            encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
+            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
             content = None
             
             for encoding in encodings:
                 try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
+                    content = raw.decode(encoding)
                     break
                 except UnicodeDecodeError:
                     continue
             
             if content is None:
                 # Último intento con errores ignorados
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-                    self.errors.append(ErrorReport(
-                        file_path=file_path,
-                        error_type="EncodingWarning",
-                        error_message="File read with errors replaced",
-                        severity="warning"
-                    ))
+                content = raw.decode('utf-8', errors='replace')
+                self.errors.append(ErrorReport(
+                    file_path=file_path,
+                    error_type="EncodingWarning",
+                    error_message="File read with errors replaced",
+                    severity="warning"
+                ))
+            
+            # Equivalente a utf-8-sig y a los saltos de línea universales del modo texto
+            if content.startswith('\ufeff'):
+                content = content[1:]
+            if '\r' in content:
+                content = content.replace('\r\n', '\n').replace('\r', '\n')
             
             # Parsear con timeout
             tree = self._parse_with_timeout(content, file_path)
@@ -638,39 +918,22 @@ class RobustAnalyzer:
     
     def _parse_with_timeout(self, content: str, file_path: str) -> Optional[ast.AST]:
         """Parsea código con timeout."""
-        result_queue = queue.Queue()
-        
-        def parse_worker():
-            try:
-                tree = ast.parse(content, filename=file_path)
-                result_queue.put(('success', tree))
-            except SyntaxError as e:
-                result_queue.put(('error', e))
-            except Exception as e:
-                result_queue.put(('error', e))
-        
-        thread = threading.Thread(target=parse_worker)
-        thread.daemon = True
-        thread.start()
-        thread.join(timeout=self.timeout_seconds)
-        
-        if thread.is_alive():
-            self.errors.append(ErrorReport(
-                file_path=file_path,
-                error_type="TimeoutError",
-                error_message=f"Parsing timeout after {self.timeout_seconds} seconds",
-                severity="error"
-            ))
-            return None
-        
         try:
-            status, result = result_queue.get_nowait()
-            if status == 'success':
-                return result
-            else:
-                raise result
-        except queue.Empty:
-            return None
+            # Archivos pequeños se parsean directamente: lanzar un hilo cuesta más que el parseo
+            if len(content) < self.DIRECT_PARSE_MAX_CHARS:
+                return ast.parse(content, filename=file_path)
+            
+            future = _PARSE_EXECUTOR.submit(ast.parse, content, filename=file_path)
+            try:
+                return future.result(timeout=self.timeout_seconds)
+            except FutureTimeoutError:
+                self.errors.append(ErrorReport(
+                    file_path=file_path,
+                    error_type="TimeoutError",
+                    error_message=f"Parsing timeout after {self.timeout_seconds} seconds",
+                    severity="error"
+                ))
+                return None
         except SyntaxError as e:
             self.errors.append(ErrorReport(
                 file_path=file_path,
@@ -685,24 +948,28 @@ class RobustAnalyzer:
     
     def _recover_from_syntax_error(self, file_path: str, error: Exception) -> Optional[Tuple]:
         """Intenta recuperarse de errores de sintaxis."""
-        # Intentar parsear parcialmente línea por línea
+        # Comentar solo la línea que indica cada SyntaxError y volver a parsear:
+        # un parseo por error en lugar de uno por línea del archivo
         with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
             lines = f.readlines()
         
-        valid_lines = []
-        for i, line in enumerate(lines, 1):
+        for _ in range(self.MAX_SYNTAX_RECOVERY_ATTEMPTS):
+            partial_content = ''.join(lines)
             try:
-                ast.parse(line)
-                valid_lines.append(line)
-            except SyntaxError:
-                valid_lines.append(f"# Line {i} skipped due to syntax error\n")
+                tree = ast.parse(partial_content)
+                return tree, partial_content
+            except SyntaxError as e:
+                lineno = e.lineno
+                if not lineno or lineno > len(lines) or lines[lineno - 1].endswith(self.SKIPPED_LINE_MARK):
+                    return None
+                # Conservar la indentación con un pass para no vaciar el bloque que lo contiene
+                line = lines[lineno - 1]
+                indent = line[:len(line) - len(line.lstrip())]
+                lines[lineno - 1] = f"{indent}pass  # Line {lineno}{self.SKIPPED_LINE_MARK}"
+            except Exception:
+                return None
         
-        partial_content = ''.join(valid_lines)
-        try:
-            tree = ast.parse(partial_content)
-            return tree, partial_content
-        except:
-            return None
+        return None
     
     def _recover_from_encoding_error(self, file_path: str, error: Exception) -> Optional[Tuple]:
         """Intenta recuperarse de errores de encoding."""
@@ -759,15 +1026,77 @@ class RobustAnalyzer:
 # SISTEMA DE EMBEDDINGS MEJORADO
 # =====================================================================
 
+def _visit_children(visit, node: ast.AST):
+    """Visita los hijos de un nodo sin los generadores de ast.iter_fields."""
+    for name in node._fields:
+        value = getattr(node, name, None)
+        if value.__class__ is list:
+            for item in value:
+                if isinstance(item, ast.AST):
+                    visit(item)
+        elif isinstance(value, ast.AST):
+            visit(value)
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _cosine_similarity(a, b):
+        """Similitud coseno con producto y normas fusionados en un solo bucle compilado."""
+        dot = 0.0
+        norm_a = 0.0
+        norm_b = 0.0
+        for i in range(a.shape[0]):
+            dot += a[i] * b[i]
+            norm_a += a[i] * a[i]
+            norm_b += b[i] * b[i]
+        if norm_a == 0.0 or norm_b == 0.0:
+            return 0.0
+        return dot / np.sqrt(norm_a * norm_b)
+
+class FeatureVisitor(ast.NodeVisitor):
+    """Recoge en una sola pasada conteos por clase de nodo, nombres, total y profundidad del AST."""
+    
+    def __init__(self):
+        self.counts = Counter()
+        self.names = set()
+        self.total = 0
+        self.depth = 0
+        self.max_depth = 0
+    
+    # visit se redefine entero: sin búsqueda de visit_<Clase> por nodo
+    def visit(self, node):
+        self.counts[node.__class__] += 1
+        self.total += 1
+        if isinstance(node, ast.Name):
+            self.names.add(node.id)
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+        _visit_children(self.visit, node)
+        self.depth -= 1
+
 class EmbeddingGenerator:
     """Generador de embeddings con múltiples estrategias."""
     
+    # Tipos de nodo cuyo conteo normalizado forma parte del embedding por características
+    COMMON_NODE_TYPES = (ast.FunctionDef, ast.ClassDef, ast.If, ast.For, ast.While,
+                         ast.Import, ast.Assign, ast.Call, ast.Return, ast.Try)
+    
     def __init__(self, config: ConfigurationManager):
         self.config = config
         self.model_type = config.get('embedding.model_type', 'semantic')
         self.vector_size = config.get('embedding.vector_size', 768)
         self.model = None
         self.tokenizer = None
+        self.device = None
+        self.batch_size = config.get('embedding.batch_size', 32)
+        # Los embeddings se guardan en float16 (mitad de memoria y caché); la similitud se calcula en float32
+        self.storage_dtype = np.dtype(config.get('embedding.storage_dtype', 'float16'))
+        
+        # LRU de embeddings por hash del código, para no regenerar código idéntico
+        self.use_cache = config.get('embedding.use_cache', True)
+        self.cache_entries = config.get('embedding.cache_entries', 1024)
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         
         self._initialize_model()
     
@@ -778,51 +1107,123 @@ class EmbeddingGenerator:
                 from transformers import AutoTokenizer, AutoModel
                 model_name = "microsoft/codebert-base"
                 self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-                self.model = AutoModel.from_pretrained(model_name)
+                self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+                dtype = self._model_dtype()
+                self.model = AutoModel.from_pretrained(model_name).to(device=self.device, dtype=dtype)
                 self.model.eval()
-                logging.info(f"Loaded semantic embedding model: {model_name}")
+                logging.info(f"Loaded semantic embedding model: {model_name} ({self.device}, {dtype})")
             except Exception as e:
                 logging.warning(f"Failed to load transformer model: {e}")
                 self._use_fallback_model()
         else:
             self._use_fallback_model()
     
+    def _model_dtype(self) -> torch.dtype:
+        """Precisión del modelo según embedding.precision y el dispositivo."""
+        precision = self.config.get('embedding.precision', 'auto')
+        if precision == 'auto':
+            # BF16/FP16 solo compensan en GPU; en CPU sin AVX-512 BF16 son más lentos
+            if self.device.type != 'cuda':
+                return torch.float32
+            return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        return getattr(torch, precision)
+    
     def _use_fallback_model(self):
         """Usa modelo de embeddings basado en características."""
         logging.info("Using feature-based embedding model")
         self.model_type = 'feature'
+        with self._cache_lock:
+            self._cache.clear()
+    
+    def _code_key(self, code: str) -> bytes:
+        """Hash de 128 bits del código usado como clave del caché."""
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_128_digest(code.encode())
+        return hashlib.blake2b(code.encode(), digest_size=16).digest()
     
     def generate(self, code: str) -> np.ndarray:
         """Genera embedding para código."""
-        if self.model_type == 'semantic' and self.model and self.tokenizer:
-            return self._generate_semantic_embedding(code)
-        else:
-            return self._generate_feature_embedding(code)
-    
-    def _generate_semantic_embedding(self, code: str) -> np.ndarray:
-        """Genera embedding semántico usando transformer."""
-        try:
-            inputs = self.tokenizer(
-                code,
-                return_tensors="pt",
-                max_length=self.config.get('embedding.max_sequence_length', 512),
-                truncation=True,
-                padding=True
-            )
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                embedding = outputs.last_hidden_state.mean(dim=1).numpy()[0]
+        return self.generate_batch([code])[0]
+    
+    def generate_batch(self, codes: List[str]) -> List[np.ndarray]:
+        """Genera embeddings para varios fragmentos, agrupando las llamadas al modelo."""
+        results: List[Optional[np.ndarray]] = [None] * len(codes)
+        pending = []
+        
+        for i, code in enumerate(codes):
+            key = self._code_key(code) if self.use_cache else None
+            if key is not None:
+                with self._cache_lock:
+                    embedding = self._cache.get(key)
+                    if embedding is not None:
+                        self._cache.move_to_end(key)
+                        results[i] = embedding.copy()
+                        continue
+            pending.append((i, key))
+        
+        if pending:
+            missing = [codes[i] for i, _ in pending]
+            if self.model_type == 'semantic' and self.model and self.tokenizer:
+                embeddings = self._generate_semantic_embeddings(missing)
+            else:
+                embeddings = [self._generate_feature_embedding(code) for code in missing]
             
-            # Ajustar al tamaño configurado si es necesario
-            if len(embedding) != self.vector_size:
-                embedding = self._resize_embedding(embedding, self.vector_size)
+            for (i, key), embedding in zip(pending, embeddings):
+                embedding = self._to_storage(embedding)
+                if key is None:
+                    results[i] = embedding
+                    continue
+                with self._cache_lock:
+                    self._cache[key] = embedding
+                    if len(self._cache) > self.cache_entries:
+                        self._cache.popitem(last=False)
+                results[i] = embedding.copy()
+        
+        return results
+    
+    def _to_storage(self, embedding: np.ndarray) -> np.ndarray:
+        """Convierte un embedding al tipo de almacenamiento, saturando valores fuera de rango."""
+        if self.storage_dtype == np.float16:
+            limit = np.finfo(np.float16).max
+            return np.clip(embedding, -limit, limit).astype(np.float16)
+        return embedding.astype(self.storage_dtype, copy=False)
+    
+    def _generate_semantic_embeddings(self, codes: List[str]) -> List[np.ndarray]:
+        """Genera embeddings semánticos por lotes de embedding.batch_size usando transformer."""
+        embeddings = []
+        max_length = self.config.get('embedding.max_sequence_length', 512)
+        
+        for start in range(0, len(codes), self.batch_size):
+            batch = codes[start:start + self.batch_size]
+            try:
+                inputs = self.tokenizer(
+                    batch,
+                    return_tensors="pt",
+                    max_length=max_length,
+                    truncation=True,
+                    padding=True
+                )
+                if self.device.type == 'cuda':
+                    inputs = {k: v.pin_memory().to(self.device, non_blocking=True) for k, v in inputs.items()}
+                
+                with torch.inference_mode():
+                    outputs = self.model(**inputs)
+                    # Media sobre los tokens reales; el padding del lote no cuenta
+                    mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+                    summed = (outputs.last_hidden_state * mask).sum(dim=1)
+                    pooled = (summed / mask.sum(dim=1).clamp(min=1)).float().cpu().numpy()
+                
+                for embedding in pooled:
+                    # Ajustar al tamaño configurado si es necesario
+                    if len(embedding) != self.vector_size:
+                        embedding = self._resize_embedding(embedding, self.vector_size)
+                    embeddings.append(embedding)
             
-            return embedding
+            except Exception as e:
+                logging.warning(f"Failed to generate semantic embedding: {e}")
+                embeddings.extend(self._generate_feature_embedding(code) for code in batch)
         
-        except Exception as e:
-            logging.warning(f"Failed to generate semantic embedding: {e}")
-            return self._generate_feature_embedding(code)
+        return embeddings
     
     def _generate_feature_embedding(self, code: str) -> np.ndarray:
         """Genera embedding basado en características del código."""
@@ -843,24 +1244,24 @@ class EmbeddingGenerator:
         try:
             tree = ast.parse(code)
             
-            # Contar tipos de nodos
-            node_counts = Counter()
-            for node in ast.walk(tree):
-                node_counts[type(node).__name__] += 1
+            # Contar tipos de nodos, nombres y profundidad en un solo recorrido
+            visitor = FeatureVisitor()
+            visitor.visit(tree)
+            node_counts = visitor.counts
             
             # Agregar conteos normalizados de nodos comunes
-            common_nodes = ['FunctionDef', 'ClassDef', 'If', 'For', 'While', 
-                          'Import', 'Assign', 'Call', 'Return', 'Try']
-            
-            total_nodes = sum(node_counts.values())
-            for node_type in common_nodes:
-                features.append(node_counts.get(node_type, 0) / max(total_nodes, 1))
+            total_nodes = visitor.total
+            common_counts = np.fromiter(
+                (node_counts.get(node_type, 0) for node_type in self.COMMON_NODE_TYPES),
+                dtype=np.float32, count=len(self.COMMON_NODE_TYPES)
+            )
+            features.extend((common_counts / max(total_nodes, 1)).tolist())
             
             # Características de complejidad
             features.extend([
-                self._calculate_max_depth(tree),
-                len(list(ast.walk(tree))),
-                self._count_unique_names(tree),
+                visitor.max_depth,
+                total_nodes,
+                len(visitor.names),
             ])
             
         except SyntaxError:
@@ -883,14 +1284,14 @@ class EmbeddingGenerator:
         # Crear embedding del tamaño configurado
         if len(feature_vector) < self.vector_size:
             # Expandir usando transformación no lineal
-            expanded = np.zeros(self.vector_size)
-            expanded[:len(feature_vector)] = feature_vector
+            n = len(feature_vector)
+            expanded = np.empty(self.vector_size)
+            expanded[:n] = feature_vector
             
-            # Agregar características derivadas
-            for i in range(len(feature_vector), self.vector_size):
-                # Combinación no lineal de características existentes
-                idx1, idx2 = i % len(feature_vector), (i * 7) % len(feature_vector)
-                expanded[i] = np.tanh(feature_vector[idx1] * feature_vector[idx2])
+            # Agregar características derivadas: combinación no lineal de
+            # características existentes, calculada de una vez para todo el tramo
+            positions = np.arange(n, self.vector_size)
+            expanded[n:] = np.tanh(feature_vector[positions % n] * feature_vector[(positions * 7) % n])
             
             return expanded
         else:
@@ -913,33 +1314,13 @@ class EmbeddingGenerator:
             indices = np.linspace(0, current_size - 1, target_size, dtype=int)
             return embedding[indices]
     
-    def _calculate_max_depth(self, tree: ast.AST) -> int:
-        """Calcula la profundidad máxima del AST."""
-        class DepthVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.max_depth = 0
-                self.current_depth = 0
-            
-            def generic_visit(self, node):
-                self.current_depth += 1
-                self.max_depth = max(self.max_depth, self.current_depth)
-                super().generic_visit(node)
-                self.current_depth -= 1
-        
-        visitor = DepthVisitor()
-        visitor.visit(tree)
-        return visitor.max_depth
-    
-    def _count_unique_names(self, tree: ast.AST) -> int:
-        """Cuenta nombres únicos en el AST."""
-        names = set()
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Name):
-                names.add(node.id)
-        return len(names)
-    
     def calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Calcula similitud coseno entre embeddings."""
+        embedding1 = np.asarray(embedding1, dtype=np.float32)
+        embedding2 = np.asarray(embedding2, dtype=np.float32)
+        if NUMBA_AVAILABLE and embedding1.ndim == 1 and embedding1.shape == embedding2.shape:
+            return float(_cosine_similarity(embedding1, embedding2))
+        
         dot_product = np.dot(embedding1, embedding2)
         norm1 = np.linalg.norm(embedding1)
         norm2 = np.linalg.norm(embedding2)
@@ -947,13 +1328,27 @@ class EmbeddingGenerator:
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
-        return dot_product / (norm1 * norm2)
+        return float(dot_product / (norm1 * norm2))
+    
+    def calculate_similarity_batch(self, embeddings1: np.ndarray, embeddings2: np.ndarray) -> np.ndarray:
+        """Calcula la matriz de similitud coseno entre dos conjuntos de embeddings (N×D, M×D)."""
+        # Normalizar filas y resolver todos los pares con una sola multiplicación de matrices
+        return self.normalize_embeddings(embeddings1) @ self.normalize_embeddings(embeddings2).T
+    
+    def normalize_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        """Normaliza (L2) las filas de un conjunto de embeddings en float32; las filas nulas quedan en cero."""
+        matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
 
 # =====================================================================
 # ANALIZADOR DE CÓDIGO MEJORADO
 # =====================================================================
 
-@dataclass
+# Las dataclasses con __slots__ requieren Python 3.10+; en versiones anteriores se usan sin ellos
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_SLOTS)
 class CodeMetrics:
     """Métricas de calidad de código extendidas."""
     cyclomatic_complexity: int = 0
@@ -973,55 +1368,172 @@ class CodeMetrics:
     class_count: int = 0
     max_nesting_depth: int = 0
 
+# Campos de CodeMetrics para serializar sin la copia profunda de asdict
+_METRIC_FIELDS = tuple(f.name for f in fields(CodeMetrics))
+_METRIC_FIELD_SET = frozenset(_METRIC_FIELDS)
+
+# Nodos que suman un camino a la complejidad ciclomática
+_DECISION_NODES = frozenset({ast.If, ast.While, ast.For, ast.ExceptHandler,
+                             ast.With, ast.Assert, ast.Raise})
+# Nodos que suman complejidad cognitiva según su anidamiento
+_COGNITIVE_BLOCK_NODES = frozenset({ast.If, ast.While, ast.For, ast.ExceptHandler})
+# Bloques que cuentan para la profundidad máxima de anidamiento
+_NESTING_BLOCK_NODES = frozenset({ast.If, ast.For, ast.While, ast.With, ast.Try})
+# Operadores de Halstead
+_HALSTEAD_OPERATORS = frozenset({ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+                                 ast.Pow, ast.LShift, ast.RShift, ast.BitOr,
+                                 ast.BitXor, ast.BitAnd, ast.FloorDiv, ast.And,
+                                 ast.Or, ast.Not, ast.Eq, ast.NotEq, ast.Lt,
+                                 ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot,
+                                 ast.In, ast.NotIn})
+
+class FusedMetricsVisitor(ast.NodeVisitor):
+    """Calcula en un solo recorrido del AST complejidad, anidamiento, Halstead y conteos."""
+    
+    def __init__(self):
+        self.cyclomatic = 1
+        self.cognitive = 0
+        self.cognitive_nesting = 0
+        self.nesting = 0
+        self.max_nesting = 0
+        self.operators: Set[str] = set()
+        self.operands: Set[str] = set()
+        self.total_operators = 0
+        self.total_operands = 0
+        self.functions: List[ast.FunctionDef] = []
+        self.classes: List[ast.ClassDef] = []
+        self.imports: List[Union[ast.Import, ast.ImportFrom]] = []
+        # Complejidad ciclomática de cada función (incluye la de sus funciones anidadas)
+        self.function_complexity: Dict[ast.FunctionDef, int] = {}
+        self._function_stack: List[ast.FunctionDef] = []
+    
+    def _add_decisions(self, count: int):
+        self.cyclomatic += count
+        for function in self._function_stack:
+            self.function_complexity[function] += count
+    
+    def visit(self, node):
+        cls = node.__class__
+        
+        # Complejidad ciclomática y cognitiva
+        if cls in _DECISION_NODES:
+            self._add_decisions(1)
+        elif cls is ast.BoolOp:
+            self._add_decisions(len(node.values) - 1)
+            self.cognitive += len(node.values) - 1
+        elif cls is ast.comprehension:
+            self._add_decisions(len(node.ifs))
+        elif cls is ast.Lambda:
+            self.cognitive += 1
+        
+        # Halstead
+        if cls in _HALSTEAD_OPERATORS:
+            self.operators.add(cls.__name__)
+            self.total_operators += 1
+        elif cls is ast.Name:
+            self.operands.add(node.id)
+            self.total_operands += 1
+        elif cls is ast.Constant:
+            self.operands.add(str(node.value))
+            self.total_operands += 1
+        
+        # Conteos
+        is_function = cls is ast.FunctionDef
+        if is_function:
+            self.functions.append(node)
+            self.function_complexity[node] = 1
+            self._function_stack.append(node)
+        elif cls is ast.ClassDef:
+            self.classes.append(node)
+        elif cls is ast.Import or cls is ast.ImportFrom:
+            self.imports.append(node)
+        
+        # Bloques anidados
+        cognitive_block = cls in _COGNITIVE_BLOCK_NODES
+        if cognitive_block:
+            self.cognitive += 1 + self.cognitive_nesting
+            self.cognitive_nesting += 1
+        nesting_block = cls in _NESTING_BLOCK_NODES
+        if nesting_block:
+            self.nesting += 1
+            if self.nesting > self.max_nesting:
+                self.max_nesting = self.nesting
+        
+        _visit_children(self.visit, node)
+        
+        if nesting_block:
+            self.nesting -= 1
+        if cognitive_block:
+            self.cognitive_nesting -= 1
+        if is_function:
+            self._function_stack.pop()
+
+# Bytes que str.strip() trata como espacio en blanco dentro del rango ASCII
+_ASCII_WHITESPACE = np.zeros(256, dtype=bool)
+_ASCII_WHITESPACE[[0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x1C, 0x1D, 0x1E, 0x1F, 0x20]] = True
+
 class CodeAnalyzer:
     """Analizador de código con métricas avanzadas."""
     
+    # A partir de este tamaño las líneas se clasifican con NumPy sobre los bytes
+    VECTORIZED_LINE_COUNT_MIN_CHARS = 8 * 1024
+    
     def __init__(self, config: Optional[ConfigurationManager] = None):
         self.config = config or ConfigurationManager()
         self.security_patterns = self._load_security_patterns()
+        self._prepare_security_scan()
+        
+        # LRU de métricas por hash del código: un archivo sin cambios no se vuelve a analizar
+        self.cache_entries = self.config.get('metrics.cache_entries', 2048)
+        self._metrics_cache: "OrderedDict[bytes, CodeMetrics]" = OrderedDict()
+        self._metrics_cache_lock = threading.Lock()
     
-    def _load_security_patterns(self) -> List[Tuple[str, str, str]]:
-        """Carga patrones de seguridad mejorados."""
+    def _load_security_patterns(self) -> List[Tuple["re.Pattern", str, str, Optional[Tuple[str, ...]]]]:
+        """Carga y compila una sola vez los patrones de seguridad.
+        
+        Cada patrón lleva los literales (en minúsculas) de los que depende: si ninguno
+        aparece en el código, el patrón no puede casar y no se pasa al motor de regex.
+        """
         patterns = [
             # Ejecución de código
-            (r'\beval\s*\([^)]*\)', "Use of eval() is dangerous", "critical"),
-            (r'\bexec\s*\([^)]*\)', "Use of exec() is dangerous", "critical"),
-            (r'__import__\s*\([^)]*\)', "Dynamic imports can be risky", "high"),
+            (r'\beval\s*\([^)]*\)', "Use of eval() is dangerous", "critical", ('eval',)),
+            (r'\bexec\s*\([^)]*\)', "Use of exec() is dangerous", "critical", ('exec',)),
+            (r'__import__\s*\([^)]*\)', "Dynamic imports can be risky", "high", ('__import__',)),
             
             # Deserialización
-            (r'pickle\.loads?\s*\([^)]*\)', "Pickle deserialization can be unsafe", "high"),
-            (r'yaml\.load\s*\([^)]*\)', "Use yaml.safe_load() instead of yaml.load()", "high"),
-            (r'marshal\.loads?\s*\([^)]*\)', "Marshal deserialization can be unsafe", "high"),
+            (r'pickle\.loads?\s*\([^)]*\)', "Pickle deserialization can be unsafe", "high", ('pickle.load',)),
+            (r'yaml\.load\s*\([^)]*\)', "Use yaml.safe_load() instead of yaml.load()", "high", ('yaml.load',)),
+            (r'marshal\.loads?\s*\([^)]*\)', "Marshal deserialization can be unsafe", "high", ('marshal.load',)),
             
             # Inyección de comandos
-            (r'subprocess\.\w+\([^)]*shell\s*=\s*True', "Shell injection vulnerability possible", "critical"),
-            (r'os\.system\s*\([^)]*\)', "os.system() vulnerable to injection", "high"),
-            (r'os\.popen\s*\([^)]*\)', "os.popen() vulnerable to injection", "high"),
+            (r'subprocess\.\w+\([^)]*shell\s*=\s*True', "Shell injection vulnerability possible", "critical", ('subprocess.',)),
+            (r'os\.system\s*\([^)]*\)', "os.system() vulnerable to injection", "high", ('os.system',)),
+            (r'os\.popen\s*\([^)]*\)', "os.popen() vulnerable to injection", "high", ('os.popen',)),
             
             # SQL Injection
-            (r'\".*SELECT.*%s.*\"', "Possible SQL injection vulnerability", "critical"),
-            (r'f\".*SELECT.*{.*}.*\"', "Possible SQL injection with f-strings", "critical"),
-            (r'\.format\([^)]*\).*SELECT', "Possible SQL injection with format()", "critical"),
+            (r'\".*SELECT.*%s.*\"', "Possible SQL injection vulnerability", "critical", ('select',)),
+            (r'f\".*SELECT.*{.*}.*\"', "Possible SQL injection with f-strings", "critical", ('select',)),
+            (r'\.format\([^)]*\).*SELECT', "Possible SQL injection with format()", "critical", ('select',)),
             
             # Path traversal
-            (r'open\s*\([^)]*\.\.[^)]*\)', "Possible path traversal vulnerability", "high"),
-            (r'os\.path\.join\([^)]*\.\.[^)]*\)', "Possible path traversal", "high"),
+            (r'open\s*\([^)]*\.\.[^)]*\)', "Possible path traversal vulnerability", "high", ('..',)),
+            (r'os\.path\.join\([^)]*\.\.[^)]*\)', "Possible path traversal", "high", ('os.path.join',)),
             
             # Credenciales hardcodeadas
             (r'(password|secret|token|api_key|apikey)\s*=\s*["\'][^"\']+["\']', 
-             "Hardcoded credentials detected", "critical"),
+             "Hardcoded credentials detected", "critical", ('password', 'secret', 'token', 'api_key', 'apikey')),
             (r'(AWS_SECRET|AZURE_KEY|GCP_KEY)\s*=\s*["\'][^"\']+["\']',
-             "Cloud credentials hardcoded", "critical"),
+             "Cloud credentials hardcoded", "critical", ('aws_secret', 'azure_key', 'gcp_key')),
             
             # Uso inseguro de random
-            (r'random\.\w+\s*\([^)]*\)', "Use secrets module for security-sensitive randomness", "medium"),
+            (r'random\.\w+\s*\([^)]*\)', "Use secrets module for security-sensitive randomness", "medium", ('random.',)),
             
             # HTTP sin cifrar
-            (r'http://[^s]', "Using HTTP instead of HTTPS", "medium"),
+            (r'http://[^s]', "Using HTTP instead of HTTPS", "medium", ('http://',)),
             
             # Configuraciones inseguras
-            (r'verify\s*=\s*False', "SSL verification disabled", "high"),
-            (r'DEBUG\s*=\s*True', "Debug mode enabled in production", "medium"),
+            (r'verify\s*=\s*False', "SSL verification disabled", "high", ('verify',)),
+            (r'DEBUG\s*=\s*True', "Debug mode enabled in production", "medium", ('debug',)),
         ]
         
         # Agregar patrones personalizados de configuración
@@ -1031,20 +1543,115 @@ class CodeAnalyzer:
                 patterns.append((
                     pattern.get('regex', ''),
                     pattern.get('message', 'Custom security issue'),
-                    pattern.get('severity', 'medium')
+                    pattern.get('severity', 'medium'),
+                    None
                 ))
         
-        return patterns
+        compiled = []
+        for regex, message, severity, keywords in patterns:
+            if not regex:
+                continue
+            try:
+                compiled.append((re.compile(regex, re.IGNORECASE | re.MULTILINE), message, severity, keywords))
+            except re.error as e:
+                logging.warning(f"Skipping invalid security pattern {regex!r}: {e}")
+        
+        return compiled
+    
+    def _prepare_security_scan(self):
+        """Reparte los patrones de seguridad en arrays paralelos indexados por número de patrón."""
+        (self._security_regexes, self._security_messages,
+         self._security_severities, self._security_keywords) = (
+            [list(column) for column in zip(*self.security_patterns)] or [[], [], [], []]
+        )
     
     def analyze_code(self, code: str, file_path: Optional[str] = None) -> CodeMetrics:
         """Análisis completo del código con todas las métricas."""
+        key = self._metrics_key(code)
+        cached = self._get_cached_metrics(key)
+        if cached is not None:
+            return cached
+        
+        return self._store_metrics(key, self._analyze_code_uncached(code))
+    
+    def analyze_files(self, paths: List[str], max_workers: Optional[int] = None) -> Dict[str, CodeMetrics]:
+        """Analiza varios archivos en paralelo con un pool de procesos."""
+        results: Dict[str, CodeMetrics] = {}
+        pending = []
+        
+        # Los aciertos de caché se resuelven aquí, sin enviarlos a los workers
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    source = f.read()
+            except OSError as e:
+                logging.warning(f"Failed to read {path}: {e}")
+                continue
+            
+            key = self._metrics_key(source)
+            cached = self._get_cached_metrics(key)
+            if cached is not None:
+                results[path] = cached
+            else:
+                pending.append((path, source, key))
+        
+        workers = min(max_workers or self.config.get('analysis.max_workers', 4), len(pending))
+        if workers <= 1:
+            for path, source, key in pending:
+                results[path] = self._store_metrics(key, self._analyze_code_uncached(source))
+        elif pending:
+            # La configuración se envía una vez por worker, no con cada tarea
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_analysis_worker,
+                                     initargs=(self.config.config,)) as executor:
+                futures = {
+                    executor.submit(_analyze_source_in_worker, source): (path, key)
+                    for path, source, key in pending
+                }
+                for future in as_completed(futures):
+                    path, key = futures[future]
+                    try:
+                        results[path] = self._store_metrics(key, future.result())
+                    except Exception as e:
+                        logging.warning(f"Failed to analyze {path}: {e}")
+        
+        return {path: results[path] for path in paths if path in results}
+    
+    def _metrics_key(self, code: str) -> bytes:
+        """Clave de caché de métricas para un código fuente."""
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_128_digest(code.encode())
+        return hashlib.blake2b(code.encode(), digest_size=16).digest()
+    
+    def _get_cached_metrics(self, key: bytes) -> Optional[CodeMetrics]:
+        """Devuelve una copia de las métricas cacheadas, o None."""
+        with self._metrics_cache_lock:
+            cached = self._metrics_cache.get(key)
+            if cached is not None:
+                self._metrics_cache.move_to_end(key)
+        if cached is None:
+            return None
+        # Copia para que los nodos no compartan listas mutables
+        return copy.deepcopy(cached)
+    
+    def _store_metrics(self, key: bytes, metrics: CodeMetrics) -> CodeMetrics:
+        """Guarda las métricas en el LRU y devuelve una copia para el llamador."""
+        if self.cache_entries <= 0:
+            return metrics
+        with self._metrics_cache_lock:
+            self._metrics_cache[key] = metrics
+            if len(self._metrics_cache) > self.cache_entries:
+                self._metrics_cache.popitem(last=False)
+        return copy.deepcopy(metrics)
+    
+    def _analyze_code_uncached(self, code: str) -> CodeMetrics:
+        """Calcula todas las métricas del código."""
         metrics = CodeMetrics()
         
         # Métricas básicas de líneas
         lines = code.split('\n')
         metrics.lines_of_code = len(lines)
-        metrics.blank_lines = sum(1 for l in lines if not l.strip())
-        metrics.comment_lines = sum(1 for l in lines if l.strip().startswith('#'))
+        metrics.blank_lines, metrics.comment_lines = self._count_line_categories(code, lines)
         metrics.logical_lines_of_code = metrics.lines_of_code - metrics.blank_lines - metrics.comment_lines
         
         # Ratio de comentarios
@@ -1054,162 +1661,78 @@ class CodeAnalyzer:
         try:
             tree = ast.parse(code)
             
-            # Análisis del AST
-            metrics.cyclomatic_complexity = self._calculate_cyclomatic_complexity(tree)
-            metrics.cognitive_complexity = self._calculate_cognitive_complexity(tree)
-            metrics.max_nesting_depth = self._calculate_max_nesting_depth(tree)
-            metrics.halstead_metrics = self._calculate_halstead_metrics(tree)
+            # Análisis del AST: un único recorrido para todas las métricas
+            visitor = FusedMetricsVisitor()
+            visitor.visit(tree)
+            metrics.cyclomatic_complexity = visitor.cyclomatic
+            metrics.cognitive_complexity = visitor.cognitive
+            metrics.max_nesting_depth = visitor.max_nesting
+            metrics.halstead_metrics = self._calculate_halstead_metrics(visitor)
             
             # Contar elementos
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    metrics.function_count += 1
-                elif isinstance(node, ast.ClassDef):
-                    metrics.class_count += 1
-                elif isinstance(node, (ast.Import, ast.ImportFrom)):
-                    metrics.dependencies.extend(self._extract_imports(node))
+            metrics.function_count = len(visitor.functions)
+            metrics.class_count = len(visitor.classes)
+            for node in visitor.imports:
+                metrics.dependencies.extend(self._extract_imports(node))
             
             # Detectar code smells
-            metrics.code_smells = self._detect_code_smells(tree, code)
+            metrics.code_smells = self._detect_code_smells(visitor, lines)
             
         except SyntaxError:
             # Si hay error de sintaxis, usar valores por defecto
             pass
         
         # Análisis de seguridad
-        metrics.security_issues = self._detect_security_issues(code)
+        metrics.security_issues = self._detect_security_issues(code, lines)
         
         # Índice de mantenibilidad
         metrics.maintainability_index = self._calculate_maintainability_index(metrics)
         
         return metrics
     
-    def _calculate_cyclomatic_complexity(self, tree: ast.AST) -> int:
-        """Calcula la complejidad ciclomática."""
-        complexity = 1
-        
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.If, ast.While, ast.For, ast.ExceptHandler,
-                                ast.With, ast.Assert, ast.Raise)):
-                complexity += 1
-            elif isinstance(node, ast.BoolOp):
-                complexity += len(node.values) - 1
-            elif isinstance(node, ast.comprehension):
-                complexity += sum(1 for _ in node.ifs)
-        
-        return complexity
-    
-    def _calculate_cognitive_complexity(self, tree: ast.AST) -> int:
-        """Calcula la complejidad cognitiva mejorada."""
-        class ComplexityVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.complexity = 0
-                self.nesting_level = 0
-            
-            def visit_If(self, node):
-                self.complexity += 1 + self.nesting_level
-                self.nesting_level += 1
-                self.generic_visit(node)
-                self.nesting_level -= 1
-            
-            def visit_While(self, node):
-                self.complexity += 1 + self.nesting_level
-                self.nesting_level += 1
-                self.generic_visit(node)
-                self.nesting_level -= 1
-            
-            def visit_For(self, node):
-                self.complexity += 1 + self.nesting_level
-                self.nesting_level += 1
-                self.generic_visit(node)
-                self.nesting_level -= 1
-            
-            def visit_ExceptHandler(self, node):
-                self.complexity += 1 + self.nesting_level
-                self.nesting_level += 1
-                self.generic_visit(node)
-                self.nesting_level -= 1
-            
-            def visit_BoolOp(self, node):
-                self.complexity += len(node.values) - 1
-                self.generic_visit(node)
-            
-            def visit_Lambda(self, node):
-                self.complexity += 1
-                self.generic_visit(node)
-        
-        visitor = ComplexityVisitor()
-        visitor.visit(tree)
-        return visitor.complexity
-    
-    def _calculate_max_nesting_depth(self, tree: ast.AST) -> int:
-        """Calcula la profundidad máxima de anidamiento."""
-        class NestingVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.max_depth = 0
-                self.current_depth = 0
-            
-            def _enter_block(self):
-                self.current_depth += 1
-                self.max_depth = max(self.max_depth, self.current_depth)
-            
-            def _exit_block(self):
-                self.current_depth -= 1
-            
-            def visit_If(self, node):
-                self._enter_block()
-                self.generic_visit(node)
-                self._exit_block()
-            
-            def visit_For(self, node):
-                self._enter_block()
-                self.generic_visit(node)
-                self._exit_block()
-            
-            def visit_While(self, node):
-                self._enter_block()
-                self.generic_visit(node)
-                self._exit_block()
-            
-            def visit_With(self, node):
-                self._enter_block()
-                self.generic_visit(node)
-                self._exit_block()
-            
-            def visit_Try(self, node):
-                self._enter_block()
-                self.generic_visit(node)
-                self._exit_block()
-        
-        visitor = NestingVisitor()
-        visitor.visit(tree)
-        return visitor.max_depth
-    
-    def _calculate_halstead_metrics(self, tree: ast.AST) -> Dict[str, float]:
-        """Calcula métricas de Halstead."""
-        operators = set()
-        operands = set()
-        total_operators = 0
-        total_operands = 0
-        
-        for node in ast.walk(tree):
-            # Contar operadores
-            if isinstance(node, (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
-                                ast.Pow, ast.LShift, ast.RShift, ast.BitOr,
-                                ast.BitXor, ast.BitAnd, ast.FloorDiv, ast.And,
-                                ast.Or, ast.Not, ast.Eq, ast.NotEq, ast.Lt,
-                                ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot,
-                                ast.In, ast.NotIn)):
-                operators.add(type(node).__name__)
-                total_operators += 1
-            
-            # Contar operandos
-            elif isinstance(node, (ast.Name, ast.Constant, ast.Str, ast.Num)):
-                if isinstance(node, ast.Name):
-                    operands.add(node.id)
-                elif isinstance(node, ast.Constant):
-                    operands.add(str(node.value))
-                total_operands += 1
+    def _count_line_categories(self, code: str, lines: List[str]) -> Tuple[int, int]:
+        """Cuenta líneas en blanco y de comentario."""
+        if len(code) < self.VECTORIZED_LINE_COUNT_MIN_CHARS:
+            blank = comment = 0
+            for line in lines:
+                stripped = line.lstrip()
+                if not stripped:
+                    blank += 1
+                elif stripped[0] == '#':
+                    comment += 1
+            return blank, comment
+        
+        # Sobre los bytes UTF-8: primer byte no blanco de cada línea vía searchsorted
+        buf = np.frombuffer(code.encode('utf-8', 'surrogatepass'), dtype=np.uint8)
+        newlines = np.flatnonzero(buf == 0x0A)
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [len(buf)]))
+        
+        # Posición del primer byte no blanco a partir del inicio de cada línea (len(buf) si no hay)
+        content = np.append(np.flatnonzero(~_ASCII_WHITESPACE[buf]), len(buf))
+        first = content[np.searchsorted(content, starts)]
+        has_content = first < ends
+        first_byte = buf[first[has_content]]
+        
+        blank = int(len(starts) - np.count_nonzero(has_content))
+        comment = int(np.count_nonzero(first_byte == 0x23))
+        
+        # Un primer byte no ASCII puede ser un espacio Unicode: esas líneas se resuelven con str.strip
+        for line_no in np.flatnonzero(has_content)[first_byte >= 0x80]:
+            stripped = lines[line_no].lstrip()
+            if not stripped:
+                blank += 1
+            elif stripped[0] == '#':
+                comment += 1
+        
+        return blank, comment
+    
+    def _calculate_halstead_metrics(self, visitor: FusedMetricsVisitor) -> Dict[str, float]:
+        """Calcula métricas de Halstead a partir de los conteos del recorrido fusionado."""
+        operators = visitor.operators
+        operands = visitor.operands
+        total_operators = visitor.total_operators
+        total_operands = visitor.total_operands
         
         n1 = len(operators)  # Operadores únicos
         n2 = len(operands)   # Operandos únicos
@@ -1221,7 +1744,7 @@ class CodeAnalyzer:
         length = N1 + N2
         
         if vocabulary > 0 and length > 0:
-            volume = length * np.log2(vocabulary) if vocabulary > 0 else 0
+            volume = length * math.log2(vocabulary)
             difficulty = (n1 / 2) * (N2 / n2) if n2 > 0 else 0
             effort = volume * difficulty
             time = effort / 18  # Segundos
@@ -1239,97 +1762,113 @@ class CodeAnalyzer:
             'bugs': bugs
         }
     
-    def _detect_security_issues(self, code: str) -> List[Dict[str, Any]]:
+    def _detect_security_issues(self, code: str, lines: List[str]) -> List[Dict[str, Any]]:
         """Detecta problemas de seguridad con contexto mejorado."""
         issues = []
-        lines = code.split('\n')
         
-        for pattern, message, severity in self.security_patterns:
-            for match in re.finditer(pattern, code, re.IGNORECASE | re.MULTILINE):
-                # Encontrar número de línea
-                line_num = code[:match.start()].count('\n') + 1
-                
-                # Extraer contexto
-                context_start = max(0, line_num - 2)
-                context_end = min(len(lines), line_num + 2)
-                context = '\n'.join(lines[context_start:context_end])
-                
-                issues.append({
-                    'type': 'security',
-                    'severity': severity,
-                    'message': message,
-                    'line': line_num,
-                    'column': match.start() - code.rfind('\n', 0, match.start()),
-                    'match': match.group(0)[:100],
-                    'context': context
-                })
+        # Prefiltro por literales: solo llegan al motor de regex los patrones que pueden casar
+        code_lower = code.lower()
+        
+        def may_match(keywords):
+            return keywords is None or any(keyword in code_lower for keyword in keywords)
+        
+        # Cada patrón activo se recorre por separado: una coincidencia puede contener la de otro
+        keywords = self._security_keywords
+        matches = []
+        for i, pattern in enumerate(self._security_regexes):
+            if may_match(keywords[i]):
+                matches.extend((match, i) for match in pattern.finditer(code))
+        
+        # Inicio de cada línea, calculado una vez; cada coincidencia se ubica por bisección
+        line_starts = [0]
+        if matches:
+            line_starts.extend(accumulate(len(line) + 1 for line in lines[:-1]))
+        
+        messages = self._security_messages
+        severities = self._security_severities
+        for match, i in matches:
+            # Encontrar número de línea
+            line_num = bisect.bisect_right(line_starts, match.start())
+            
+            # Extraer contexto
+            context_start = max(0, line_num - 2)
+            context_end = min(len(lines), line_num + 2)
+            context = '\n'.join(lines[context_start:context_end])
+            
+            issues.append({
+                'type': 'security',
+                'severity': severities[i],
+                'message': messages[i],
+                'line': line_num,
+                'column': match.start() - line_starts[line_num - 1] + 1,
+                'match': match.group(0)[:100],
+                'context': context
+            })
         
         return issues
     
-    def _detect_code_smells(self, tree: ast.AST, code: str) -> List[Dict[str, Any]]:
+    def _detect_code_smells(self, visitor: FusedMetricsVisitor, lines: List[str]) -> List[Dict[str, Any]]:
         """Detecta code smells con descripción detallada."""
         smells = []
-        lines = code.split('\n')
         
-        for node in ast.walk(tree):
+        threshold = self.config.get('metrics.complexity.lines_per_function_threshold', 50)
+        param_threshold = self.config.get('metrics.complexity.parameters_threshold', 5)
+        complexity_threshold = self.config.get('metrics.complexity.cyclomatic_threshold', 10)
+        method_threshold = self.config.get('metrics.complexity.methods_per_class_threshold', 20)
+        
+        for node in visitor.functions:
             # Funciones muy largas
-            if isinstance(node, ast.FunctionDef):
-                func_lines = node.end_lineno - node.lineno if hasattr(node, 'end_lineno') else 0
-                threshold = self.config.get('metrics.complexity.lines_per_function_threshold', 50)
-                
-                if func_lines > threshold:
-                    smells.append({
-                        'type': 'long_function',
-                        'name': node.name,
-                        'line': node.lineno,
-                        'severity': 'medium',
-                        'message': f"Function '{node.name}' is too long ({func_lines} lines > {threshold})",
-                        'metrics': {'lines': func_lines, 'threshold': threshold}
-                    })
-                
-                # Demasiados parámetros
-                param_count = len(node.args.args)
-                param_threshold = self.config.get('metrics.complexity.parameters_threshold', 5)
-                
-                if param_count > param_threshold:
-                    smells.append({
-                        'type': 'too_many_parameters',
-                        'name': node.name,
-                        'line': node.lineno,
-                        'severity': 'medium',
-                        'message': f"Function '{node.name}' has too many parameters ({param_count} > {param_threshold})",
-                        'metrics': {'parameters': param_count, 'threshold': param_threshold}
-                    })
+            func_lines = node.end_lineno - node.lineno if hasattr(node, 'end_lineno') else 0
             
-            # Clases muy grandes
-            elif isinstance(node, ast.ClassDef):
-                methods = [n for n in node.body if isinstance(n, ast.FunctionDef)]
-                method_threshold = self.config.get('metrics.complexity.methods_per_class_threshold', 20)
-                
-                if len(methods) > method_threshold:
-                    smells.append({
-                        'type': 'large_class',
-                        'name': node.name,
-                        'line': node.lineno,
-                        'severity': 'medium',
-                        'message': f"Class '{node.name}' has too many methods ({len(methods)} > {method_threshold})",
-                        'metrics': {'methods': len(methods), 'threshold': method_threshold}
-                    })
+            if func_lines > threshold:
+                smells.append({
+                    'type': 'long_function',
+                    'name': node.name,
+                    'line': node.lineno,
+                    'severity': 'medium',
+                    'message': f"Function '{node.name}' is too long ({func_lines} lines > {threshold})",
+                    'metrics': {'lines': func_lines, 'threshold': threshold}
+                })
             
-            # Complejidad excesiva en funciones
-            elif isinstance(node, ast.FunctionDef):
-                complexity = self._calculate_cyclomatic_complexity(node)
-                complexity_threshold = self.config.get('metrics.complexity.cyclomatic_threshold', 10)
-                
-                if complexity > complexity_threshold:
-                    smells.append({
-                        'type': 'complex_function',
-                        'name': node.name,
-                        'line': node.lineno,
-                        'severity': 'high',
-                        'message': f"Function '{node.name}' has high complexity ({complexity} > {complexity_threshold})",
-                        'metrics': {'complexity': complexity, 'threshold': complexity_threshold}
-                    })
+            # Demasiados parámetros
+            param_count = len(node.args.args)
+            
+            if param_count > param_threshold:
+                smells.append({
+                    'type': 'too_many_parameters',
+                    'name': node.name,
+                    'line': node.lineno,
+                    'severity': 'medium',
+                    'message': f"Function '{node.name}' has too many parameters ({param_count} > {param_threshold})",
+                    'metrics': {'parameters': param_count, 'threshold': param_threshold}
+                })
+            
+            # Complejidad excesiva en funciones (ya calculada durante el recorrido)
+            complexity = visitor.function_complexity[node]
+            
+            if complexity > complexity_threshold:
+                smells.append({
+                    'type': 'complex_function',
+                    'name': node.name,
+                    'line': node.lineno,
+                    'severity': 'high',
+                    'message': f"Function '{node.name}' has high complexity ({complexity} > {complexity_threshold})",
+                    'metrics': {'complexity': complexity, 'threshold': complexity_threshold}
+                })
+        
+        # Clases muy grandes
+        for node in visitor.classes:
+            methods = [n for n in node.body if isinstance(n, ast.FunctionDef)]
+            
+            if len(methods) > method_threshold:
+                smells.append({
+                    'type': 'large_class',
+                    'name': node.name,
+                    'line': node.lineno,
+                    'severity': 'medium',
+                    'message': f"Class '{node.name}' has too many methods ({len(methods)} > {method_threshold})",
+                    'metrics': {'methods': len(methods), 'threshold': method_threshold}
+                })
         
         # Detectar código duplicado (simplificado)
         self._detect_duplicate_code(lines, smells)
@@ -1338,29 +1877,48 @@ class CodeAnalyzer:
     
     def _detect_duplicate_code(self, lines: List[str], smells: List[Dict]):
         """Detecta código duplicado simple."""
-        # Buscar bloques de código idénticos
+        # Buscar bloques de código idénticos con un hash rodante (Rabin-Karp) sobre
+        # el hash de cada línea: O(N) en lugar de unir y hashear cada ventana
         min_block_size = 5
-        seen_blocks = {}
+        window_count = len(lines) - min_block_size
+        if window_count <= 0:
+            return
         
-        for i in range(len(lines) - min_block_size):
-            block = '\n'.join(lines[i:i+min_block_size])
-            block_hash = hashlib.md5(block.encode()).hexdigest()
+        base = 1_000_003
+        modulus = (1 << 61) - 1
+        top_weight = pow(base, min_block_size - 1, modulus)
+        line_hashes = [hash(line) % modulus for line in lines]
+        
+        rolling = 0
+        for h in line_hashes[:min_block_size]:
+            rolling = (rolling * base + h) % modulus
+        
+        # hash -> inicios de los bloques distintos vistos con ese hash
+        seen_blocks: Dict[int, List[int]] = {}
+        
+        for i in range(window_count):
+            if i:
+                rolling = ((rolling - line_hashes[i - 1] * top_weight) * base
+                           + line_hashes[i + min_block_size - 1]) % modulus
             
-            if block_hash in seen_blocks:
+            block = lines[i:i + min_block_size]
+            starts = seen_blocks.setdefault(rolling, [])
+            # Confirmar con comparación real solo cuando coincide el hash
+            original = next((j for j in starts if lines[j:j + min_block_size] == block), None)
+            
+            if original is not None:
                 smells.append({
                     'type': 'duplicate_code',
                     'line': i + 1,
                     'severity': 'low',
                     'message': f"Possible duplicate code block starting at line {i+1}",
-                    'duplicate_of': seen_blocks[block_hash]
+                    'duplicate_of': original + 1
                 })
             else:
-                seen_blocks[block_hash] = i + 1
+                starts.append(i)
     
     def _calculate_maintainability_index(self, metrics: CodeMetrics) -> float:
         """Calcula el índice de mantenibilidad de Microsoft."""
-        import math
-        
         # Fórmula del Índice de Mantenibilidad
         # MI = 171 - 5.2 * ln(V) - 0.23 * CC - 16.2 * ln(LOC)
         # Donde V = Volumen Halstead, CC = Complejidad Ciclomática, LOC = Líneas de código
@@ -1397,6 +1955,20 @@ class CodeAnalyzer:
         
         return imports
 
+# Analizador de cada proceso worker de CodeAnalyzer.analyze_files
+_WORKER_ANALYZER: Optional[CodeAnalyzer] = None
+
+def _init_analysis_worker(config_data: dict):
+    """Crea el analizador del worker a partir de la configuración del proceso principal."""
+    global _WORKER_ANALYZER
+    config = ConfigurationManager()
+    config.config = config_data
+    _WORKER_ANALYZER = CodeAnalyzer(config)
+
+def _analyze_source_in_worker(source: str) -> CodeMetrics:
+    """Analiza un código fuente dentro de un worker."""
+    return _WORKER_ANALYZER._analyze_code_uncached(source)
+
 # =====================================================================
 # GENERADOR DE TESTS AUTOMÁTICOS
 # =====================================================================
@@ -1404,6 +1976,17 @@ class CodeAnalyzer:
 class TestGenerator:
     """Generador de tests unitarios automáticos."""
     
+    # Fragmentos de nombre que sugieren un parámetro numérico
+    NUMERIC_INDICATORS = ('num', 'count', 'size', 'length', 'index', 'id', 'age', 'amount')
+    # Reglas (fragmentos de nombre, valor de prueba) en orden de prioridad
+    PARAM_VALUE_RULES = (
+        (('str', 'text', 'name', 'message'), '"test_value"'),
+        (('num', 'count', 'size', 'id'), '1'),
+        (('flag', 'is_', 'has_', 'should_'), 'True'),
+        (('list', 'items', 'elements'), '[]'),
+        (('dict', 'config', 'options'), '{}'),
+    )
+    
     def __init__(self, config: ConfigurationManager):
         self.config = config
         self.framework = config.get('testing.framework', 'pytest')
@@ -1484,16 +2067,18 @@ class TestGenerator:
         """Crea plantilla de test para función."""
         params = [arg.arg for arg in func.args.args]
         param_values = self._infer_param_values(func)
+        assignments = self._create_param_assignments(params, param_values)
+        args = ', '.join(params)
         
         if self.framework == 'pytest':
             template = f"""
 def test_{func.name}_basic():
     '''Test básico para {func.name}'''
     # Arrange
-    {self._create_param_assignments(params, param_values)}
+    {assignments}
     
     # Act
-    result = {func.name}({', '.join(params)})
+    result = {func.name}({args})
     
     # Assert
     assert result is not None
@@ -1505,10 +2090,10 @@ class Test{func.name.capitalize()}(unittest.TestCase):
     def test_{func.name}_basic(self):
         '''Test básico para {func.name}'''
         # Arrange
-        {self._create_param_assignments(params, param_values)}
+        {assignments}
         
         # Act
-        result = {func.name}({', '.join(params)})
+        result = {func.name}({args})
         
         # Assert
         self.assertIsNotNone(result)
@@ -1520,18 +2105,25 @@ class Test{func.name.capitalize()}(unittest.TestCase):
     def _create_edge_case_test(self, func: ast.FunctionDef) -> str:
         """Crea test de edge cases."""
         params = [arg.arg for arg in func.args.args]
+        args = ', '.join(params)
+        
+        # Cada parámetro se clasifica una vez y las tres filas de casos se comparten entre frameworks
+        numeric = [self._is_numeric_param(p) for p in params]
+        empty_case = ', '.join(['0' if n else '""' for n in numeric])
+        negative_case = ', '.join(['-1' if n else 'None' for n in numeric])
+        large_case = ', '.join(['999999' if n else '"x"*1000' for n in numeric])
         
         if self.framework == 'pytest':
             template = f"""
-@pytest.mark.parametrize("{', '.join(params)}", [
-    ({', '.join(['0' if self._is_numeric_param(p) else '""' for p in params])}),  # Valores vacíos/cero
-    ({', '.join(['-1' if self._is_numeric_param(p) else 'None' for p in params])}),  # Valores negativos/None
-    ({', '.join(['999999' if self._is_numeric_param(p) else '"x"*1000' for p in params])}),  # Valores grandes
+@pytest.mark.parametrize("{args}", [
+    ({empty_case}),  # Valores vacíos/cero
+    ({negative_case}),  # Valores negativos/None
+    ({large_case}),  # Valores grandes
 ])
-def test_{func.name}_edge_cases({', '.join(params)}):
+def test_{func.name}_edge_cases({args}):
     '''Test de edge cases para {func.name}'''
     try:
-        result = {func.name}({', '.join(params)})
+        result = {func.name}({args})
         # Verificar que maneja edge cases apropiadamente
         assert result is not None or True  # Ajustar según comportamiento esperado
     except Exception as e:
@@ -1544,9 +2136,9 @@ class Test{func.name.capitalize()}EdgeCases(unittest.TestCase):
     def test_edge_cases(self):
         '''Test de edge cases para {func.name}'''
         edge_cases = [
-            ({', '.join(['0' if self._is_numeric_param(p) else '""' for p in params])}),
-            ({', '.join(['-1' if self._is_numeric_param(p) else 'None' for p in params])}),
-            ({', '.join(['999999' if self._is_numeric_param(p) else '"x"*1000' for p in params])}),
+            ({empty_case}),
+            ({negative_case}),
+            ({large_case}),
         ]
         
         for case in edge_cases:
@@ -1636,16 +2228,12 @@ class Test{class_name}{method.name.capitalize()}(unittest.TestCase):
     def _has_numeric_params(self, func: ast.FunctionDef) -> bool:
         """Verifica si la función tiene parámetros numéricos."""
         # Heurística simple basada en nombres de parámetros
-        numeric_indicators = ['num', 'count', 'size', 'length', 'index', 'id', 'age', 'amount']
-        return any(
-            any(indicator in arg.arg.lower() for indicator in numeric_indicators)
-            for arg in func.args.args
-        )
+        return any(self._is_numeric_param(arg.arg) for arg in func.args.args)
     
     def _is_numeric_param(self, param_name: str) -> bool:
         """Verifica si un parámetro es probablemente numérico."""
-        numeric_indicators = ['num', 'count', 'size', 'length', 'index', 'id', 'age', 'amount']
-        return any(indicator in param_name.lower() for indicator in numeric_indicators)
+        param_name = param_name.lower()
+        return any(indicator in param_name for indicator in self.NUMERIC_INDICATORS)
     
     def _has_exception_handling(self, func: ast.FunctionDef) -> bool:
         """Verifica si la función tiene manejo de excepciones."""
@@ -1661,19 +2249,12 @@ class Test{class_name}{method.name.capitalize()}(unittest.TestCase):
         for arg in func.args.args:
             param_name = arg.arg.lower()
             
-            # Inferir tipo basado en nombre
-            if any(x in param_name for x in ['str', 'text', 'name', 'message']):
-                values[arg.arg] = '"test_value"'
-            elif any(x in param_name for x in ['num', 'count', 'size', 'id']):
-                values[arg.arg] = '1'
-            elif any(x in param_name for x in ['flag', 'is_', 'has_', 'should_']):
-                values[arg.arg] = 'True'
-            elif any(x in param_name for x in ['list', 'items', 'elements']):
-                values[arg.arg] = '[]'
-            elif any(x in param_name for x in ['dict', 'config', 'options']):
-                values[arg.arg] = '{}'
-            else:
-                values[arg.arg] = 'None'
+            # Inferir tipo basado en nombre: primera regla que coincide
+            values[arg.arg] = next(
+                (value for indicators, value in self.PARAM_VALUE_RULES
+                 if any(x in param_name for x in indicators)),
+                'None'
+            )
         
         return values
     
@@ -1713,9 +2294,10 @@ class PersistentCodeNode:
     documentation: Optional[str] = None
     version: str = "3.1"
     
-    def to_dict(self) -> Dict:
+    def to_dict(self, include_embedding: bool = True) -> Dict:
         """Serializa el nodo completamente."""
-        metrics_dict = asdict(self.metrics) if isinstance(self.metrics, CodeMetrics) else self.metrics
+        # Referencias directas: el resultado solo se serializa, no se modifica
+        metrics_dict = {name: getattr(self.metrics, name) for name in _METRIC_FIELDS}
         
         return {
             'code_id': self.code_id,
@@ -1726,7 +2308,8 @@ class PersistentCodeNode:
             'metrics': metrics_dict,
             'test_cases': self.test_cases,
             'test_results': self.test_results,
-            'embedding': self.embedding.tolist() if self.embedding is not None else None,
+            'embedding': (self.embedding.tolist()
+                          if include_embedding and self.embedding is not None else None),
             'creation_timestamp': self.creation_timestamp,
             'update_timestamp': self.update_timestamp,
             'file_path': self.file_path,
@@ -1742,17 +2325,31 @@ class PersistentCodeNode:
     @classmethod
     def from_dict(cls, data: Dict) -> 'PersistentCodeNode':
         """Reconstruye el nodo desde un diccionario."""
-        embedding = np.array(data['embedding']) if data.get('embedding') else None
-        
-        # Reconstruir métricas
-        metrics_data = data.get('metrics', {})
-        if isinstance(metrics_data, dict) and not isinstance(metrics_data, CodeMetrics):
-            metrics = CodeMetrics(**{
-                k: v for k, v in metrics_data.items() 
-                if k in CodeMetrics.__dataclass_fields__
-            })
-        else:
+        embedding = np.array(data['embedding'], dtype=np.float32) if data.get('embedding') else None
+        
+        # Reconstruir métricas: el nodo siempre queda con un CodeMetrics
+        metrics_data = data.get('metrics') or {}
+        if isinstance(metrics_data, CodeMetrics):
             metrics = metrics_data
+        elif isinstance(metrics_data, dict):
+            # Caso habitual (guardado por esta versión): todas las claves son campos
+            if metrics_data.keys() <= _METRIC_FIELD_SET:
+                metrics = CodeMetrics(**metrics_data)
+            else:
+                metrics = CodeMetrics(**{
+                    k: v for k, v in metrics_data.items() 
+                    if k in _METRIC_FIELD_SET
+                })
+        else:
+            metrics = CodeMetrics()
+        
+        # time.time() solo si falta algún timestamp, no como default evaluado en cada llamada
+        creation_timestamp = data.get('creation_timestamp')
+        update_timestamp = data.get('update_timestamp')
+        if creation_timestamp is None or update_timestamp is None:
+            now = time.time()
+            creation_timestamp = now if creation_timestamp is None else creation_timestamp
+            update_timestamp = now if update_timestamp is None else update_timestamp
         
         return cls(
             code_id=data['code_id'],
@@ -1764,8 +2361,8 @@ class PersistentCodeNode:
             test_cases=data.get('test_cases', []),
             test_results=data.get('test_results', []),
             embedding=embedding,
-            creation_timestamp=data.get('creation_timestamp', time.time()),
-            update_timestamp=data.get('update_timestamp', time.time()),
+            creation_timestamp=creation_timestamp,
+            update_timestamp=update_timestamp,
             file_path=data.get('file_path'),
             start_line=data.get('start_line'),
             end_line=data.get('end_line'),
@@ -1777,32 +2374,125 @@ class PersistentCodeNode:
         )
     
 
+# Líneas físicas tal como las numera el parser: solo \r\n, \r y \n cortan línea
+_SOURCE_LINE_RE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$')
+
+def _split_source_lines(source: str) -> List[str]:
+    """Divide el código en líneas conservando los saltos, como ast.get_source_segment."""
+    return _SOURCE_LINE_RE.findall(source)
+
+def _source_segment(lines: List[str], node: ast.AST) -> Optional[str]:
+    """Equivalente a ast.get_source_segment sobre líneas ya divididas, sin recorrer el archivo."""
+    end_lineno = getattr(node, 'end_lineno', None)
+    if end_lineno is None or node.end_col_offset is None:
+        return None
+    first, last = node.lineno - 1, end_lineno - 1
+    if last >= len(lines):
+        return None
+    
+    # Los offsets de columna del AST son bytes UTF-8; en líneas ASCII coinciden con caracteres
+    def cut(line: str, start: int, end: Optional[int] = None) -> str:
+        if line.isascii():
+            return line[start:end]
+        return line.encode('utf-8')[start:end].decode('utf-8')
+    
+    if first == last:
+        return cut(lines[first], node.col_offset, node.end_col_offset)
+    return ''.join([cut(lines[first], node.col_offset), *lines[first + 1:last],
+                    cut(lines[last], 0, node.end_col_offset)])
+
+def _stream_state_json(stream, on_node) -> Dict[str, Any]:
+    """Lee el estado JSON en streaming con ijson: entrega cada nodo a on_node(node_id, data)
+    en cuanto se completa y devuelve el resto de campos de primer nivel."""
+    state: Dict[str, Any] = {}
+    key = None
+    node_id = None
+    in_nodes = False
+    builder = None
+    depth = 0
+    
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        # Dentro de un valor: acumularlo hasta cerrar su último contenedor
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if depth == 0:
+                    if in_nodes:
+                        on_node(node_id, builder.value)
+                    else:
+                        state[key] = builder.value
+                    builder = None
+            continue
+        
+        if event == 'map_key':
+            if in_nodes:
+                node_id = value
+            else:
+                key = value
+        elif prefix == '':
+            continue  # Apertura y cierre del objeto raíz
+        elif in_nodes and event == 'end_map':
+            in_nodes = False
+        elif not in_nodes and key == 'nodes' and event == 'start_map':
+            in_nodes = True
+        elif event in ('start_map', 'start_array'):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+        elif in_nodes:
+            on_node(node_id, value)
+        else:
+            state[key] = value
+    
+    return state
+
 
 class EnterpriseSRPKGraph:
     """Grafo empresarial con todas las mejoras de v3.1."""
     
-    def __init__(self, config: Optional[ConfigurationManager] = None):
+    # Entradas de historial de métricas que se conservan en memoria y en el estado
+    METRICS_HISTORY_LIMIT = 100
+    
+    def __init__(self, config: Optional[ConfigurationManager] = None, worker: bool = False):
+        """worker=True crea el grafo reducido de un proceso del pool de análisis: sin modelo
+        de embeddings (los genera el proceso principal), sin pool propio y sin recorrer el
+        directorio de caché al arrancar."""
         self.config = config or ConfigurationManager()
-        self.cache = CacheManager(self.config)
+        self.cache = CacheManager(self.config, scan=not worker)
         self.analyzer = RobustAnalyzer(self.config)
         self.code_analyzer = CodeAnalyzer(self.config)
-        self.embedding_generator = EmbeddingGenerator(self.config)
+        self.embedding_generator = None if worker else EmbeddingGenerator(self.config)
         self.test_generator = TestGenerator(self.config)
         
         self.nodes: Dict[str, PersistentCodeNode] = {}
-        self.edges: Dict[str, List[str]] = defaultdict(list)
+        self.edges: Dict[str, Set[str]] = defaultdict(set)
         self.file_registry: Dict[str, List[str]] = {}
-        self.metrics_history: List[Dict] = []
-        
-        # Threading para análisis paralelo
-        self.executor = ThreadPoolExecutor(
-            max_workers=self.config.get('analysis.max_workers', 4)
+        self.metrics_history: deque = deque(maxlen=self.METRICS_HISTORY_LIMIT)
+        # Ruta -> (mtime_ns, tamaño, sha256): evita releer archivos sin cambios
+        self._stat_cache: Dict[str, Tuple[int, int, str]] = {}
+        # (ids, embeddings, matriz normalizada) para búsquedas de similitud
+        self._embedding_matrix_cache: Optional[Tuple[List[str], List[np.ndarray], np.ndarray]] = None
+        
+        # Procesos para análisis paralelo: el trabajo es CPU puro y con hilos lo serializa el GIL.
+        # Cada worker construye su propio grafo reducido a partir de la configuración, una sola vez
+        self.executor = None if worker else ProcessPoolExecutor(
+            max_workers=self.config.get('analysis.max_workers', 4),
+            initializer=_init_graph_worker,
+            initargs=(self.config.config,)
         )
         
         # Auto-guardado
-        self.auto_save_enabled = self.config.get('persistence.auto_save', True)
+        self.auto_save_enabled = not worker and self.config.get('persistence.auto_save', True)
         self.last_save_time = time.time()
         
+        # Versión (code_hash, update_timestamp) de cada nodo en el último snapshot o registro
+        # del log de cambios; lo que difiere es lo que append_state_changes tiene que escribir
+        self._persisted_versions: Dict[str, Tuple[str, float]] = {}
+        self._snapshot_path: Optional[str] = None
+        
     def analyze_project(self, project_path: str) -> Dict[str, Any]:
         """Analiza un proyecto completo con procesamiento paralelo."""
         project_path = Path(project_path)
@@ -1825,35 +2515,55 @@ class EnterpriseSRPKGraph:
         
         # Procesamiento paralelo si está habilitado
         if self.config.get('analysis.parallel_processing', True):
+            # Lotes de archivos por tarea: con muchos archivos pequeños el viaje de ida y
+            # vuelta de cada future pesa más que el propio análisis
+            max_workers = self.config.get('analysis.max_workers', 4)
+            chunksize = max(1, total_files // (max_workers * 4))
             futures = []
-            for file_path in files_to_analyze:
-                future = self.executor.submit(self._analyze_file_wrapper, file_path)
-                futures.append((file_path, future))
+            for start in range(0, total_files, chunksize):
+                batch = files_to_analyze[start:start + chunksize]
+                future = self.executor.submit(
+                    _analyze_file_batch_in_worker,
+                    [(file_path, self._stat_cache.get(str(file_path))) for file_path in batch]
+                )
+                futures.append((batch, future))
             
-            # Recopilar resultados
-            for file_path, future in futures:
+            # Recopilar resultados e incorporar los nodos devueltos por cada worker
+            timeout = self.config.get('analysis.timeout_per_file_seconds', 30)
+            analyzed_files = []
+            for batch, future in futures:
                 try:
-                    file_results = future.result(
-                        timeout=self.config.get('analysis.timeout_per_file_seconds', 30)
-                    )
-                    if file_results:
+                    batch_results = future.result(timeout=timeout * len(batch))
+                except FutureTimeoutError:
+                    batch_results = [(None, 'Timeout')] * len(batch)
+                except Exception as e:
+                    batch_results = [(None, str(e))] * len(batch)
+                
+                for file_path, (file_results, error) in zip(batch, batch_results):
+                    if error is not None:
+                        logging.error(f"Failed to analyze {file_path}: {error}")
+                        results['files_failed'] += 1
+                        results['errors'].append({
+                            'file': str(file_path),
+                            'error': error
+                        })
+                    elif file_results:
+                        nodes = self._merge_worker_result(file_path, file_results)
+                        if not file_results['cached']:
+                            analyzed_files.append((file_path, file_results, nodes))
                         results['nodes_created'] += file_results['nodes_created']
                         results['edges_created'] += file_results['edges_created']
                         results['files_analyzed'] += 1
-                except FutureTimeoutError:
-                    logging.error(f"Timeout analyzing {file_path}")
-                    results['files_failed'] += 1
-                    results['errors'].append({
-                        'file': str(file_path),
-                        'error': 'Timeout'
-                    })
-                except Exception as e:
-                    logging.error(f"Failed to analyze {file_path}: {e}")
-                    results['files_failed'] += 1
-                    results['errors'].append({
-                        'file': str(file_path),
-                        'error': str(e)
-                    })
+            
+            # Embeddings de todos los archivos analizados en los workers en una sola pasada por
+            # lotes; después se guardan en caché ya completos
+            self._generate_embeddings([node for _, _, nodes in analyzed_files for node in nodes])
+            for file_path, file_results, nodes in analyzed_files:
+                if file_results.get('stat'):
+                    self.cache.set(f"analysis:{file_path}", {
+                        'nodes': [node.to_dict() for node in nodes],
+                        'node_ids': file_results['node_ids']
+                    }, file_results['stat'][2])
         else:
             # Procesamiento secuencial
             for i, file_path in enumerate(files_to_analyze):
@@ -1901,35 +2611,63 @@ class EnterpriseSRPKGraph:
         include_tests = self.config.get('analysis.include_tests', True)
         follow_symlinks = self.config.get('analysis.follow_symlinks', False)
         
-        python_files = []
+        # Patrones compilados una vez; como Path.match, se comparan por componentes
+        # desde la derecha (o completos si el patrón es absoluto)
+        compiled_patterns = []
+        for pattern in excluded_patterns:
+            pattern_path = Path(pattern)
+            compiled_patterns.append((
+                pattern_path.is_absolute(),
+                [re.compile(fnmatch.translate(part)).match for part in pattern_path.parts]
+            ))
+        test_indicators = ('test_', '_test.py', 'tests/', 'testing/')
         
         def should_exclude(path: Path) -> bool:
-            # Verificar directorio excluido
-            for part in path.parts:
-                if part in excluded_dirs:
-                    return True
-            
             # Verificar si es test y si debe incluirse
             if not include_tests:
-                test_indicators = ['test_', '_test.py', 'tests/', 'testing/']
-                if any(indicator in str(path).lower() for indicator in test_indicators):
+                lowered = path.as_posix().lower()
+                if any(indicator in lowered for indicator in test_indicators):
                     return True
             
             # Verificar patrones excluidos
-            for pattern in excluded_patterns:
-                if path.match(pattern):
+            parts = path.parts
+            for anchored, matchers in compiled_patterns:
+                if (anchored and len(parts) != len(matchers)) or len(parts) < len(matchers):
+                    continue
+                if all(match(part) for match, part in zip(matchers, parts[-len(matchers):])):
                     return True
             
             return False
         
-        # Recorrer archivos
-        for path in project_path.rglob('*.py'):
-            # Verificar symlinks
-            if not follow_symlinks and path.is_symlink():
-                continue
-            
-            if not should_exclude(path):
-                python_files.append(path)
+        # Un directorio excluido en la propia ruta del proyecto excluye todo
+        if any(part in excluded_dirs for part in project_path.parts):
+            return []
+        
+        # Recorrer con os.scandir: el tipo de cada entrada viene del listado (sin stat extra)
+        # y los directorios excluidos se podan sin entrar en ellos
+        python_files = []
+        pending_dirs = [str(project_path)]
+        while pending_dirs:
+            try:
+                with os.scandir(pending_dirs.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in excluded_dirs:
+                                pending_dirs.append(entry.path)
+                            continue
+                        
+                        if not entry.name.endswith('.py') or not entry.is_file():
+                            continue
+                        
+                        # Verificar symlinks
+                        if not follow_symlinks and entry.is_symlink():
+                            continue
+                        
+                        path = Path(entry.path)
+                        if not should_exclude(path):
+                            python_files.append(path)
+            except OSError as e:
+                logging.debug(f"Skipping unreadable directory: {e}")
         
         return sorted(python_files)
     
@@ -1952,23 +2690,27 @@ class EnterpriseSRPKGraph:
                 
                 return {
                     'nodes_created': len(cached_result['nodes']),
-                    'edges_created': 0
+                    'edges_created': 0,
+                    'cached': True
                 }
             
             # Analizar archivo
             nodes = self._analyze_file(file_path)
             
             if nodes:
-                # Guardar en caché
-                cache_data = {
-                    'nodes': [n.to_dict() for n in nodes],
-                    'node_ids': [n.code_id for n in nodes]
-                }
-                self.cache.set(cache_key, cache_data, file_hash)
+                # Guardar en caché; en un worker los nodos aún no tienen embeddings y es el
+                # proceso principal quien guarda la entrada completa
+                if self.embedding_generator is not None:
+                    cache_data = {
+                        'nodes': [n.to_dict() for n in nodes],
+                        'node_ids': [n.code_id for n in nodes]
+                    }
+                    self.cache.set(cache_key, cache_data, file_hash)
                 
                 return {
                     'nodes_created': len(nodes),
-                    'edges_created': 0
+                    'edges_created': 0,
+                    'cached': False
                 }
             
             return None
@@ -1977,15 +2719,54 @@ class EnterpriseSRPKGraph:
             logging.error(f"Error in file analysis wrapper: {e}")
             return None
     
+    def _merge_worker_result(self, file_path: Path, file_results: Dict) -> List[PersistentCodeNode]:
+        """Incorpora al grafo los nodos analizados en un proceso worker y los devuelve."""
+        storage_dtype = self.embedding_generator.storage_dtype
+        nodes = []
+        for node_data in file_results['nodes']:
+            node = PersistentCodeNode.from_dict(node_data)
+            if node.embedding is not None:
+                node.embedding = node.embedding.astype(storage_dtype)
+            self.nodes[node.code_id] = node
+            nodes.append(node)
+        self.file_registry[str(file_path)] = file_results['node_ids']
+        if file_results.get('stat'):
+            self._stat_cache[str(file_path)] = tuple(file_results['stat'])
+        return nodes
+    
     def _get_file_hash(self, file_path: Path) -> str:
         """Calcula hash de un archivo con manejo de errores."""
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
+            # Camino rápido: mismo mtime y tamaño que la última vez -> mismo hash
+            stat = os.stat(file_path)
+            cached = self._stat_cache.get(str(file_path))
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                return cached[2]
+            
+            file_hash = self._hash_file_contents(file_path)
+            self._stat_cache[str(file_path)] = (stat.st_mtime_ns, stat.st_size, file_hash)
+            return file_hash
         except Exception as e:
             logging.warning(f"Failed to hash file {file_path}: {e}")
             return str(time.time())
     
+    def _hash_file_contents(self, file_path: Path) -> str:
+        """Calcula el SHA-256 del contenido de un archivo."""
+        with open(file_path, 'rb') as f:
+            # Hash incremental: memoria constante sin importar el tamaño del archivo
+            if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            
+            digest = hashlib.sha256()
+            buffer = bytearray(1024 * 1024)
+            view = memoryview(buffer)
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                digest.update(view[:size])
+            return digest.hexdigest()
+    
     def _analyze_file(self, file_path: Path) -> List[PersistentCodeNode]:
         """Analiza un archivo y extrae nodos con análisis completo."""
         result = self.analyzer.analyze_file_safe(str(file_path))
@@ -2006,7 +2787,8 @@ class EnterpriseSRPKGraph:
             purpose=f"File: {file_path}",
             file_path=str(file_path),
             metrics=file_metrics,
-            tags=['file', file_path.suffix[1:]]
+            tags=['file', file_path.suffix[1:]],
+            ast_node=tree
         )
         nodes.append(file_node)
         self.nodes[file_node.code_id] = file_node
@@ -2015,42 +2797,56 @@ class EnterpriseSRPKGraph:
         elements = self._extract_code_elements(tree, content, str(file_path), file_node.code_id)
         nodes.extend(elements)
         
+        # Generar embeddings de todos los nodos del archivo (incluidos los métodos) en lotes;
+        # en un worker los genera después el proceso principal
+        if self.embedding_generator is not None:
+            self._generate_embeddings(nodes + [self.nodes[child_id] for n in nodes
+                                               for child_id in n.child_node_ids if child_id in self.nodes])
+        
         # Agregar al registro
         self.file_registry[str(file_path)] = [n.code_id for n in nodes]
         
         return nodes
     
+    def _generate_embeddings(self, nodes: List[PersistentCodeNode]):
+        """Genera en lotes los embeddings de los nodos que aún no lo tienen."""
+        pending = [node for node in nodes if node.embedding is None]
+        embeddings = self.embedding_generator.generate_batch([n.code_segment for n in pending])
+        if embeddings:
+            # Un único bloque contiguo; cada nodo guarda una vista de su fila
+            embeddings = np.stack(embeddings)
+        for node, embedding in zip(pending, embeddings):
+            node.embedding = embedding
+    
     def _extract_code_elements(self, tree: ast.AST, content: str, 
                                file_path: str, parent_id: str) -> List[PersistentCodeNode]:
         """Extrae elementos de código del AST."""
         nodes = []
-        
-        # Mapear nodos a sus padres
-        parent_map = {}
-        for parent in ast.walk(tree):
-            for child in ast.iter_child_nodes(parent):
-                parent_map[child] = parent
-        
-        # Procesar clases y funciones
-        for node in ast.walk(tree):
+        generate_tests = self.config.get('testing.generate_tests', True)
+        # Líneas calculadas una vez para recortar el código de cada elemento
+        source_lines = _split_source_lines(content)
+        
+        # Un solo recorrido en anchura (mismo orden que ast.walk) que conserva el padre de cada nodo
+        queue = [(tree, None)]
+        for node, parent in queue:
+            queue.extend((child, node) for child in ast.iter_child_nodes(node))
             element_node = None
             
             if isinstance(node, ast.ClassDef):
-                element_node = self._extract_class(node, content, file_path, parent_id)
+                element_node = self._extract_class(node, source_lines, file_path, parent_id)
             elif isinstance(node, ast.FunctionDef):
                 # Verificar si es método o función
-                parent = parent_map.get(node)
                 if not isinstance(parent, ast.ClassDef):
-                    element_node = self._extract_function(node, content, file_path, parent_id)
+                    element_node = self._extract_function(node, source_lines, file_path, parent_id)
             elif isinstance(node, ast.AsyncFunctionDef):
-                element_node = self._extract_async_function(node, content, file_path, parent_id)
+                element_node = self._extract_async_function(node, source_lines, file_path, parent_id)
             
             if element_node:
                 nodes.append(element_node)
                 self.nodes[element_node.code_id] = element_node
                 
                 # Generar tests si está habilitado
-                if self.config.get('testing.generate_tests', True):
+                if generate_tests:
                     tests = self.test_generator.generate_tests(node, content)
                     element_node.test_cases = tests
         
@@ -2062,7 +2858,8 @@ class EnterpriseSRPKGraph:
                     end_line: Optional[int] = None,
                     parent_id: Optional[str] = None,
                     metrics: Optional[CodeMetrics] = None,
-                    tags: Optional[List[str]] = None) -> PersistentCodeNode:
+                    tags: Optional[List[str]] = None,
+                    ast_node: Optional[ast.AST] = None) -> PersistentCodeNode:
         """Crea un nodo con análisis completo."""
         # Calcular hash único
         code_hash = hashlib.sha256(code_segment.encode()).hexdigest()
@@ -2071,38 +2868,36 @@ class EnterpriseSRPKGraph:
         if metrics is None:
             metrics = self.code_analyzer.analyze_code(code_segment, file_path)
         
-        # Generar embedding
-        embedding = self.embedding_generator.generate(code_segment)
-        
-        # Extraer documentación
-        documentation = self._extract_documentation(code_segment)
+        # Extraer documentación (del AST ya parseado si se dispone de él)
+        documentation = self._extract_documentation(code_segment, ast_node)
         
         return PersistentCodeNode(
             code_id=code_id,
             code_segment=code_segment,
             code_hash=code_hash,
-            dependencies=metrics.dependencies if isinstance(metrics, CodeMetrics) else [],
+            dependencies=metrics.dependencies,
             purpose=purpose,
             metrics=metrics,
             test_cases=[],
             test_results=[],
-            embedding=embedding,
+            embedding=None,  # Se rellena por lotes en _analyze_file
             creation_timestamp=time.time(),
             update_timestamp=time.time(),
             file_path=file_path,
             start_line=start_line,
             end_line=end_line,
+            ast_node=ast_node,
             parent_node_id=parent_id,
             child_node_ids=[],
             tags=tags or [],
             documentation=documentation
         )
     
-    def _extract_class(self, node: ast.ClassDef, content: str, 
+    def _extract_class(self, node: ast.ClassDef, source_lines: List[str], 
                       file_path: str, parent_id: str) -> Optional[PersistentCodeNode]:
         """Extrae una clase como nodo con métodos anidados."""
         try:
-            code = ast.get_source_segment(content, node)
+            code = _source_segment(source_lines, node)
             if not code:
                 return None
             
@@ -2118,13 +2913,14 @@ class EnterpriseSRPKGraph:
                 end_line=node.end_lineno if hasattr(node, 'end_lineno') else None,
                 parent_id=parent_id,
                 metrics=metrics,
-                tags=['class']
+                tags=['class'],
+                ast_node=node
             )
             
             # Extraer métodos como nodos hijos
             for item in node.body:
                 if isinstance(item, ast.FunctionDef):
-                    method_node = self._extract_method(item, content, file_path, class_node.code_id, node.name)
+                    method_node = self._extract_method(item, source_lines, file_path, class_node.code_id, node.name)
                     if method_node:
                         class_node.child_node_ids.append(method_node.code_id)
                         self.nodes[method_node.code_id] = method_node
@@ -2135,11 +2931,11 @@ class EnterpriseSRPKGraph:
             logging.error(f"Failed to extract class {node.name}: {e}")
             return None
     
-    def _extract_function(self, node: ast.FunctionDef, content: str,
+    def _extract_function(self, node: ast.FunctionDef, source_lines: List[str],
                          file_path: str, parent_id: str) -> Optional[PersistentCodeNode]:
         """Extrae una función como nodo."""
         try:
-            code = ast.get_source_segment(content, node)
+            code = _source_segment(source_lines, node)
             if not code:
                 return None
             
@@ -2154,17 +2950,18 @@ class EnterpriseSRPKGraph:
                 end_line=node.end_lineno if hasattr(node, 'end_lineno') else None,
                 parent_id=parent_id,
                 metrics=metrics,
-                tags=['function']
+                tags=['function'],
+                ast_node=node
             )
         except Exception as e:
             logging.error(f"Failed to extract function {node.name}: {e}")
             return None
     
-    def _extract_async_function(self, node: ast.AsyncFunctionDef, content: str,
+    def _extract_async_function(self, node: ast.AsyncFunctionDef, source_lines: List[str],
                                file_path: str, parent_id: str) -> Optional[PersistentCodeNode]:
         """Extrae una función asíncrona como nodo."""
         try:
-            code = ast.get_source_segment(content, node)
+            code = _source_segment(source_lines, node)
             if not code:
                 return None
             
@@ -2179,17 +2976,18 @@ class EnterpriseSRPKGraph:
                 end_line=node.end_lineno if hasattr(node, 'end_lineno') else None,
                 parent_id=parent_id,
                 metrics=metrics,
-                tags=['async', 'function']
+                tags=['async', 'function'],
+                ast_node=node
             )
         except Exception as e:
             logging.error(f"Failed to extract async function {node.name}: {e}")
             return None
     
-    def _extract_method(self, node: ast.FunctionDef, content: str,
+    def _extract_method(self, node: ast.FunctionDef, source_lines: List[str],
                        file_path: str, parent_id: str, class_name: str) -> Optional[PersistentCodeNode]:
         """Extrae un método de clase como nodo."""
         try:
-            code = ast.get_source_segment(content, node)
+            code = _source_segment(source_lines, node)
             if not code:
                 return None
             
@@ -2204,9 +3002,14 @@ class EnterpriseSRPKGraph:
             else:
                 method_tags.append('public')
             
-            if any(d.id == 'staticmethod' for d in node.decorator_list if isinstance(d, ast.Name)):
+            # Nombres de decoradores en una pasada (@name y @modulo.name)
+            decorator_names = {
+                d.id if isinstance(d, ast.Name) else d.attr
+                for d in node.decorator_list if isinstance(d, (ast.Name, ast.Attribute))
+            }
+            if 'staticmethod' in decorator_names:
                 method_tags.append('static')
-            elif any(d.id == 'classmethod' for d in node.decorator_list if isinstance(d, ast.Name)):
+            elif 'classmethod' in decorator_names:
                 method_tags.append('classmethod')
             
             return self._create_node(
@@ -2218,71 +3021,60 @@ class EnterpriseSRPKGraph:
                 end_line=node.end_lineno if hasattr(node, 'end_lineno') else None,
                 parent_id=parent_id,
                 metrics=metrics,
-                tags=method_tags
+                tags=method_tags,
+                ast_node=node
             )
         except Exception as e:
             logging.error(f"Failed to extract method {class_name}.{node.name}: {e}")
             return None
     
-    def _extract_documentation(self, code: str) -> Optional[str]:
+    def _extract_documentation(self, code: str, tree: Optional[ast.AST] = None) -> Optional[str]:
         """Extrae documentación del código."""
         try:
-            tree = ast.parse(code)
+            if tree is None:
+                tree = ast.parse(code)
             return ast.get_docstring(tree)
-        except:
-            # Buscar docstrings manualmente
-            lines = code.split('\n')
-            for i, line in enumerate(lines):
-                if '"""' in line or "'''" in line:
-                    # Extraer docstring multi-línea
-                    quote = '"""' if '"""' in line else "'''"
-                    start = i
-                    end = i
-                    
-                    for j in range(i + 1, len(lines)):
-                        if quote in lines[j]:
-                            end = j
-                            break
-                    
-                    if end > start:
-                        return '\n'.join(lines[start:end+1]).strip('"\' \n')
-            
+        except (SyntaxError, ValueError, TypeError):
+            # Código que no parsea o nodo sin docstring posible
             return None
     
     def _analyze_dependencies(self):
         """Analiza dependencias entre nodos y crea edges."""
+        # Índices construidos una vez: nombre definido -> nodos, módulo (nombre del archivo) -> nodos
+        name_to_ids: Dict[str, List[str]] = defaultdict(list)
+        module_to_ids: Dict[str, List[str]] = defaultdict(list)
+        for node_id, node in self.nodes.items():
+            kind, _, name = node.purpose.partition(': ')
+            if name and kind != 'File':
+                name_to_ids[name].append(node_id)
+                if '.' in name:
+                    # Métodos: también por su nombre corto
+                    name_to_ids[name.rsplit('.', 1)[1]].append(node_id)
+            if node.file_path:
+                module_to_ids[Path(node.file_path).stem].append(node_id)
+        
         for node_id, node in self.nodes.items():
-            # Analizar imports en el código
+            # Analizar imports y llamadas en el código
             try:
-                tree = ast.parse(node.code_segment)
+                # Reutilizar el AST de la extracción; solo los nodos cargados se parsean
+                tree = node.ast_node if node.ast_node is not None else ast.parse(node.code_segment)
                 
                 for ast_node in ast.walk(tree):
-                    if isinstance(ast_node, (ast.Import, ast.ImportFrom)):
-                        # Buscar nodos que puedan corresponder a estos imports
-                        for dep_id, dep_node in self.nodes.items():
-                            if dep_id != node_id:
-                                # Verificar si el import coincide con el nodo
-                                if self._is_dependency(ast_node, dep_node):
-                                    self.edges[node_id].append(dep_id)
+                    if isinstance(ast_node, ast.ImportFrom) and ast_node.module:
+                        # Nodos del archivo que corresponde al módulo importado
+                        candidates = module_to_ids.get(ast_node.module.rsplit('.', 1)[-1], ())
+                    elif isinstance(ast_node, ast.Call) and isinstance(ast_node.func, ast.Name):
+                        # Nodos que definen la función/clase llamada
+                        candidates = name_to_ids.get(ast_node.func.id, ())
+                    else:
+                        continue
                     
-                    elif isinstance(ast_node, ast.Call):
-                        # Buscar llamadas a funciones/clases definidas
-                        if isinstance(ast_node.func, ast.Name):
-                            func_name = ast_node.func.id
-                            # Buscar nodo correspondiente
-                            for dep_id, dep_node in self.nodes.items():
-                                if dep_id != node_id and func_name in dep_node.purpose:
-                                    self.edges[node_id].append(dep_id)
+                    self.edges[node_id].update(dep_id for dep_id in candidates if dep_id != node_id)
             except:
                 pass
-    
-    def _is_dependency(self, import_node: Union[ast.Import, ast.ImportFrom],
-                      target_node: PersistentCodeNode) -> bool:
-        """Verifica si un import corresponde a un nodo."""
-        # Simplificado: verificar si el nombre del módulo está en el path del archivo
-        if isinstance(import_node, ast.ImportFrom) and import_node.module:
-            return import_node.module in str(target_node.file_path or '')
-        return False
+            finally:
+                # El AST solo se guarda para este análisis; no se retiene el del proyecto entero
+                node.ast_node = None
     
     def _auto_save(self):
         """Guarda automáticamente el estado si es necesario."""
@@ -2305,15 +3097,18 @@ class EnterpriseSRPKGraph:
         
         total_loc = 0
         total_complexity = 0
-        security_issues = []
-        code_smells = []
+        security_issue_count = 0
+        code_smell_count = 0
+        dependencies = set()
         
+        # Un solo recorrido: todos los nodos tienen CodeMetrics (from_dict lo garantiza)
         for node in self.nodes.values():
-            if isinstance(node.metrics, CodeMetrics):
-                total_loc += node.metrics.lines_of_code
-                total_complexity += node.metrics.cyclomatic_complexity
-                security_issues.extend(node.metrics.security_issues)
-                code_smells.extend(node.metrics.code_smells)
+            metrics = node.metrics
+            total_loc += metrics.lines_of_code
+            total_complexity += metrics.cyclomatic_complexity
+            security_issue_count += len(metrics.security_issues)
+            code_smell_count += len(metrics.code_smells)
+            dependencies.update(metrics.dependencies)
         
         avg_complexity = total_complexity / max(len(self.nodes), 1)
         
@@ -2328,13 +3123,9 @@ class EnterpriseSRPKGraph:
             'total_loc': total_loc,
             'average_complexity': round(avg_complexity, 2),
             'average_quality_score': round(avg_quality, 3),
-            'security_issue_count': len(security_issues),
-            'code_smell_count': len(code_smells),
-            'unique_dependencies': len(set(
-                dep for node in self.nodes.values()
-                if isinstance(node.metrics, CodeMetrics)
-                for dep in node.metrics.dependencies
-            ))
+            'security_issue_count': security_issue_count,
+            'code_smell_count': code_smell_count,
+            'unique_dependencies': len(dependencies)
         }
     
     def find_similar_nodes(self, node_id: str, threshold: float = 0.85) -> List[Tuple[str, float]]:
@@ -2346,19 +3137,34 @@ class EnterpriseSRPKGraph:
         if target_node.embedding is None:
             return []
         
-        similar = []
+        # Todas las similitudes en un solo producto matriz-vector contra la matriz normalizada
+        ids, matrix = self._get_embedding_matrix()
+        target = self.embedding_generator.normalize_embeddings(target_node.embedding)[0]
+        similarities = matrix @ target
         
-        for other_id, other_node in self.nodes.items():
-            if other_id != node_id and other_node.embedding is not None:
-                similarity = self.embedding_generator.calculate_similarity(
-                    target_node.embedding,
-                    other_node.embedding
-                )
-                
-                if similarity >= threshold:
-                    similar.append((other_id, similarity))
+        matches = np.nonzero(similarities >= threshold)[0]
+        order = matches[np.argsort(-similarities[matches], kind='stable')]
+        return [(ids[i], float(similarities[i])) for i in order if ids[i] != node_id]
+    
+    def _get_embedding_matrix(self) -> Tuple[List[str], np.ndarray]:
+        """Devuelve los ids con embedding y su matriz normalizada, reconstruida solo si cambiaron."""
+        ids = []
+        embeddings = []
+        for node_id, node in self.nodes.items():
+            if node.embedding is not None:
+                ids.append(node_id)
+                embeddings.append(node.embedding)
+        
+        cached = self._embedding_matrix_cache
+        if (cached is None or cached[0] != ids
+                or any(old is not new for old, new in zip(cached[1], embeddings))):
+            if embeddings:
+                matrix = self.embedding_generator.normalize_embeddings(np.stack(embeddings))
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            cached = self._embedding_matrix_cache = (ids, embeddings, matrix)
         
-        return sorted(similar, key=lambda x: x[1], reverse=True)
+        return cached[0], cached[2]
     
     def get_node_quality_report(self, node_id: str) -> Dict[str, Any]:
         """Genera reporte de calidad para un nodo específico."""
@@ -2371,7 +3177,7 @@ class EnterpriseSRPKGraph:
             'node_id': node_id,
             'purpose': node.purpose,
             'quality_score': node.calculate_quality_score(),
-            'metrics': asdict(node.metrics) if isinstance(node.metrics, CodeMetrics) else node.metrics,
+            'metrics': asdict(node.metrics),
             'test_coverage': len(node.test_results) / max(len(node.test_cases), 1) if node.test_cases else 0,
             'has_documentation': bool(node.documentation),
             'tags': node.tags,
@@ -2384,31 +3190,209 @@ class EnterpriseSRPKGraph:
     
     def save_state(self, path: str, create_backup: bool = True):
         """Guarda el estado completo con backup opcional."""
+        # Archivo de destino según la compresión disponible
+        if self.config.get('cache.compression', True):
+            target = path + ('.zst' if ZSTD_AVAILABLE else '.gz')
+        else:
+            target = path
+        
+        # Embeddings en un .npy aparte: una sola matriz en lugar de listas de floats en el JSON
+        embeddings_path = path + '.embeddings.npy'
+        
         # Crear backup si existe archivo anterior
-        if create_backup and os.path.exists(path):
+        if create_backup and os.path.exists(target):
             backup_count = self.config.get('persistence.backup_count', 3)
-            self._create_backup(path, backup_count)
+            self._create_backup(target, backup_count)
+            if os.path.exists(embeddings_path):
+                self._create_backup(embeddings_path, backup_count)
+        
+        nodes, embeddings = self._split_node_embeddings()
+        if embeddings:
+            np.save(embeddings_path, np.stack(embeddings))
+        
+        state = self._state_payload(nodes)
+        state['embeddings_file'] = os.path.basename(embeddings_path) if embeddings else None
+        
+        data = self._serialize_state(state)
+        
+        # Usar compresión si está habilitada (zstd multihilo si está disponible)
+        if target.endswith('.zst'):
+            with open(target, 'wb') as f:
+                with zstd.ZstdCompressor(level=3, threads=-1).stream_writer(f) as writer:
+                    writer.write(data)
+        elif target.endswith('.gz'):
+            # ISA-L (gzip compatible) si está disponible; si no, el nivel configurado
+            # (6 por defecto) en lugar del 9 que usa gzip.open
+            if ISAL_AVAILABLE:
+                with igzip.open(target, 'wb') as f:
+                    f.write(data)
+            else:
+                level = self.config.get('cache.compression_level', 6)
+                with gzip.open(target, 'wb', compresslevel=level) as f:
+                    f.write(data)
+        else:
+            with open(target, 'wb') as f:
+                f.write(data)
+        self._compact_state_log(path)
+        logging.info(f"State saved to {target}")
+    
+    def save_state_binary(self, path: str):
+        """Guarda el estado en msgpack (.srpkbin) con los embeddings como un único bloque binario."""
+        if not MSGSPEC_AVAILABLE:
+            raise RuntimeError("msgspec is required to save binary state files")
+        
+        nodes, embeddings = self._split_node_embeddings()
+        state = self._state_payload(nodes)
+        if embeddings:
+            matrix = np.stack(embeddings)
+            state['embeddings'] = {
+                'dtype': matrix.dtype.str,
+                'shape': list(matrix.shape),
+                'data': matrix.tobytes()
+            }
         
-        state = {
+        with open(path, 'wb') as f:
+            f.write(_cache_encoder.encode(state))
+        self._compact_state_log(path)
+        logging.info(f"State saved to {path}")
+    
+    def append_state_changes(self, path: str) -> int:
+        """Añade al log de cambios del estado los nodos nuevos, modificados y eliminados.
+        
+        Cada registro es un msgpack precedido de su longitud ('<I'); load_state los reaplica
+        sobre el último snapshot y save_state/save_state_binary compactan el log.
+        Devuelve el número de nodos escritos o eliminados.
+        """
+        if not MSGSPEC_AVAILABLE:
+            raise RuntimeError("msgspec is required to append state changes")
+        
+        upserts = {
+            node_id: node.to_dict()
+            for node_id, node in self.nodes.items()
+            if self._persisted_versions.get(node_id) != (node.code_hash, node.update_timestamp)
+        }
+        removed = [node_id for node_id in self._persisted_versions if node_id not in self.nodes]
+        if not upserts and not removed:
+            return 0
+        
+        # Edges y registros van completos: el análisis de dependencias los recalcula enteros
+        # y son pequeños frente al código fuente de los nodos
+        record = {
+            'timestamp': time.time(),
+            'upserts': upserts,
+            'removed': removed,
+            'edges': {node_id: sorted(deps) for node_id, deps in self.edges.items()},
+            'file_registry': self.file_registry,
+            'stat_cache': self._stat_cache,
+            'metrics_history': list(self.metrics_history)
+        }
+        blob = _cache_encoder.encode(record)
+        with open(self._state_log_path(path), 'ab') as f:
+            f.write(struct.pack('<I', len(blob)) + blob)
+        
+        for node_id in removed:
+            del self._persisted_versions[node_id]
+        for node_id in upserts:
+            node = self.nodes[node_id]
+            self._persisted_versions[node_id] = (node.code_hash, node.update_timestamp)
+        
+        logging.info(f"State log updated for {path}: {len(upserts)} changed, {len(removed)} removed")
+        return len(upserts) + len(removed)
+    
+    @staticmethod
+    def _state_log_path(path: str) -> str:
+        """Ruta del log de cambios asociado a un archivo de estado (sin sufijo de compresión)."""
+        for suffix in ('.zst', '.gz'):
+            if path.endswith(suffix):
+                path = path[:-len(suffix)]
+        return path + '.log'
+    
+    def _compact_state_log(self, path: str):
+        """Tras escribir un snapshot completo, descarta el log de cambios que ya incluye."""
+        log_path = self._state_log_path(path)
+        if os.path.exists(log_path):
+            os.unlink(log_path)
+        self._persisted_versions = {
+            node_id: (node.code_hash, node.update_timestamp) for node_id, node in self.nodes.items()
+        }
+        self._snapshot_path = path
+    
+    def _replay_state_log(self, path: str) -> int:
+        """Reaplica sobre el estado cargado los registros del log de cambios; devuelve cuántos."""
+        log_path = self._state_log_path(path)
+        if not MSGSPEC_AVAILABLE or not os.path.exists(log_path) or os.path.getsize(log_path) == 0:
+            return 0
+        
+        replayed = 0
+        with open(log_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                offset = 0
+                while offset + 4 <= len(view):
+                    (length,) = struct.unpack_from('<I', view, offset)
+                    end = offset + 4 + length
+                    if end > len(view):
+                        # Registro truncado por una escritura interrumpida: se ignora
+                        logging.warning(f"Truncated record at offset {offset} in {log_path}")
+                        break
+                    record = msgspec.msgpack.decode(view[offset + 4:end])
+                    offset = end
+                    
+                    for node_id in record.get('removed', []):
+                        self.nodes.pop(node_id, None)
+                    for node_id, node_data in record.get('upserts', {}).items():
+                        try:
+                            self.nodes[node_id] = PersistentCodeNode.from_dict(node_data)
+                        except Exception as e:
+                            logging.error(f"Failed to restore node {node_id}: {e}")
+                    self.edges = defaultdict(set, {node_id: set(deps) for node_id, deps in record['edges'].items()})
+                    self.file_registry = record['file_registry']
+                    self._stat_cache = {k: tuple(v) for k, v in record['stat_cache'].items()}
+                    self.metrics_history = deque(record['metrics_history'], maxlen=self.METRICS_HISTORY_LIMIT)
+                    replayed += 1
+            finally:
+                view.release()
+        
+        return replayed
+    
+    def _state_payload(self, nodes: Dict[str, Dict]) -> Dict[str, Any]:
+        """Campos del estado comunes a todos los formatos de guardado."""
+        return {
             'version': '3.1',
             'timestamp': time.time(),
             'config': self.config.config,
-            'nodes': {k: v.to_dict() for k, v in self.nodes.items()},
-            'edges': dict(self.edges),
+            'nodes': nodes,
+            'edges': {node_id: sorted(deps) for node_id, deps in self.edges.items()},
             'file_registry': self.file_registry,
-            'metrics_history': self.metrics_history[-100:],  # Limitar historial
+            'stat_cache': self._stat_cache,
+            'metrics_history': list(self.metrics_history),
             'analyzer_errors': self.analyzer.get_error_summary()
         }
+    
+    def _split_node_embeddings(self) -> Tuple[Dict[str, Dict], List[np.ndarray]]:
+        """Serializa los nodos sin embeddings y devuelve estos aparte, referenciados por índice."""
+        nodes = {}
+        embeddings = []
+        shapes = {node.embedding.shape for node in self.nodes.values() if node.embedding is not None}
+        # Con dimensiones mezcladas no hay matriz posible: se mantienen en línea
+        stackable = len(shapes) == 1
         
-        # Usar compresión si está habilitada
-        if self.config.get('cache.compression', True):
-            with gzip.open(path + '.gz', 'wt', encoding='utf-8') as f:
-                json.dump(state, f, indent=2)
-            logging.info(f"State saved to {path}.gz")
-        else:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(state, f, indent=2)
-            logging.info(f"State saved to {path}")
+        for node_id, node in self.nodes.items():
+            node_data = node.to_dict(include_embedding=not stackable)
+            if stackable and node.embedding is not None:
+                node_data['embedding_ref'] = len(embeddings)
+                embeddings.append(node.embedding)
+            nodes[node_id] = node_data
+        
+        return nodes, embeddings
+    
+    @staticmethod
+    def _serialize_state(state: Dict) -> bytes:
+        """Serializa el estado a JSON compacto (orjson si está disponible)."""
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(state, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(state, separators=(',', ':')).encode('utf-8')
     
     def _create_backup(self, path: str, max_backups: int):
         """Crea backups rotatorios del archivo."""
@@ -2424,11 +3408,13 @@ class EnterpriseSRPKGraph:
             shutil.copy2(path, backup_path)
             logging.info(f"Backup created: {backup_path}")
             
-            # Limpiar backups antiguos
-            backups = sorted(backup_dir.glob(f"{Path(path).stem}_*"))
+            # Limpiar backups antiguos: un solo scandir; el timestamp del nombre ordena
+            prefix = f"{Path(path).stem}_"
+            with os.scandir(backup_dir) as entries:
+                backups = sorted(entry.path for entry in entries if entry.name.startswith(prefix))
             if len(backups) > max_backups:
                 for old_backup in backups[:-max_backups]:
-                    old_backup.unlink()
+                    os.unlink(old_backup)
                     logging.debug(f"Removed old backup: {old_backup}")
         
         except Exception as e:
@@ -2436,14 +3422,50 @@ class EnterpriseSRPKGraph:
     
     def load_state(self, path: str):
         """Carga el estado desde archivo con validación."""
-        # Detectar si está comprimido
-        if path.endswith('.gz') or os.path.exists(path + '.gz'):
-            actual_path = path if path.endswith('.gz') else path + '.gz'
-            with gzip.open(actual_path, 'rt', encoding='utf-8') as f:
-                state = json.load(f)
+        # Detectar si está comprimido; si hay varias variantes, la más reciente
+        if path.endswith(('.zst', '.gz', '.srpkbin')):
+            actual_path = path
         else:
-            with open(path, 'r', encoding='utf-8') as f:
-                state = json.load(f)
+            candidates = [p for p in (path + '.zst', path + '.gz', path) if os.path.exists(p)]
+            actual_path = max(candidates, key=os.path.getmtime) if candidates else path
+        
+        nodes = {}
+        embedding_refs = []
+        
+        def restore_node(node_id: str, node_data: Dict):
+            try:
+                node = PersistentCodeNode.from_dict(node_data)
+                ref = node_data.get('embedding_ref')
+                if ref is not None:
+                    embedding_refs.append((node, ref))
+                nodes[node_id] = node
+            except Exception as e:
+                logging.error(f"Failed to restore node {node_id}: {e}")
+        
+        if actual_path.endswith('.srpkbin'):
+            # msgpack decodificado directamente desde el archivo mapeado en memoria, sin read()
+            with open(actual_path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                state = msgspec.msgpack.decode(mapped)
+            for node_id, node_data in (state.pop('nodes', None) or {}).items():
+                restore_node(node_id, node_data)
+        else:
+            with open(actual_path, 'rb') as f:
+                if actual_path.endswith('.zst'):
+                    stream = zstd.ZstdDecompressor().stream_reader(f)
+                elif actual_path.endswith('.gz'):
+                    stream = (igzip if ISAL_AVAILABLE else gzip).GzipFile(fileobj=f)
+                else:
+                    stream = f
+                
+                if IJSON_AVAILABLE:
+                    # Streaming: cada diccionario de nodo se descarta al reconstruirlo
+                    state = _stream_state_json(stream, restore_node)
+                else:
+                    data = stream.read()
+                    state = orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+                    for node_id, node_data in (state.pop('nodes', None) or {}).items():
+                        restore_node(node_id, node_data)
         
         # Validar versión
         state_version = state.get('version', '0.0')
@@ -2454,36 +3476,102 @@ class EnterpriseSRPKGraph:
         if 'config' in state:
             self.config.config = state['config']
         
-        # Restaurar nodos
-        self.nodes = {}
-        for node_id, node_data in state.get('nodes', {}).items():
+        # Matriz de embeddings: bloque binario en .srpkbin, .npy aparte en JSON
+        if state.get('embeddings') and embedding_refs:
+            blob = state['embeddings']
+            embedding_matrix = np.frombuffer(blob['data'], dtype=blob['dtype']).reshape(blob['shape'])
+            for node, ref in embedding_refs:
+                node.embedding = embedding_matrix[ref]
+        elif state.get('embeddings_file') and embedding_refs:
+            embeddings_path = os.path.join(os.path.dirname(actual_path), state['embeddings_file'])
             try:
-                self.nodes[node_id] = PersistentCodeNode.from_dict(node_data)
+                embedding_matrix = np.load(embeddings_path)
+                for node, ref in embedding_refs:
+                    node.embedding = embedding_matrix[ref]
             except Exception as e:
-                logging.error(f"Failed to restore node {node_id}: {e}")
+                logging.error(f"Failed to load embeddings from {embeddings_path}: {e}")
+        
+        # Restaurar nodos
+        self.nodes = nodes
         
         # Restaurar edges
-        self.edges = defaultdict(list, state.get('edges', {}))
+        self.edges = defaultdict(set, {node_id: set(deps) for node_id, deps in state.get('edges', {}).items()})
         
         # Restaurar registros
         self.file_registry = state.get('file_registry', {})
-        self.metrics_history = state.get('metrics_history', [])
+        self._stat_cache = {k: tuple(v) for k, v in state.get('stat_cache', {}).items()}
+        self.metrics_history = deque(state.get('metrics_history', []), maxlen=self.METRICS_HISTORY_LIMIT)
+        
+        # Cambios posteriores al snapshot
+        replayed = self._replay_state_log(actual_path)
+        if replayed:
+            self._embedding_matrix_cache = None
+            logging.info(f"Replayed {replayed} state log records")
+        self._persisted_versions = {
+            node_id: (node.code_hash, node.update_timestamp) for node_id, node in self.nodes.items()
+        }
+        self._snapshot_path = self._state_log_path(actual_path)[:-len('.log')]
         
         logging.info(f"State loaded from {path}: {len(self.nodes)} nodes")
     
     def cleanup(self):
         """Limpia recursos y cierra conexiones."""
-        if hasattr(self, 'executor'):
+        if getattr(self, 'executor', None) is not None:
             self.executor.shutdown(wait=True)
         
         if self.auto_save_enabled:
             state_file = self.config.get('persistence.state_file', 'srpk_state.json')
-            self.save_state(state_file)
+            # Con un snapshot ya escrito basta con añadir los cambios al log
+            if MSGSPEC_AVAILABLE and self._snapshot_path == state_file:
+                self.append_state_changes(state_file)
+            else:
+                self.save_state(state_file)
 
 # =====================================================================
 # INTERFAZ DE LÍNEA DE COMANDOS PRINCIPAL
 # =====================================================================
 
+# Grafo de cada proceso worker de EnterpriseSRPKGraph.analyze_project
+_GRAPH_WORKER: Optional[EnterpriseSRPKGraph] = None
+
+def _init_graph_worker(config_data: dict):
+    """Crea el grafo del worker a partir de la configuración del proceso principal."""
+    global _GRAPH_WORKER
+    config = ConfigurationManager()
+    config.config = config_data
+    _GRAPH_WORKER = EnterpriseSRPKGraph(config, worker=True)
+
+def _analyze_file_in_worker(file_path: Path,
+                            stat_entry: Optional[Tuple[int, int, str]] = None) -> Optional[Dict]:
+    """Analiza un archivo en un worker y devuelve sus nodos serializados."""
+    graph = _GRAPH_WORKER
+    if stat_entry:
+        graph._stat_cache[str(file_path)] = stat_entry
+    try:
+        file_results = graph._analyze_file_wrapper(file_path)
+        if not file_results:
+            return None
+        file_results['nodes'] = [node.to_dict() for node in graph.nodes.values()]
+        file_results['node_ids'] = graph.file_registry.get(str(file_path), [])
+        file_results['stat'] = graph._stat_cache.get(str(file_path))
+        return file_results
+    finally:
+        # El worker no acumula nodos entre archivos; el grafo completo vive en el proceso principal
+        graph.nodes = {}
+        graph.file_registry = {}
+        graph._stat_cache = {}
+
+def _analyze_file_batch_in_worker(batch: List[Tuple[Path, Optional[Tuple[int, int, str]]]]
+                                  ) -> List[Tuple[Optional[Dict], Optional[str]]]:
+    """Analiza un lote de archivos en un worker; devuelve (resultado, error) por archivo."""
+    results = []
+    for file_path, stat_entry in batch:
+        try:
+            results.append((_analyze_file_in_worker(file_path, stat_entry), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
 def main():
     """Punto de entrada principal del sistema."""
     import sys
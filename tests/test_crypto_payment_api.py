@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+crypto = pytest.importorskip("crypto_payment_api")
+
+
+def test_inflight_key_matches_identical_requests_only():
+    """Solo las peticiones idénticas comparten verificación en curso"""
+    key = crypto.inflight_verify_key
+    base = key('0xABC', 'a@example.com', 'starter', 'BNB')
+    assert base == key('0xabc', 'a@example.com', 'starter', 'BNB')
+    assert base != key('0xabc', 'b@example.com', 'starter', 'BNB')
+    assert base != key('0xabc', 'a@example.com', 'professional', 'BNB')
+    assert base != key('0xabc', 'a@example.com', 'starter', 'USDT')
+
+
+def test_concurrent_verify_for_other_buyer_is_not_shared(monkeypatch):
+    """Una verificación concurrente de otro comprador no recibe la licencia del primero"""
+    started = []
+    release = threading.Event()
+
+    def fake_verify(tx_hash, product_type, email, name, token, cache_key):
+        started.append(email)
+        release.wait(5)
+        return {'success': True, 'license_key': f"key-{email}"}, 200
+
+    monkeypatch.setattr(crypto, '_verify_transaction', fake_verify)
+    monkeypatch.setattr(crypto, 'get_cached_verification', lambda tx_hash, email: None)
+    monkeypatch.setattr(crypto, 'cache_verification', lambda tx_hash, email, response: None)
+    monkeypatch.setattr(crypto.redis_client, 'exists', lambda key: 0)
+
+    client = crypto.app.test_client()
+    responses = {}
+
+    def post(email):
+        response = client.post('/api/crypto/verify-payment', json={
+            'txHash': '0xabc', 'productType': 'starter', 'email': email,
+            'name': 'Buyer', 'token': 'BNB'
+        })
+        responses[email] = response.get_json()
+
+    threads = [threading.Thread(target=post, args=(email,))
+               for email in ('a@example.com', 'b@example.com')]
+    threads[0].start()
+    while not started:
+        time.sleep(0.01)
+    threads[1].start()
+
+    deadline = time.monotonic() + 2
+    while len(started) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(started) == ['a@example.com', 'b@example.com']
+    assert responses['a@example.com']['license_key'] == 'key-a@example.com'
+    assert responses['b@example.com']['license_key'] == 'key-b@example.com'
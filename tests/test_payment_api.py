@@ -0,0 +1,169 @@
+from types import SimpleNamespace
+
+import pytest
+
+payment = pytest.importorskip("payment_api")
+
+
+class FakeCursor:
+    def __init__(self, table, executed):
+        self.table = table
+        self.executed = executed
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.executed.append(sql.split()[0])
+        if sql.startswith("SELECT"):
+            matches = [cid for cid, email in self.table.items() if email == params[0]]
+            self.row = (matches[0],) if matches else None
+        elif sql.startswith("DELETE"):
+            self.table.pop(params[0], None)
+        else:
+            self.table[params[0]] = params[1]
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConnection:
+    def __init__(self, table, executed):
+        self.table = table
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.table, self.executed)
+
+    def close(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, **kwargs):
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def customers(monkeypatch):
+    table = {}
+    executed = []
+    monkeypatch.setattr(payment, 'get_db_connection', lambda: FakeConnection(table, executed))
+    monkeypatch.setattr(payment, 'redis_client', FakeRedis())
+    payment.customer_id_cache.clear()
+    return table
+
+
+def test_customer_index_follows_stripe_events(customers):
+    """El índice local de clientes se actualiza con los eventos de Stripe"""
+    customer = {'id': 'cus_1', 'email': 'Buyer@Example.com', 'name': 'Buyer'}
+    payment.handle_customer_created(customer)
+    assert customers == {'cus_1': 'buyer@example.com'}
+    assert payment.lookup_indexed_customer('buyer@example.com') == 'cus_1'
+
+    payment.handle_customer_deleted(customer)
+    assert customers == {}
+    assert payment.lookup_indexed_customer('buyer@example.com') is None
+    assert payment.get_cached_customer_id('buyer@example.com') is None
+
+
+def _fake_stripe(monkeypatch, created):
+    """Stripe mínimo: registra los argumentos de Subscription.create"""
+    def create_subscription(**kwargs):
+        created.update(kwargs)
+        return SimpleNamespace(id='sub_1')
+
+    class StripeError(Exception):
+        pass
+
+    class CardError(StripeError):
+        pass
+
+    stripe = SimpleNamespace(
+        Subscription=SimpleNamespace(create=create_subscription),
+        error=SimpleNamespace(StripeError=StripeError, CardError=CardError)
+    )
+    monkeypatch.setattr(payment, 'get_stripe', lambda: stripe)
+    monkeypatch.setattr(payment, 'resolve_stripe_customer', lambda stripe, data, price_info: 'cus_1')
+
+
+def test_batch_checkout_sends_string_metadata(monkeypatch):
+    """La compra por asientos crea una suscripción con cantidad y metadata en texto"""
+    created = {}
+    _fake_stripe(monkeypatch, created)
+    monkeypatch.setattr(payment.send_license_batch_email, 'delay', lambda *args: None)
+
+    response = payment.app.test_client().post('/api/process-payment-batch', json={
+        'token': 'tok_visa', 'priceId': 'price_starter', 'email': 'buyer@example.com',
+        'name': 'Buyer', 'seats': 3
+    })
+
+    assert response.status_code == 200
+    assert len(response.get_json()['seats']) == 3
+    assert created['items'] == [{'price': 'price_starter', 'quantity': 3}]
+    assert all(isinstance(value, str) for value in created['metadata'].values())
+    assert created['metadata']['seats'] == '3'
+
+
+def test_webhook_enqueue_failure_releases_claims(monkeypatch):
+    """Si el evento no se puede encolar, el reintento de Stripe se procesa en lugar de tratarse como duplicado"""
+    monkeypatch.setattr(payment, 'verify_stripe_signature', lambda payload, sig_header: True)
+    monkeypatch.setattr(payment, 'redis_client', FakeRedis())
+    payment.seen_stripe_events.clear()
+    queued = []
+
+    def apply_async(args, queue):
+        if not queued:
+            queued.append(None)
+            raise ConnectionError("broker down")
+        queued.append(args)
+
+    monkeypatch.setattr(payment.process_stripe_event, 'apply_async', apply_async)
+    client = payment.app.test_client()
+    event = {'id': 'evt_1', 'type': 'customer.deleted'}
+
+    assert client.post('/api/webhook', json=event).status_code == 500
+    response = client.post('/api/webhook', json=event)
+    assert response.status_code == 200
+    assert 'duplicate' not in response.get_json()
+    assert queued == [None, ['evt_1']]
+
+
+def test_checkout_email_enqueue_failure_still_returns_license(monkeypatch):
+    """Con el broker caído, el cliente ya cobrado recibe igualmente su licencia"""
+    _fake_stripe(monkeypatch, {})
+
+    def delay(*args):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(payment.send_license_email, 'delay', delay)
+
+    response = payment.app.test_client().post('/api/process-payment', json={
+        'token': 'tok_visa', 'priceId': 'price_starter', 'email': 'buyer@example.com', 'name': 'Buyer'
+    })
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is True
+    assert body['subscription_id'] == 'sub_1'
+    assert payment.verify_license_token(body['license_token'])['lk'] == body['license_key']
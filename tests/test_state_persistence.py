@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+srpk = pytest.importorskip("srpk_v3_1")
+
+SOURCE = '''def add(a, b):
+    """Suma dos números."""
+    return a + b
+
+
+class Counter:
+    def increment(self):
+        return add(1, 2)
+'''
+
+
+def _make_graph(tmp_path):
+    config = srpk.ConfigurationManager()
+    config.set('cache.directory', str(tmp_path / 'cache'))
+    config.set('persistence.auto_save', False)
+    return srpk.EnterpriseSRPKGraph(config)
+
+
+@pytest.fixture
+def graph(tmp_path):
+    graph = _make_graph(tmp_path)
+    source = tmp_path / 'sample.py'
+    source.write_text(SOURCE)
+    graph._analyze_file(source)
+    graph._analyze_dependencies()
+    yield graph
+    graph.cleanup()
+
+
+def _load(tmp_path, path):
+    loaded = _make_graph(tmp_path)
+    loaded.load_state(path)
+    loaded.cleanup()
+    return loaded
+
+
+def test_save_append_load_round_trip(graph, tmp_path):
+    """save_state + append_state_changes + load_state reproduce el grafo en memoria"""
+    if not srpk.MSGSPEC_AVAILABLE:
+        pytest.skip("msgspec is required for the state log")
+    state_path = str(tmp_path / 'state.json')
+    graph.save_state(state_path, create_backup=False)
+    assert graph.append_state_changes(state_path) == 0
+
+    removed_id, changed_id = sorted(node_id for node_id in graph.nodes if not node_id.startswith('file:'))[:2]
+    del graph.nodes[removed_id]
+    changed = graph.nodes[changed_id]
+    changed.code_hash = 'changed'
+    changed.update_timestamp = time.time() + 1
+    assert graph.append_state_changes(state_path) == 2
+
+    loaded = _load(tmp_path, state_path)
+    assert sorted(loaded.nodes) == sorted(graph.nodes)
+    assert loaded.nodes[changed_id].code_hash == 'changed'
+    assert {k: v for k, v in loaded.edges.items() if v} == {k: v for k, v in graph.edges.items() if v}
+
+    # Un snapshot completo compacta el log
+    graph.save_state(state_path, create_backup=False)
+    assert not (tmp_path / 'state.json.log').exists()
+    assert sorted(_load(tmp_path, state_path).nodes) == sorted(graph.nodes)
+
+
+def test_binary_state_round_trip(graph, tmp_path):
+    """save_state_binary conserva nodos, edges y embeddings"""
+    if not srpk.MSGSPEC_AVAILABLE:
+        pytest.skip("msgspec is required for binary state files")
+    state_path = str(tmp_path / 'state.srpkbin')
+    graph.save_state_binary(state_path)
+
+    loaded = _load(tmp_path, state_path)
+    assert sorted(loaded.nodes) == sorted(graph.nodes)
+    for node_id, node in graph.nodes.items():
+        restored = loaded.nodes[node_id]
+        assert restored.code_segment == node.code_segment
+        assert (restored.embedding == node.embedding).all()
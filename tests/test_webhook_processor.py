@@ -0,0 +1,20 @@
+import pytest
+
+webhooks = pytest.importorskip("webhook_processor")
+eth_abi = pytest.importorskip("eth_abi")
+
+
+def test_decode_payment_received():
+    """Un PaymentReceived se decodifica campo a campo según EVENT_DATA_LAYOUTS"""
+    buyer = '0x680c48f49187a2121a25e3f834585a8b82dfdc16'
+    types, _ = webhooks.EVENT_DATA_LAYOUTS[0]
+    data = eth_abi.encode(list(types), [buyer, 'professional', 299 * 10 ** 18, 'USDT', 1700000000])
+
+    processor = webhooks.WebhookProcessor.__new__(webhooks.WebhookProcessor)
+    assert processor.decode_event_data(0, data) == {
+        'buyer': buyer,
+        'product_type': 'professional',
+        'amount': str(299 * 10 ** 18),
+        'token': 'USDT',
+        'timestamp': 1700000000
+    }
@@ -5,16 +5,22 @@ Monitors blockchain events and sends webhook notifications
 import os
 import json
 import time
+import hmac
+import hashlib
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import threading
+import signal
+from functools import lru_cache
 from datetime import datetime
-from queue import Queue
+from queue import Queue, Empty
 from web3 import Web3
+from eth_utils import keccak
 from dotenv import load_dotenv
 import redis
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +32,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Keep-alive pool for webhook deliveries; retries are handled by the sender
+http_session = requests.Session()
+http_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+http_session.mount('https://', http_adapter)
+http_session.mount('http://', http_adapter)
+
+# Concurrent senders draining the webhook queue over the shared session
+WEBHOOK_SENDER_THREADS = int(os.getenv('WEBHOOK_SENDER_THREADS', 8))
+
+# Most delivery log rows written per INSERT
+DELIVERY_LOG_BATCH_SIZE = 500
+
+# Keyed HMAC state built once; each signature starts from a copy of it
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', 'default-secret')
+webhook_hmac_template = hmac.new(WEBHOOK_SECRET.encode(), None, hashlib.sha256)
+
 # Web3 Configuration
 BSC_RPC_URL = os.getenv('BSC_RPC_URL', 'https://bsc-dataseed.binance.org/')
 w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL))
@@ -46,12 +68,53 @@ DATABASE_URL = os.getenv('DATABASE_URL', '')
 
 # Event signatures
 EVENT_SIGNATURES = {
-    'PaymentReceived': w3.keccak(text='PaymentReceived(address,string,uint256,string)').hex(),
-    'LicensePurchased': w3.keccak(text='LicensePurchased(address,string,string,string,uint256,string,uint256)').hex(),
-    'LicenseRevoked': w3.keccak(text='LicenseRevoked(string,address)').hex(),
-    'WebhookTriggered': w3.keccak(text='WebhookTriggered(bytes32,uint8,bytes)').hex()
+    name: '0x' + keccak(text=signature).hex()
+    for name, signature in {
+        'PaymentReceived': 'PaymentReceived(address,string,uint256,string)',
+        'LicensePurchased': 'LicensePurchased(address,string,string,string,uint256,string,uint256)',
+        'LicenseRevoked': 'LicenseRevoked(string,address)',
+        'WebhookTriggered': 'WebhookTriggered(bytes32,uint8,bytes)'
+    }.items()
 }
 
+# Minimal ABI to decode WebhookTriggered logs returned by eth_getLogs
+WEBHOOK_TRIGGERED_ABI = [{
+    'anonymous': False,
+    'name': 'WebhookTriggered',
+    'type': 'event',
+    'inputs': [
+        {'indexed': True, 'name': 'webhookId', 'type': 'bytes32'},
+        {'indexed': True, 'name': 'eventType', 'type': 'uint8'},
+        {'indexed': False, 'name': 'data', 'type': 'bytes'}
+    ]
+}]
+webhook_triggered_event = w3.eth.contract(abi=WEBHOOK_TRIGGERED_ABI).events.WebhookTriggered()
+
+# ABI layout of each event type's data payload: (types, field names), built once
+EVENT_DATA_LAYOUTS = {
+    0: (  # PaymentReceived
+        ('address', 'string', 'uint256', 'string', 'uint256'),
+        ('buyer', 'product_type', 'amount', 'token', 'timestamp')
+    ),
+    1: (  # LicenseCreated
+        ('address', 'string', 'string', 'string', 'uint256', 'string'),
+        ('buyer', 'email', 'product_type', 'payment_token', 'amount', 'license_key')
+    ),
+    3: (  # LicenseRevoked
+        ('string', 'address'),
+        ('license_key', 'buyer')
+    )
+}
+# uint256 amounts are sent as strings to keep full precision in JSON
+STRINGIFIED_EVENT_FIELDS = frozenset({'amount'})
+
+# Blocks fetched per eth_getLogs call; larger ranges while catching up on a backlog
+LOG_RANGE_BLOCKS = 100
+BACKLOG_RANGE_BLOCKS = 1000
+# While draining a backlog, persist the processed block every N ranges or T seconds instead of every range
+BLOCK_SAVE_EVERY_RANGES = 10
+BLOCK_SAVE_INTERVAL_SECONDS = 30
+
 # Event type mapping
 EVENT_TYPES = {
     0: 'payment.received',
@@ -61,11 +124,20 @@ EVENT_TYPES = {
     4: 'price.updated'
 }
 
+@lru_cache(maxsize=4096)
+def webhook_header_template(webhook_id):
+    """Static delivery headers per webhook; only the signature varies per call"""
+    return (('Content-Type', 'application/json'), ('X-SRPK-Webhook-ID', webhook_id))
+
 class WebhookProcessor:
     def __init__(self):
         self.webhook_queue = Queue()
+        self.delivery_log_queue = Queue()
+        self.delivery_log_conn = None
         self.processing = False
         self.last_block = self.get_last_processed_block()
+        self.unsaved_block_ranges = 0
+        self.last_block_save = time.monotonic()
         
     def get_db_connection(self):
         """Get PostgreSQL database connection"""
@@ -88,6 +160,8 @@ class WebhookProcessor:
     def save_last_processed_block(self, block_number):
         """Save the last processed block"""
         redis_client.set('last_processed_block', str(block_number))
+        self.unsaved_block_ranges = 0
+        self.last_block_save = time.monotonic()
     
     def process_webhook_event(self, event):
         """Process a webhook event from the blockchain"""
@@ -127,44 +201,17 @@ class WebhookProcessor:
     
     def decode_event_data(self, event_type, data):
         """Decode event data based on event type"""
+        layout = EVENT_DATA_LAYOUTS.get(event_type)
+        if layout is None:
+            return {'raw_data': data.hex()}
+        
+        types, fields = layout
         try:
-            if event_type == 0:  # PaymentReceived
-                decoded = w3.codec.decode_abi(
-                    ['address', 'string', 'uint256', 'string', 'uint256'],
-                    data
-                )
-                return {
-                    'buyer': decoded[0],
-                    'product_type': decoded[1],
-                    'amount': str(decoded[2]),
-                    'token': decoded[3],
-                    'timestamp': decoded[4]
-                }
-            
-            elif event_type == 1:  # LicenseCreated
-                decoded = w3.codec.decode_abi(
-                    ['address', 'string', 'string', 'string', 'uint256', 'string'],
-                    data
-                )
-                return {
-                    'buyer': decoded[0],
-                    'email': decoded[1],
-                    'product_type': decoded[2],
-                    'payment_token': decoded[3],
-                    'amount': str(decoded[4]),
-                    'license_key': decoded[5]
-                }
-            
-            elif event_type == 3:  # LicenseRevoked
-                decoded = w3.codec.decode_abi(['string', 'address'], data)
-                return {
-                    'license_key': decoded[0],
-                    'buyer': decoded[1]
-                }
-            
-            else:
-                return {'raw_data': data.hex()}
-                
+            decoded = w3.codec.decode(types, data)
+            return {
+                name: str(value) if name in STRINGIFIED_EVENT_FIELDS else value
+                for name, value in zip(fields, decoded)
+            }
         except Exception as e:
             logger.error(f"Error decoding event data: {str(e)}")
             return {'raw_data': data.hex()}
@@ -180,18 +227,16 @@ class WebhookProcessor:
         retry_count = webhook_data['retry_count']
         
         try:
-            # Add signature for security
-            signature = self.generate_webhook_signature(payload)
+            # Add signature for security; the signed bytes are sent as the body
+            payload_bytes = json.dumps(payload, sort_keys=True).encode()
+            signature = self.sign_payload_bytes(payload_bytes)
             
-            headers = {
-                'Content-Type': 'application/json',
-                'X-SRPK-Signature': signature,
-                'X-SRPK-Webhook-ID': webhook_id
-            }
+            headers = dict(webhook_header_template(webhook_id))
+            headers['X-SRPK-Signature'] = signature
             
-            response = requests.post(
+            response = http_session.post(
                 url,
-                json=payload,
+                data=payload_bytes,
                 headers=headers,
                 timeout=10
             )
@@ -208,53 +253,69 @@ class WebhookProcessor:
             # Retry logic
             if retry_count < max_retries:
                 webhook_data['retry_count'] += 1
-                time.sleep(retry_delay * (retry_count + 1))
-                self.webhook_queue.put(webhook_data)
+                # Requeue after the backoff without blocking this sender thread
+                retry_timer = threading.Timer(
+                    retry_delay * (retry_count + 1),
+                    self.webhook_queue.put,
+                    args=(webhook_data,)
+                )
+                retry_timer.daemon = True
+                retry_timer.start()
             else:
                 self.log_webhook_delivery(webhook_id, False, str(e))
     
     def generate_webhook_signature(self, payload):
         """Generate HMAC signature for webhook payload"""
-        import hmac
-        import hashlib
-        
-        secret = os.getenv('WEBHOOK_SECRET', 'default-secret')
-        payload_str = json.dumps(payload, sort_keys=True)
-        
-        signature = hmac.new(
-            secret.encode(),
-            payload_str.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        return signature
+        return self.sign_payload_bytes(json.dumps(payload, sort_keys=True).encode())
+    
+    def sign_payload_bytes(self, payload_bytes):
+        """Generate HMAC signature for an already serialized payload"""
+        mac = webhook_hmac_template.copy()
+        mac.update(payload_bytes)
+        return mac.hexdigest()
     
     def log_webhook_delivery(self, webhook_id, success, details):
-        """Log webhook delivery attempt"""
-        try:
-            conn = self.get_db_connection()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT INTO webhook_logs 
-                    (webhook_id, success, details, created_at)
-                    VALUES (%s, %s, %s, %s)
-                """, (webhook_id, success, str(details), datetime.utcnow()))
-                conn.commit()
-                cur.close()
-                conn.close()
-        except Exception as e:
-            logger.error(f"Error logging webhook delivery: {str(e)}")
+        """Queue a webhook delivery attempt for the batched log writer"""
+        self.delivery_log_queue.put((webhook_id, success, str(details), datetime.utcnow()))
+    
+    def delivery_log_loop(self):
+        """Drain queued delivery logs, writing each burst with one INSERT on a kept connection"""
+        while True:
+            batch = [self.delivery_log_queue.get()]
+            while len(batch) < DELIVERY_LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.delivery_log_queue.get_nowait())
+                except Empty:
+                    break
+            
+            try:
+                if self.delivery_log_conn is None or self.delivery_log_conn.closed:
+                    self.delivery_log_conn = self.get_db_connection()
+                conn = self.delivery_log_conn
+                if conn:
+                    with conn.cursor() as cur:
+                        execute_values(cur, """
+                            INSERT INTO webhook_logs 
+                            (webhook_id, success, details, created_at)
+                            VALUES %s
+                        """, batch)
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"Error logging {len(batch)} webhook deliveries: {str(e)}")
+                if self.delivery_log_conn is not None:
+                    self.delivery_log_conn.close()
+                    self.delivery_log_conn = None
     
     def process_webhook_queue(self):
         """Process webhooks from the queue"""
         while self.processing:
             try:
-                if not self.webhook_queue.empty():
-                    webhook_data = self.webhook_queue.get(timeout=1)
-                    self.send_webhook(webhook_data)
-                else:
-                    time.sleep(1)
+                # Block on the queue so new webhooks are sent immediately
+                webhook_data = self.webhook_queue.get(timeout=1)
+            except Empty:
+                continue
+            try:
+                self.send_webhook(webhook_data)
             except Exception as e:
                 logger.error(f"Error processing webhook queue: {str(e)}")
     
@@ -268,24 +329,34 @@ class WebhookProcessor:
                 
                 if current_block > self.last_block:
                     # Process blocks in batches
-                    to_block = min(self.last_block + 100, current_block)
+                    backlog = current_block - self.last_block
+                    block_range = BACKLOG_RANGE_BLOCKS if backlog > BACKLOG_RANGE_BLOCKS else LOG_RANGE_BLOCKS
+                    to_block = min(self.last_block + block_range, current_block)
                     
-                    # Get webhook events
+                    # Get webhook events with one stateless eth_getLogs call
                     if WEBHOOK_CONTRACT_ADDRESS:
-                        webhook_filter = w3.eth.filter({
+                        logs = w3.eth.get_logs({
                             'fromBlock': self.last_block + 1,
                             'toBlock': to_block,
                             'address': WEBHOOK_CONTRACT_ADDRESS,
                             'topics': [EVENT_SIGNATURES['WebhookTriggered']]
                         })
                         
-                        events = webhook_filter.get_all_entries()
-                        for event in events:
-                            self.process_webhook_event(event)
+                        for log in logs:
+                            self.process_webhook_event(webhook_triggered_event.process_log(log))
                     
-                    # Update last processed block
+                    # Update last processed block; Redis is written once caught up, or
+                    # every few ranges or seconds while draining a backlog
                     self.last_block = to_block
-                    self.save_last_processed_block(to_block)
+                    self.unsaved_block_ranges += 1
+                    if (to_block >= current_block
+                            or self.unsaved_block_ranges >= BLOCK_SAVE_EVERY_RANGES
+                            or time.monotonic() - self.last_block_save >= BLOCK_SAVE_INTERVAL_SECONDS):
+                        self.save_last_processed_block(to_block)
+                    
+                    # Keep draining without waiting while behind
+                    if to_block < current_block:
+                        continue
                 
                 # Wait before next check
                 time.sleep(5)
@@ -298,10 +369,19 @@ class WebhookProcessor:
         """Start the webhook processor"""
         self.processing = True
         
-        # Start webhook queue processor
-        queue_thread = threading.Thread(target=self.process_webhook_queue)
-        queue_thread.daemon = True
-        queue_thread.start()
+        # Container stops send SIGTERM; stop cleanly so unsaved progress is flushed
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        
+        # Start webhook queue processors
+        for _ in range(WEBHOOK_SENDER_THREADS):
+            queue_thread = threading.Thread(target=self.process_webhook_queue)
+            queue_thread.daemon = True
+            queue_thread.start()
+        
+        # Start batched delivery log writer
+        log_thread = threading.Thread(target=self.delivery_log_loop, name='webhook-delivery-log')
+        log_thread.daemon = True
+        log_thread.start()
         
         # Start blockchain monitor
         monitor_thread = threading.Thread(target=self.monitor_events)
@@ -321,6 +401,8 @@ class WebhookProcessor:
         """Stop the webhook processor"""
         logger.info("Stopping webhook processor...")
         self.processing = False
+        if self.unsaved_block_ranges:
+            self.save_last_processed_block(self.last_block)
 
 def main():
     """Main entry point"""